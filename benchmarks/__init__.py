@@ -0,0 +1 @@
+# 性能基准测试（不属于Web应用，单独运行）
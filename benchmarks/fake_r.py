@@ -0,0 +1,80 @@
+"""
+模拟R可执行文件 - 没有安装R的机器上运行评分基准测试用
+
+支持评分系统调用R的三种方式:
+  R --version                                  输出版本号
+  R --vanilla --slave -f grader_worker.R ...   常驻工作进程协议(逐行读取任务目录)
+  R --vanilla -f <任务目录>/test_script.R       单次评分
+
+学生代码中包含 "# correct" 时得满分，否则得0分。
+环境变量 FAKE_R_DELAY / FAKE_R_STARTUP 分别模拟每次评分和R启动的耗时(秒)。
+"""
+import os
+import sys
+import json
+import time
+
+DELAY = float(os.environ.get('FAKE_R_DELAY', 0.05))
+STARTUP = float(os.environ.get('FAKE_R_STARTUP', 0.2))
+
+
+def grade_job(job_dir):
+    """评分一个任务目录，写入result.json和test_output.txt"""
+    started = time.perf_counter()
+    with open(os.path.join(job_dir, 'student_code.R'), encoding='utf-8') as f:
+        student_code = f.read()
+    time.sleep(DELAY)
+
+    correct = '# correct' in student_code
+    result = {
+        'status': 'success',
+        'score': 100 if correct else 0,
+        'max_score': 100,
+        'message': '测试通过' if correct else '结果不正确'
+    }
+    with open(os.path.join(job_dir, 'result.json'), 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False)
+    with open(os.path.join(job_dir, 'test_output.txt'), 'w', encoding='utf-8') as f:
+        f.write('====== 测试开始 ======\n====== 测试结束 ======\n')
+
+    sys.stderr.write(f'[PHASE] test_code {time.perf_counter() - started:.4f}\n')
+    sys.stderr.flush()
+
+
+def run_worker():
+    """常驻工作进程: 每行一个"任务目录\t令牌"，空行退出"""
+    time.sleep(STARTUP)
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            break
+        job_dir, _, token = line.partition('\t')
+        try:
+            grade_job(job_dir)
+        except Exception as e:
+            print(f'任务执行失败: {e}')
+        print(f'JOB_DONE {token} 40.0 ok', flush=True)
+
+
+def main(argv):
+    if '--version' in argv:
+        print('R version 4.3.0 (fake R for benchmarks)')
+        return 0
+
+    script = argv[argv.index('-f') + 1] if '-f' in argv else None
+    if script is None:
+        sys.stderr.write('fake R: 缺少 -f 参数\n')
+        return 2
+
+    if os.path.basename(script) == 'grader_worker.R':
+        run_worker()
+        return 0
+
+    sys.stderr.write(f'[PHASE] startup {STARTUP:.4f}\n')
+    time.sleep(STARTUP)
+    grade_job(os.path.dirname(os.path.abspath(script)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,421 @@
+"""
+评分基准测试
+
+在临时SQLite数据库中生成模拟考试（选择题/填空题/编程题比例可配置）和N名学生的答卷，
+端到端运行 AutoGrader.grade_all、FillBlankGrader(逐个和按题目整列) 和 ProgrammingGrader，
+报告吞吐量(答案数/秒)、p50/p95/p99延迟和内存占用。
+没有安装R时自动使用 benchmarks/fake_r.py 模拟R。
+
+用法(在项目根目录):
+    python -m benchmarks.grading_benchmark --students 100 --choice 20 --fill-blank 10 --programming 3
+    python -m benchmarks.grading_benchmark --json results.json   # 保存结果，用于跨版本对比
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import platform
+import tracemalloc
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+
+# 允许直接以脚本方式运行
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from flask import Flask
+from models.db import db
+
+logger = logging.getLogger('grading_benchmark')
+
+PROGRAMMING_TEST_CODE = """
+test_result <- list(status = "success", score = 100, max_score = 100, message = "测试通过")
+"""
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='评分基准测试')
+    parser.add_argument('--students', type=int, default=50, help='学生人数')
+    parser.add_argument('--choice', type=int, default=10, help='选择题数量')
+    parser.add_argument('--fill-blank', type=int, default=5, help='填空题数量')
+    parser.add_argument('--programming', type=int, default=2, help='编程题数量')
+    parser.add_argument('--correct-rate', type=float, default=0.7, help='学生答对的概率')
+    parser.add_argument('--code-variants', type=int, default=0,
+                        help='编程题答案的不同写法数量，0表示每个学生都不同（不命中评分缓存）')
+    parser.add_argument('--workers', type=int, default=4, help='编程题并发评分线程数，1为串行')
+    parser.add_argument('--fake-r', choices=['auto', 'always', 'never'], default='auto',
+                        help='是否使用模拟R，auto为没有安装R时使用')
+    parser.add_argument('--fake-r-delay', type=float, default=0.05, help='模拟R每次评分的耗时(秒)')
+    parser.add_argument('--fake-r-startup', type=float, default=0.2, help='模拟R启动的耗时(秒)')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--json', help='将结果保存为JSON文件')
+    parser.add_argument('--verbose', action='store_true', help='输出评分日志')
+    return parser.parse_args(argv)
+
+
+def percentile(sorted_values, pct):
+    """最近秩法计算百分位数：第 ceil(pct/100 * n) 个值（从1开始）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def max_rss_mb():
+    """本进程和已结束子进程的峰值常驻内存(MB)"""
+    if platform.system() == 'Windows':
+        return None, None
+    import resource
+    # Linux上单位为KB，macOS上为字节
+    scale = 1024 * 1024 if platform.system() == 'Darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(own, 1), round(children, 1)
+
+
+class Benchmark:
+    """记录一项基准测试中每个单元(答卷或答案)的耗时"""
+
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.latencies = []
+        self.answers = 0
+        self.seconds = 0.0
+        self.python_peak_mb = 0.0
+
+    def __enter__(self):
+        tracemalloc.start()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._started
+        self.python_peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+        return False
+
+    def measure(self, func, *args, answers=1):
+        """执行一次并记录耗时"""
+        started = time.perf_counter()
+        result = func(*args)
+        self.latencies.append(time.perf_counter() - started)
+        self.answers += answers
+        return result
+
+    def report(self):
+        values = sorted(self.latencies)
+        return {
+            'name': self.name,
+            'unit': self.unit,
+            'units': len(values),
+            'answers': self.answers,
+            'seconds': round(self.seconds, 3),
+            'answers_per_second': round(self.answers / self.seconds, 1) if self.seconds else None,
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p95_ms': round(percentile(values, 95) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+            'python_peak_mb': round(self.python_peak_mb, 2),
+        }
+
+
+def create_benchmark_app(db_path, workers):
+    """创建只包含数据库的最小Flask应用（不启动后台评分线程，不重建正式数据库）"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['GRADING_CONCURRENT'] = workers > 1
+    app.config['GRADING_MAX_WORKERS'] = max(1, workers)
+    db.init_app(app)
+
+    with app.app_context():
+        import models  # noqa: F401  注册全部模型
+        import models.code_template  # noqa: F401  Question.template引用的模型
+        db.create_all()
+    return app
+
+
+def insert_users(prefix, count, role):
+    """
+    批量插入测试用户（直接写入密码散列占位值，跳过User构造函数中耗时的密码散列）
+
+    Returns:
+        list: 用户ID，按插入顺序
+    """
+    from models.user import User
+    usernames = [f'{prefix}_{i}' for i in range(count)]
+    db.session.execute(User.__table__.insert(), [
+        {'username': username, 'email': f'{username}@bench.local', 'password_hash': 'x',
+         'role': role, 'created_at': datetime.utcnow()}
+        for username in usernames
+    ])
+    ids = dict(db.session.query(User.username, User.id).filter(User.username.in_(usernames)).all())
+    return [ids[username] for username in usernames]
+
+
+def generate_exam(args, rng):
+    """
+    生成模拟考试和学生答卷
+
+    Returns:
+        tuple: (考试ID, 得分记录ID列表)
+    """
+    from models.question import Question
+    from models.question_option import QuestionOption
+    from models.exam import Exam
+    from models.exam_question import ExamQuestion
+    from models.score import Score
+    from models.student_answer import StudentAnswer
+
+    teacher_id = insert_users('bench_teacher', 1, 'teacher')[0]
+
+    now = datetime.utcnow()
+    exam = Exam(title='基准测试考试', start_time=now - timedelta(hours=2), end_time=now - timedelta(hours=1),
+                is_published=True, is_draft=False, creator_id=teacher_id)
+    db.session.add(exam)
+    db.session.flush()
+
+    # 题目: 记录答对/答错时的答案
+    question_specs = []
+    order = 0
+    for i in range(args.choice):
+        question = Question(title=f'选择题{i + 1}', content='选择正确答案', question_type='choice',
+                            creator_id=teacher_id)
+        db.session.add(question)
+        db.session.flush()
+        options = [QuestionOption(question_id=question.id, content=f'选项{k}', is_correct=(k == 0), order=k)
+                   for k in range(4)]
+        db.session.add_all(options)
+        db.session.flush()
+        question_specs.append((question, str(options[0].id), str(options[rng.randint(1, 3)].id)))
+
+    for i in range(args.fill_blank):
+        answer = f'answer{i}'
+        question = Question(title=f'填空题{i + 1}', content='填写答案', question_type='fill_blank',
+                            standard_answer=f'{answer};{answer.upper()}', creator_id=teacher_id)
+        db.session.add(question)
+        db.session.flush()
+        question_specs.append((question, answer, f'wrong{i}'))
+
+    for i in range(args.programming):
+        question = Question(title=f'编程题{i + 1}', content='编写函数', question_type='programming',
+                            test_code=PROGRAMMING_TEST_CODE, creator_id=teacher_id)
+        db.session.add(question)
+        db.session.flush()
+        question_specs.append((question, None, None))
+
+    for question, _, _ in question_specs:
+        order += 1
+        db.session.add(ExamQuestion(exam_id=exam.id, question_id=question.id, order=order, score=10))
+
+    # 学生和答卷
+    score_ids = []
+    student_ids = insert_users('bench_student', args.students, 'student')
+    for s, student_id in enumerate(student_ids):
+        score = Score(student_id=student_id, exam_id=exam.id, is_final_submit=True, submit_time=now)
+        db.session.add(score)
+        db.session.flush()
+        score_ids.append(score.id)
+
+        answers = []
+        for question, correct, wrong in question_specs:
+            is_correct = rng.random() < args.correct_rate
+            if question.question_type == 'programming':
+                variant = rng.randrange(args.code_variants) if args.code_variants else s
+                content = f"f <- function(x) sum(x)  # 学生写法 {variant}\n"
+                if is_correct:
+                    content += "# correct\n"
+            else:
+                content = correct if is_correct else wrong
+            answers.append(StudentAnswer(score_id=score.id, question_id=question.id, answer_content=content))
+        db.session.add_all(answers)
+
+    db.session.commit()
+    return exam.id, score_ids
+
+
+def bench_auto_grader(score_ids):
+    """AutoGrader.grade_all端到端：逐份答卷评分并提交"""
+    from grading.auto_grader import AutoGrader
+    from models.student_answer import StudentAnswer
+
+    def grade(score_id):
+        grader = AutoGrader(score_id)
+        results = grader.grade_all()
+        db.session.commit()
+        return results
+
+    with Benchmark('auto_grader.grade_all', 'score') as bench:
+        for score_id in score_ids:
+            answers = StudentAnswer.query.filter_by(score_id=score_id).count()
+            bench.measure(grade, score_id, answers=answers)
+    return bench
+
+
+def bench_fill_blank(exam_id):
+    """FillBlankGrader：逐个填空题答案评分（不访问数据库）"""
+    from grading.fill_blank_grader import FillBlankGrader
+    answers = _load_answers(exam_id, 'fill_blank')
+    grader = FillBlankGrader()
+
+    with Benchmark('fill_blank_grader.grade', 'answer') as bench:
+        for answer, question in answers:
+            bench.measure(grader.grade, answer, question, 10)
+    return bench
+
+
+def bench_fill_blank_batch(exam_id):
+    """FillBlankGrader.grade_batch：按题目整列评分填空题答案（不访问数据库）"""
+    from grading.fill_blank_grader import FillBlankGrader
+    by_question = {}
+    for answer, question in _load_answers(exam_id, 'fill_blank'):
+        by_question.setdefault(question.id, (question, []))[1].append(answer)
+    grader = FillBlankGrader()
+
+    with Benchmark('fill_blank_grader.grade_batch', 'answer') as bench:
+        for question, answers in by_question.values():
+            bench.measure(grader.grade_batch, answers, question, 10, answers=len(answers))
+    return bench
+
+
+def bench_programming(exam_id):
+    """ProgrammingGrader：逐个编程题答案运行R评分"""
+    from grading.programming_grader import ProgrammingGrader
+    answers = _load_answers(exam_id, 'programming')
+    grader = ProgrammingGrader()
+
+    with Benchmark('programming_grader.evaluate', 'answer') as bench:
+        for answer, question in answers:
+            bench.measure(grader.evaluate, answer.answer_content, question.test_code, 10, question.id,
+                          question.updated_at)
+    return bench
+
+
+def _load_answers(exam_id, question_type):
+    """加载某题型的全部答案，转为与ORM无关的对象"""
+    from models.question import Question
+    from models.score import Score
+    from models.student_answer import StudentAnswer
+
+    rows = db.session.query(StudentAnswer, Question).join(
+        Question, StudentAnswer.question_id == Question.id
+    ).join(Score, StudentAnswer.score_id == Score.id).filter(
+        Score.exam_id == exam_id, Question.question_type == question_type
+    ).all()
+    return [
+        (SimpleNamespace(id=answer.id, answer_content=answer.answer_content, points_earned=0, feedback=None),
+         SimpleNamespace(id=question.id, standard_answer=question.standard_answer, test_code=question.test_code,
+                         updated_at=question.updated_at))
+        for answer, question in rows
+    ]
+
+
+def setup_r(args, work_dir):
+    """按参数决定是否使用模拟R，返回使用的R可执行文件"""
+    real_r = shutil.which('R')
+    use_fake = args.fake_r == 'always' or (args.fake_r == 'auto' and real_r is None)
+    if not use_fake:
+        if real_r is None:
+            raise SystemExit('未找到R，请安装R或使用 --fake-r auto')
+        return real_r, False
+
+    if platform.system() == 'Windows':
+        raise SystemExit('模拟R目前只支持Linux/macOS')
+
+    # 用shell包装脚本把模拟R变成可执行文件
+    fake_r = os.path.join(work_dir, 'R')
+    with open(fake_r, 'w') as f:
+        f.write('#!/bin/sh\n')
+        f.write(f'exec "{sys.executable}" "{os.path.join(PROJECT_DIR, "benchmarks", "fake_r.py")}" "$@"\n')
+    os.chmod(fake_r, 0o755)
+    os.environ['FAKE_R_DELAY'] = str(args.fake_r_delay)
+    os.environ['FAKE_R_STARTUP'] = str(args.fake_r_startup)
+    return fake_r, True
+
+
+def print_report(report):
+    print()
+    print(f"学生 {report['config']['students']} 人, 题目: 选择 {report['config']['choice']} / "
+          f"填空 {report['config']['fill_blank']} / 编程 {report['config']['programming']}, "
+          f"R: {'模拟' if report['fake_r'] else report['r_executable']}")
+    header = f"{'基准':<30}{'单位数':>8}{'答案数':>8}{'耗时(s)':>10}{'答案/秒':>10}" \
+             f"{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'Py峰值MB':>10}"
+    print(header)
+    print('-' * len(header))
+    for item in report['benchmarks']:
+        print(f"{item['name']:<30}{item['units']:>8}{item['answers']:>8}{item['seconds']:>10}"
+              f"{item['answers_per_second'] or '-':>10}{item['p50_ms']:>10}{item['p95_ms']:>10}"
+              f"{item['p99_ms']:>10}{item['python_peak_mb']:>10}")
+    print(f"峰值常驻内存: 本进程 {report['max_rss_mb']} MB, R子进程 {report['children_max_rss_mb']} MB")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if not args.verbose:
+        # 评分模块的日志量很大，会显著影响计时
+        logging.disable(logging.INFO)
+
+    work_dir = tempfile.mkdtemp(prefix='grading_bench_')
+    try:
+        r_executable, fake = setup_r(args, work_dir)
+        os.environ['R_EXECUTABLE'] = r_executable
+
+        app = create_benchmark_app(os.path.join(work_dir, 'bench.db'), args.workers)
+        rng = random.Random(args.seed)
+
+        with app.app_context():
+            exam_id, score_ids = generate_exam(args, rng)
+
+            # 每项编程题相关的基准之前清空评分缓存，避免互相影响
+            from grading.result_cache import get_result_cache
+            benchmarks = []
+            get_result_cache().clear()
+            benchmarks.append(bench_auto_grader(score_ids))
+            benchmarks.append(bench_fill_blank(exam_id))
+            benchmarks.append(bench_fill_blank_batch(exam_id))
+            get_result_cache().clear()
+            benchmarks.append(bench_programming(exam_id))
+
+        own_rss, children_rss = max_rss_mb()
+        report = {
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'config': {
+                'students': args.students,
+                'choice': args.choice,
+                'fill_blank': args.fill_blank,
+                'programming': args.programming,
+                'workers': args.workers,
+                'code_variants': args.code_variants,
+                'seed': args.seed,
+            },
+            'fake_r': fake,
+            'r_executable': r_executable,
+            'benchmarks': [bench.report() for bench in benchmarks],
+            'max_rss_mb': own_rss,
+            'children_max_rss_mb': children_rss,
+        }
+        print_report(report)
+
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"结果已保存到 {args.json}")
+        return report
+    finally:
+        from grading.r_worker_pool import _pool
+        if _pool is not None:
+            _pool.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+常用查询的索引检查（基于SQLite的 EXPLAIN QUERY PLAN）
+
+对答案保存、考试题目、学生成绩、学生考试列表、题库筛选和题目列表翻页这几个常用查询执行 EXPLAIN QUERY PLAN，
+检查每个查询都通过索引查找(SEARCH ... USING INDEX)而不是全表扫描(SCAN)，按顺序取数据的查询不需要临时排序。
+默认在临时数据库中按模型建表后检查；指定 --database 时检查已有数据库（用于确认迁移已创建索引）。
+有查询未使用预期的索引时以退出码1结束。同样的检查由 tests/test_index_check.py 在测试中对迁移后的数据库执行。
+
+用法(在项目根目录):
+    python -m benchmarks.index_check
+    python -m benchmarks.index_check --database sqlite:///instance/exam_system.db
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+from datetime import datetime
+
+# 允许直接以脚本方式运行
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from flask import Flask
+from sqlalchemy import and_, or_
+from models.db import db, init_db
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='常用查询的索引检查')
+    parser.add_argument('--database', help='要检查的SQLite数据库URL，默认使用临时数据库')
+    return parser.parse_args(argv)
+
+
+def hot_queries():
+    """
+    常用查询列表
+
+    Returns:
+        list: (名称, 查询语句, 表名, 预期使用的索引名(为None时任意索引均可), 是否不允许临时排序)
+    """
+    from models.student_answer import StudentAnswer
+    from models.exam_question import ExamQuestion
+    from models.score import Score
+    from models.exam import Exam
+    from models.question import Question
+
+    now_local = datetime.utcnow()
+    return [
+        ('保存答案', StudentAnswer.query.filter_by(score_id=1, question_id=1).statement,
+         'student_answer', 'uq_student_answer_score_question', False),
+        ('考试题目', ExamQuestion.query.filter_by(exam_id=1).order_by(ExamQuestion.order).statement,
+         'exam_question', 'ix_exam_question_exam_order', True),
+        # 与student_exams中的查询相同，只读exam_id
+        ('已提交的考试', db.session.query(Score.exam_id).filter(
+            Score.student_id == 1, or_(Score.is_final_submit == True, Score.is_graded == True)).statement,
+         'score', 'ix_score_student_status_exam', False),
+        ('可参加的考试', Exam.query.filter(
+            Exam.is_published == True, Exam.start_time <= now_local, Exam.end_time >= now_local
+        ).order_by(Exam.start_time).statement,
+         'exam', 'ix_exam_published_time', True),
+        ('题库筛选', Question.query.filter_by(question_type='choice', difficulty=3, category_id=1).statement,
+         'question', 'ix_question_type_difficulty_category', False),
+        # 与utils.pagination.keyset_paginate生成的翻页条件相同
+        ('题目列表翻页', Question.query.filter(and_(
+            Question.created_at <= now_local,
+            or_(Question.created_at < now_local, and_(Question.created_at == now_local, Question.id < 100))
+        )).order_by(Question.created_at.desc(), Question.id.desc()).limit(20).statement,
+         'question', 'ix_question_created_id', True),
+    ]
+
+
+def explain(statement):
+    """返回查询计划的每一行说明"""
+    compiled = statement.compile(dialect=db.engine.dialect)
+    # 查询计划与参数的值无关，全部绑定为NULL
+    params = (None,) * len(compiled.positiontup or ())
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def check_plan(plan, table, index_name, forbid_temp_sort):
+    """
+    检查查询计划
+
+    Returns:
+        list: 发现的问题，为空表示通过
+    """
+    problems = []
+    searches = [line for line in plan if line.startswith((f'SEARCH {table} ', f'SEARCH TABLE {table} '))]
+    if any(line.startswith((f'SCAN {table}', f'SCAN TABLE {table}')) for line in plan):
+        problems.append(f'{table} 全表扫描')
+    if not any('INDEX' in line for line in searches):
+        problems.append(f'{table} 未使用索引')
+    elif index_name and not any(index_name in line for line in searches):
+        problems.append(f'{table} 未使用索引 {index_name}')
+    if forbid_temp_sort and any('USE TEMP B-TREE' in line for line in plan):
+        problems.append('需要临时排序')
+    return problems
+
+
+def check_hot_queries():
+    """
+    在当前应用上下文的数据库上检查全部常用查询
+
+    Returns:
+        list: (名称, 查询计划, 发现的问题)
+    """
+    results = []
+    for name, statement, table, index_name, forbid_temp_sort in hot_queries():
+        plan = explain(statement)
+        results.append((name, plan, check_plan(plan, table, index_name, forbid_temp_sort)))
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_dir = None
+    uri = args.database
+    if not uri:
+        work_dir = tempfile.mkdtemp(prefix='index_check_')
+        uri = 'sqlite:///' + os.path.join(work_dir, 'index_check.db')
+
+    try:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = uri
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        init_db(app)
+
+        failed = 0
+        with app.app_context():
+            if db.engine.dialect.name != 'sqlite':
+                raise SystemExit('索引检查只支持SQLite数据库')
+            import models  # noqa: F401  注册全部模型
+            import models.code_template  # noqa: F401  Question.template引用的模型
+            if work_dir:
+                db.create_all()
+
+            for name, plan, problems in check_hot_queries():
+                print(f"[{'失败' if problems else '通过'}] {name}")
+                for line in plan:
+                    print(f"    {line}")
+                for problem in problems:
+                    print(f"    !! {problem}")
+                failed += bool(problems)
+            db.engine.dispose()
+
+        print()
+        print('全部查询均使用索引' if not failed else f'{failed}个查询未使用预期的索引')
+        return failed
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
@@ -0,0 +1,121 @@
+"""
+启动时间基准测试
+
+在全新的Python子进程中多次导入app并调用create_app，分别记录导入耗时、create_app耗时和第一个请求的耗时，
+并检查启动过程中是否加载了rpy2（Web进程不应加载R）。
+第一次运行使用空数据库（执行全部迁移），之后的运行复用同一数据库（数据库已是最新）。
+
+用法(在项目根目录):
+    python -m benchmarks.startup_benchmark --runs 10
+    python -m benchmarks.startup_benchmark --json startup.json   # 保存结果，用于跨版本对比
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import platform
+import subprocess
+from datetime import datetime
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from benchmarks.grading_benchmark import percentile
+
+# 在子进程中执行，输出一行JSON
+CHILD_SCRIPT = r"""
+import sys, time, json
+started = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+application = app_module.create_app()
+created = time.perf_counter()
+with application.test_client() as client:
+    status = client.get('/auth/login').status_code
+requested = time.perf_counter()
+print('STARTUP_RESULT ' + json.dumps({
+    'import_seconds': imported - started,
+    'create_app_seconds': created - imported,
+    'first_request_seconds': requested - created,
+    'total_seconds': requested - started,
+    'first_request_status': status,
+    'rpy2_loaded': 'rpy2' in sys.modules,
+}))
+"""
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='启动时间基准测试')
+    parser.add_argument('--runs', type=int, default=5, help='启动次数（第一次为空数据库）')
+    parser.add_argument('--json', help='将结果保存为JSON文件')
+    return parser.parse_args(argv)
+
+
+def run_once(env):
+    """启动一个子进程并返回其计时结果"""
+    process = subprocess.run([sys.executable, '-c', CHILD_SCRIPT], cwd=PROJECT_DIR, env=env,
+                             capture_output=True, text=True, encoding='utf-8', errors='replace', timeout=300)
+    for line in process.stdout.splitlines():
+        if line.startswith('STARTUP_RESULT '):
+            return json.loads(line[len('STARTUP_RESULT '):])
+    raise RuntimeError(f"启动失败(退出码{process.returncode}):\n{process.stderr[-2000:]}")
+
+
+def summarize(runs, key):
+    values = sorted(run[key] for run in runs)
+    return {
+        'p50_ms': round(percentile(values, 50) * 1000, 1),
+        'p95_ms': round(percentile(values, 95) * 1000, 1),
+        'max_ms': round(values[-1] * 1000, 1) if values else 0.0,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_dir = tempfile.mkdtemp(prefix='startup_bench_')
+    try:
+        env = dict(os.environ)
+        env.update({
+            'DATABASE_URL': 'sqlite:///' + os.path.join(work_dir, 'startup.db'),
+            # 只测Web进程：不在进程内启动评分线程
+            'GRADING_WORKER_INLINE': '0',
+            'AUTO_BOOTSTRAP': '1',
+        })
+
+        runs = [run_once(env) for _ in range(max(1, args.runs))]
+        cold, warm = runs[0], runs[1:]
+
+        keys = ('import_seconds', 'create_app_seconds', 'first_request_seconds', 'total_seconds')
+        report = {
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'runs': len(runs),
+            'cold': {key: round(cold[key] * 1000, 1) for key in keys},
+            'warm': {key: summarize(warm, key) for key in keys} if warm else None,
+            'rpy2_loaded': any(run['rpy2_loaded'] for run in runs),
+            'first_request_status': cold['first_request_status'],
+        }
+
+        print()
+        print(f"启动 {len(runs)} 次（第一次为空数据库）")
+        print(f"{'阶段':<24}{'首次(ms)':>12}{'p50(ms)':>12}{'p95(ms)':>12}{'最大(ms)':>12}")
+        for key in keys:
+            warm_stats = report['warm'][key] if warm else {'p50_ms': '-', 'p95_ms': '-', 'max_ms': '-'}
+            print(f"{key:<24}{report['cold'][key]:>12}{warm_stats['p50_ms']:>12}"
+                  f"{warm_stats['p95_ms']:>12}{warm_stats['max_ms']:>12}")
+        print(f"启动过程中加载rpy2: {'是' if report['rpy2_loaded'] else '否'}")
+
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"结果已保存到 {args.json}")
+        return report
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
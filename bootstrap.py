@@ -0,0 +1,218 @@
+# bootstrap.py - 数据库初始化与迁移
+# 每个迁移只执行一次，执行记录保存在schema_migration表中；重复调用是安全的，
+# 数据库已是最新时只需一次查询。多个进程同时启动时用文件锁保证只有一个进程执行迁移。
+import os
+import logging
+import tempfile
+from contextlib import contextmanager
+from sqlalchemy import func, inspect, text
+from sqlalchemy.exc import IntegrityError
+from models.db import db
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 配置日志记录
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('bootstrap')
+
+
+def _add_column_if_missing(table, column, ddl_type):
+    """表中缺少该列时添加（用于升级旧数据库）"""
+    columns = {c['name'] for c in inspect(db.engine).get_columns(table)}
+    if column not in columns:
+        db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl_type}'))
+        logger.info(f"已添加列: {table}.{column}")
+
+
+def _create_tables(app):
+    """初始表结构：创建所有缺少的表，已存在的表和数据不受影响"""
+    import models  # noqa: F401  注册全部模型
+    import models.code_template  # noqa: F401
+    db.create_all()
+
+
+def _add_student_answer_client_version(app):
+    """student_answer增加client_version列"""
+    _add_column_if_missing('student_answer', 'client_version', 'INTEGER')
+
+
+def _seed_defaults(app):
+    """默认分类和代码模板"""
+    from models.category import Category
+    from models.code_template import CodeTemplate
+
+    if Category.query.count() == 0:
+        db.session.add(Category(name="未分类"))
+        db.session.commit()
+
+    if CodeTemplate.query.count() == 0:
+        from init_templates import init_templates_function
+        init_templates_function(app)
+        logger.info("代码模板已初始化")
+
+
+def _create_missing_indexes(*models):
+    """创建模型中声明但数据库中还没有的索引"""
+    for model in models:
+        for index in model.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+
+
+def _dedupe_student_answers():
+    """删除重复的答案记录，每份答卷的每道题只保留最早的一条（与结果页显示的一致）"""
+    from models.student_answer import StudentAnswer
+
+    duplicates = db.session.query(
+        StudentAnswer.score_id, StudentAnswer.question_id, func.min(StudentAnswer.id)
+    ).group_by(StudentAnswer.score_id, StudentAnswer.question_id).having(func.count(StudentAnswer.id) > 1).all()
+    removed = 0
+    for score_id, question_id, keep_id in duplicates:
+        removed += StudentAnswer.query.filter(
+            StudentAnswer.score_id == score_id,
+            StudentAnswer.question_id == question_id,
+            StudentAnswer.id != keep_id
+        ).delete(synchronize_session=False)
+    db.session.commit()
+    if removed:
+        logger.info(f"已删除{removed}条重复的答案记录")
+
+
+def _add_hot_query_indexes(app):
+    """常用查询的复合索引，以及student_answer(score_id, question_id)唯一索引"""
+    from models.student_answer import StudentAnswer
+    from models.exam_question import ExamQuestion
+    from models.score import Score
+    from models.exam import Exam
+    from models.question import Question
+
+    # 已有重复答案时无法创建唯一索引
+    _dedupe_student_answers()
+    _create_missing_indexes(StudentAnswer, ExamQuestion, Score, Exam, Question)
+
+
+def _create_question_search_index(app):
+    """题库全文索引(SQLite FTS5)，SQLite不支持FTS5时跳过，搜索使用LIKE"""
+    from questions.search_index import rebuild_search_index
+    rebuild_search_index()
+
+
+def _add_listing_indexes(app):
+    """题目和考试列表键集分页的(created_at, id)索引"""
+    from models.exam import Exam
+    from models.question import Question
+    _create_missing_indexes(Exam, Question)
+
+
+def _add_exam_variant_columns(app):
+    """个性化试卷：考试的打乱设置和种子、考试题目的题组、答卷的试卷内容"""
+    _add_column_if_missing('exam', 'shuffle_questions', 'BOOLEAN DEFAULT FALSE')
+    _add_column_if_missing('exam', 'shuffle_options', 'BOOLEAN DEFAULT FALSE')
+    _add_column_if_missing('exam', 'variant_seed', 'INTEGER')
+    _add_column_if_missing('exam_question', 'pool', 'VARCHAR(50)')
+    _add_column_if_missing('score', 'variant', 'TEXT')
+
+
+def _add_grading_job_lease(app):
+    """评分任务租约：工作进程执行任务时定期续期，租约过期的任务重新放回队列"""
+    _add_column_if_missing('grading_job', 'lease_expires_at', 'DATETIME')
+
+
+def _replace_score_status_index(app):
+    """score的状态索引加上exam_id成为覆盖索引：旧的ix_score_student_status从未被查询使用"""
+    from models.score import Score
+    if 'ix_score_student_status' in {index['name'] for index in inspect(db.engine).get_indexes('score')}:
+        db.session.execute(text('DROP INDEX ix_score_student_status'))
+        db.session.commit()
+    _create_missing_indexes(Score)
+
+
+# 迁移列表：(版本, 说明, 函数)。已发布的迁移不能修改，新的迁移只能追加在末尾
+MIGRATIONS = [
+    (1, '初始表结构', _create_tables),
+    (2, 'student_answer.client_version', _add_student_answer_client_version),
+    (3, '默认分类和代码模板', _seed_defaults),
+    (4, '常用查询索引', _add_hot_query_indexes),
+    (5, '题库全文索引', _create_question_search_index),
+    (6, '列表分页索引', _add_listing_indexes),
+    (7, '个性化试卷', _add_exam_variant_columns),
+    (8, '评分任务租约', _add_grading_job_lease),
+    (9, '已提交考试覆盖索引', _replace_score_status_index),
+]
+
+
+def get_applied_versions():
+    """已执行的迁移版本集合，数据库尚未初始化时返回空集合"""
+    from models.schema_migration import SchemaMigration
+    if not inspect(db.engine).has_table(SchemaMigration.__tablename__):
+        return set()
+    return {row.version for row in db.session.query(SchemaMigration.version).all()}
+
+
+def get_pending_migrations():
+    """尚未执行的迁移，按版本排序"""
+    applied = get_applied_versions()
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+@contextmanager
+def _bootstrap_lock(lock_path):
+    """进程间互斥的文件锁，不支持fcntl的系统上不加锁"""
+    if fcntl is None or not lock_path:
+        yield
+        return
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def bootstrap_database(app):
+    """
+    执行所有尚未执行的迁移
+
+    Args:
+        app: Flask应用实例
+
+    Returns:
+        list: 本次执行的迁移版本
+    """
+    from models.schema_migration import SchemaMigration
+
+    with app.app_context():
+        # 快速路径：数据库已是最新时不加锁
+        if not get_pending_migrations():
+            db.session.remove()
+            return []
+
+        lock_path = app.config.get('BOOTSTRAP_LOCK_FILE') or os.path.join(
+            tempfile.gettempdir(), 'r_exam_bootstrap.lock')
+        applied = []
+        with _bootstrap_lock(lock_path):
+            # 获得锁之后重新检查，其它进程可能已经执行过
+            SchemaMigration.__table__.create(db.engine, checkfirst=True)
+            for version, name, migrate in get_pending_migrations():
+                logger.info(f"执行数据库迁移 {version}: {name}")
+                try:
+                    migrate(app)
+                    db.session.add(SchemaMigration(version=version, name=name))
+                    db.session.commit()
+                    applied.append(version)
+                except IntegrityError:
+                    # 不加锁的系统上其它进程同时执行了该迁移
+                    db.session.rollback()
+                    logger.info(f"迁移 {version} 已由其它进程执行")
+                except Exception:
+                    db.session.rollback()
+                    logger.exception(f"数据库迁移 {version} 失败")
+                    raise
+        db.session.remove()
+
+    if applied:
+        logger.info(f"数据库迁移完成: {applied}")
+    return applied
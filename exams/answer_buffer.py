@@ -0,0 +1,377 @@
+# answer_buffer.py - 学生答案的写后缓冲：在内存中合并自动保存，定时批量写入数据库
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import and_, func, or_
+from models.db import db
+from models.score import Score
+from models.student_answer import StudentAnswer
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('answer_buffer')
+
+# 持久化模式：buffered 先写内存再定时批量写库；write_through 每次保存立即提交
+MODE_BUFFERED = 'buffered'
+MODE_WRITE_THROUGH = 'write_through'
+
+# 默认批量写入间隔(秒)，即进程崩溃时最多丢失的自动保存时长
+DEFAULT_FLUSH_INTERVAL = 2.0
+# 缓冲的答案数达到该值时由保存请求同步写入
+DEFAULT_MAX_PENDING = 5000
+
+
+def _is_older(entry, current):
+    """entry的客户端版本号是否小于current（任一方没有版本号时不比较）"""
+    return (current is not None and entry.client_version is not None
+            and current.client_version is not None and entry.client_version < current.client_version)
+
+
+def _upsert_statement(dialect_name):
+    """
+    生成按(score_id, question_id)插入或更新答案的语句，只用较新的内容覆盖已有答案
+
+    Args:
+        dialect_name: 数据库方言名称
+
+    Returns:
+        Insert: 支持ON CONFLICT的数据库(SQLite/PostgreSQL)返回语句，其它数据库返回None
+    """
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+
+    table = StudentAnswer.__table__
+    stmt = insert(table)
+    excluded = stmt.excluded
+    # 与_is_older和submitted_at的比较规则一致
+    newer = and_(
+        or_(table.c.submitted_at.is_(None), table.c.submitted_at <= excluded.submitted_at),
+        or_(excluded.client_version.is_(None), table.c.client_version.is_(None),
+            excluded.client_version >= table.c.client_version)
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=['score_id', 'question_id'],
+        set_={
+            'answer_content': excluded.answer_content,
+            'submitted_at': excluded.submitted_at,
+            'client_version': func.coalesce(excluded.client_version, table.c.client_version),
+        },
+        where=newer
+    )
+
+
+def upsert_answers(rows):
+    """
+    用一条INSERT ... ON CONFLICT语句插入或更新答案（不提交），只用较新的内容覆盖已有答案
+
+    并发的写入由数据库按唯一索引合并，不会因为两个请求同时插入同一道题而违反唯一约束。
+
+    Args:
+        rows: 答案字典列表，包含score_id、question_id、answer_content、submitted_at和client_version
+
+    Returns:
+        set: 实际写入的(score_id, question_id)，被较新答案拦下的不在其中；
+            数据库不支持ON CONFLICT时返回None，由调用方使用ORM写入
+    """
+    stmt = _upsert_statement(db.engine.dialect.name)
+    if stmt is None:
+        return None
+
+    table = StudentAnswer.__table__
+    rows = [dict(row, points_earned=0) for row in rows]  # 初始分数为0
+    if getattr(db.engine.dialect, 'insert_returning', False):
+        # 冲突时被WHERE条件拦下的行不会出现在RETURNING结果中
+        result = db.session.execute(stmt.values(rows).returning(table.c.score_id, table.c.question_id))
+        return {(row.score_id, row.question_id) for row in result}
+
+    # 不支持RETURNING的旧版SQLite：写入后读回，内容和保存时间都是本次的值才算写入
+    db.session.execute(stmt, rows)
+    expected = {(row['score_id'], row['question_id']): (row['answer_content'], row['submitted_at']) for row in rows}
+    stored = db.session.query(
+        StudentAnswer.score_id, StudentAnswer.question_id, StudentAnswer.answer_content, StudentAnswer.submitted_at
+    ).filter(
+        StudentAnswer.score_id.in_({key[0] for key in expected}),
+        StudentAnswer.question_id.in_({key[1] for key in expected})
+    ).all()
+    return {(row.score_id, row.question_id) for row in stored
+            if expected.get((row.score_id, row.question_id)) == (row.answer_content, row.submitted_at)}
+
+
+class PendingAnswer:
+    """缓冲中的一份答案（同一得分记录、同一题目只保留最新一次）"""
+
+    __slots__ = ('score_id', 'question_id', 'answer_content', 'submitted_at', 'exam_end_time', 'client_version')
+
+    def __init__(self, score_id, question_id, answer_content, submitted_at, exam_end_time, client_version=None):
+        self.score_id = score_id
+        self.question_id = question_id
+        self.answer_content = answer_content
+        self.submitted_at = submitted_at
+        self.exam_end_time = exam_end_time
+        self.client_version = client_version
+
+
+class AnswerBuffer:
+    """
+    按(score_id, question_id)合并学生答案的写后缓冲
+
+    后台线程每隔flush_interval秒把缓冲的答案在一个事务中批量写入；
+    考试结束时立即写入该考试的答案；交卷、查看结果和评分前调用flush(score_id)强制写入；
+    进程正常退出时(atexit)写入全部答案。已交卷(is_final_submit)的答卷不再写入缓冲的答案。
+
+    缓冲只存在于当前进程的内存中，flush(score_id)只能写入本进程缓冲的答案，
+    所以buffered模式只适用于单个Web进程；多个Web进程(如gunicorn -w N)时，
+    其它进程缓冲的答案在交卷和评分时还没有写入，必须使用write_through模式
+    （create_app在WEB_CONCURRENCY大于1时默认使用write_through）。
+    """
+
+    def __init__(self, mode=MODE_BUFFERED, flush_interval=DEFAULT_FLUSH_INTERVAL, max_pending=DEFAULT_MAX_PENDING):
+        """
+        Args:
+            mode: 持久化模式，buffered或write_through
+            flush_interval: 批量写入间隔(秒)
+            max_pending: 缓冲答案数上限，超过时同步写入
+        """
+        self.mode = mode
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._pending = {}  # (score_id, question_id) -> PendingAnswer
+        self._lock = threading.Lock()
+        # 串行化数据库写入，保证同一答案的多次写入按时间顺序落库
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._app = None
+
+    @property
+    def buffered(self):
+        return self.mode == MODE_BUFFERED
+
+    def start(self, app):
+        """启动后台批量写入线程，并注册进程退出时的写入"""
+        self._app = app
+        if not self.buffered or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='answer-buffer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        logger.info(f"答案写后缓冲已启动: 间隔{self.flush_interval}秒, 上限{self.max_pending}条")
+
+    def stop(self):
+        """停止后台线程并写入所有缓冲的答案"""
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self._flush_in_app()
+
+    def put(self, score_id, question_id, answer_content, exam_end_time=None, client_version=None):
+        """
+        保存一份答案，write_through模式下立即提交
+
+        Args:
+            score_id: 得分记录ID
+            question_id: 题目ID
+            answer_content: 答案内容
+            exam_end_time: 考试结束时间(北京时间)，到时立即写入
+            client_version: 客户端答案版本号，小于已保存版本的答案不会覆盖
+
+        Returns:
+            bool: 答案是否已写入数据库
+        """
+        entry = PendingAnswer(score_id, question_id, answer_content, datetime.utcnow(), exam_end_time, client_version)
+        if not self.buffered:
+            self._write([entry])
+            return True
+
+        with self._lock:
+            previous = self._pending.get((score_id, question_id))
+            if not _is_older(entry, previous):
+                self._pending[(score_id, question_id)] = entry
+            pending_count = len(self._pending)
+
+        if pending_count >= self.max_pending:
+            logger.warning(f"缓冲答案数达到上限({pending_count})，同步写入")
+            self.flush()
+            return True
+
+        if exam_end_time is not None:
+            # 让后台线程重新计算最近的考试结束时间
+            self._wakeup.set()
+        return False
+
+    def get(self, score_id, question_id):
+        """返回缓冲中尚未写入的答案内容，没有时返回None"""
+        with self._lock:
+            entry = self._pending.get((score_id, question_id))
+        return entry.answer_content if entry else None
+
+    def pending_question_ids(self, score_id):
+        """返回一份答卷在缓冲中尚未写入的题目ID集合"""
+        with self._lock:
+            return {question_id for (sid, question_id) in self._pending if sid == score_id}
+
+    def flush(self, score_id=None):
+        """
+        把缓冲的答案在一个事务中写入数据库
+
+        Args:
+            score_id: 只写入该得分记录的答案，为空时写入全部
+
+        Returns:
+            int: 写入的答案数
+        """
+        with self._lock:
+            if score_id is None:
+                entries = list(self._pending.values())
+                self._pending.clear()
+            else:
+                keys = [key for key in self._pending if key[0] == score_id]
+                entries = [self._pending.pop(key) for key in keys]
+
+        if not entries:
+            return 0
+
+        try:
+            self._write(entries)
+        except Exception:
+            # 放回缓冲等待下次写入，期间又保存过的答案以新的为准
+            with self._lock:
+                for entry in entries:
+                    self._pending.setdefault((entry.score_id, entry.question_id), entry)
+            raise
+        return len(entries)
+
+    def _drop_submitted(self, entries):
+        """去掉已交卷答卷的答案：交卷之后到达的写入不能再修改将要评分的答案"""
+        score_ids = {entry.score_id for entry in entries}
+        submitted = {row.id for row in db.session.query(Score.id).filter(
+            Score.id.in_(score_ids), Score.is_final_submit == True
+        ).all()}
+        if not submitted:
+            return entries
+        kept = [entry for entry in entries if entry.score_id not in submitted]
+        logger.warning(f"丢弃{len(entries) - len(kept)}份交卷后才写入的答案: score={sorted(submitted)}")
+        return kept
+
+    def _write(self, entries):
+        """在一个事务中插入或更新答案，只用较新的内容覆盖数据库中的答案"""
+        with self._flush_lock:
+            try:
+                entries = self._drop_submitted(entries)
+                if not entries:
+                    db.session.rollback()
+                    return
+                # 依赖student_answer(score_id, question_id)唯一索引，一条语句完成
+                written = upsert_answers([{
+                    'score_id': entry.score_id,
+                    'question_id': entry.question_id,
+                    'answer_content': entry.answer_content,
+                    'submitted_at': entry.submitted_at,
+                    'client_version': entry.client_version,
+                } for entry in entries])
+                if written is None:
+                    self._write_orm(entries)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        logger.debug(f"已写入{len(entries)}份答案")
+
+    def _write_orm(self, entries):
+        """不支持ON CONFLICT的数据库：先查询已有答案再逐条插入或更新"""
+        score_ids = {entry.score_id for entry in entries}
+        existing = {
+            (answer.score_id, answer.question_id): answer
+            for answer in StudentAnswer.query.filter(StudentAnswer.score_id.in_(score_ids)).all()
+        }
+        for entry in entries:
+            answer = existing.get((entry.score_id, entry.question_id))
+            if answer is None:
+                db.session.add(StudentAnswer(
+                    score_id=entry.score_id,
+                    question_id=entry.question_id,
+                    answer_content=entry.answer_content,
+                    submitted_at=entry.submitted_at,
+                    client_version=entry.client_version,
+                    points_earned=0  # 初始分数为0
+                ))
+            elif _is_older(entry, answer):
+                logger.debug(f"忽略旧版本答案: score={entry.score_id}, question={entry.question_id}")
+            elif answer.submitted_at is None or answer.submitted_at <= entry.submitted_at:
+                answer.answer_content = entry.answer_content
+                answer.submitted_at = entry.submitted_at
+                if entry.client_version is not None:
+                    answer.client_version = entry.client_version
+
+    def _flush_expired(self):
+        """写入考试已经结束的答案"""
+        now_local = datetime.utcnow() + timedelta(hours=8)  # 考试时间为北京时间
+        with self._lock:
+            score_ids = {entry.score_id for entry in self._pending.values()
+                         if entry.exam_end_time is not None and entry.exam_end_time <= now_local}
+        for score_id in score_ids:
+            self.flush(score_id)
+
+    def _next_wait(self):
+        """距离下次写入的等待时间：写入间隔与最近的考试结束时间取较小者"""
+        with self._lock:
+            end_times = [entry.exam_end_time for entry in self._pending.values() if entry.exam_end_time is not None]
+        if not end_times:
+            return self.flush_interval
+        now_local = datetime.utcnow() + timedelta(hours=8)
+        until_end = (min(end_times) - now_local).total_seconds()
+        return max(0.0, min(self.flush_interval, until_end))
+
+    def _flush_in_app(self):
+        if self._app is None:
+            return
+        with self._app.app_context():
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"写入缓冲答案失败: {e}")
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        """后台写入循环"""
+        last_flush = datetime.utcnow()
+        while not self._stop_event.is_set():
+            self._wakeup.wait(self._next_wait())
+            self._wakeup.clear()
+            if self._stop_event.is_set():
+                break
+            with self._app.app_context():
+                try:
+                    self._flush_expired()
+                    if (datetime.utcnow() - last_flush).total_seconds() >= self.flush_interval:
+                        self.flush()
+                        last_flush = datetime.utcnow()
+                except Exception as e:
+                    logger.error(f"批量写入答案失败，稍后重试: {e}")
+                finally:
+                    db.session.remove()
+
+
+# 进程内共享的答案缓冲，由init_answer_buffer按应用配置初始化
+answer_buffer = AnswerBuffer(mode=MODE_WRITE_THROUGH)
+
+
+def init_answer_buffer(app):
+    """按应用配置设置持久化模式并启动后台写入线程"""
+    answer_buffer.mode = app.config.get('ANSWER_BUFFER_MODE', MODE_BUFFERED)
+    if answer_buffer.buffered and app.config.get('WEB_PROCESSES', 1) > 1:
+        logger.warning("多个Web进程下使用buffered模式：其它进程缓冲的答案在交卷和评分时可能尚未写入，"
+                       "建议设置ANSWER_BUFFER_MODE=write_through")
+    answer_buffer.flush_interval = app.config.get('ANSWER_BUFFER_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+    answer_buffer.max_pending = app.config.get('ANSWER_BUFFER_MAX_PENDING', DEFAULT_MAX_PENDING)
+    answer_buffer.start(app)
+    return answer_buffer
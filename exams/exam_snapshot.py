@@ -0,0 +1,291 @@
+# exam_snapshot.py - 考试期间只读的考试快照缓存，学生答题接口不再查询题库表
+import os
+import json
+import time
+import logging
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload
+from models.db import db
+from models.exam import Exam
+from models.exam_question import ExamQuestion
+from models.question import Question
+from models.question_option import QuestionOption
+from exams.exam_variants import ExamVariant, VariantPlan
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('exam_snapshot')
+
+# 快照最长有效期(秒)。同一进程内的修改会立即失效快照，该值只用于多进程部署时限制其它进程修改后的延迟
+SNAPSHOT_TTL = float(os.environ.get('EXAM_SNAPSHOT_TTL', 60))
+
+# 修改这些模型会使相关考试的快照失效
+_SNAPSHOT_MODELS = (Exam, ExamQuestion, Question, QuestionOption)
+
+
+class ExamSnapshot:
+    """
+    一场考试的只读快照
+
+    包含考试基本信息、按顺序排列的题目、各题分值和选项；
+    每道题返回给学生的静态JSON（不含已保存答案）在构建时序列化一次。
+    """
+
+    def __init__(self, exam_id):
+        """
+        Args:
+            exam_id: 考试ID
+        """
+        self.exam_id = exam_id
+        self.exam = None  # 考试基本信息dict，考试不存在时为None
+        self.questions = []  # 按考试顺序排列的题目dict
+        self.question_map = {}  # question_id -> 题目dict
+        self._question_json = {}  # question_id -> 预序列化的题目JSON
+        self._payloads = {}  # question_id -> 题目dict，打乱选项时按学生的顺序重新序列化
+        self.variant_plan = None  # 生成个性化试卷的数据
+        self._variants = {}  # (score_id, 保存的试卷JSON) 或 student_id -> ExamVariant
+        self.built_at = time.monotonic()
+        self._load()
+
+    def _load(self):
+        exam = Exam.query.get(self.exam_id)
+        if exam is None:
+            return
+        self.exam = {
+            'id': exam.id,
+            'title': exam.title,
+            'description': exam.description,
+            'total_score': exam.total_score,
+            'start_time': exam.start_time,
+            'end_time': exam.end_time,
+            'is_published': exam.is_published,
+            'shuffle_questions': bool(exam.shuffle_questions),
+            'shuffle_options': bool(exam.shuffle_options),
+            'variant_seed': exam.variant_seed,
+        }
+
+        # 考试题目及题目本身，一次联表查询
+        exam_questions = ExamQuestion.query.options(
+            joinedload(ExamQuestion.question)
+        ).filter_by(exam_id=self.exam_id).order_by(ExamQuestion.order, ExamQuestion.id).all()
+
+        # 选择题选项，一次查询
+        choice_ids = [eq.question_id for eq in exam_questions
+                      if eq.question is not None and eq.question.question_type == 'choice']
+        options = {qid: [] for qid in choice_ids}
+        if choice_ids:
+            rows = db.session.query(QuestionOption.question_id, QuestionOption.id, QuestionOption.content).filter(
+                QuestionOption.question_id.in_(choice_ids)
+            ).order_by(QuestionOption.question_id, QuestionOption.order, QuestionOption.id).all()
+            for question_id, option_id, content in rows:
+                options[question_id].append({'id': option_id, 'content': content})
+
+        for eq in exam_questions:
+            question = eq.question
+            if question is None:
+                continue
+            item = {
+                'question_id': eq.question_id,
+                'order': eq.order,
+                'score': eq.score,
+                'pool': eq.pool,
+                'question': {
+                    'id': question.id,
+                    'title': question.title,
+                    'content': question.content,
+                    'question_type': question.question_type,
+                    'answer_template': question.answer_template,
+                },
+            }
+            self.questions.append(item)
+            self.question_map[eq.question_id] = item
+
+            payload = {
+                'id': question.id,
+                'title': question.title,
+                'content': question.content,
+                'question_type': question.question_type,
+                'score': eq.score,
+                'answer_template': question.answer_template,
+            }
+            if question.question_type == 'choice':
+                payload['options'] = options.get(question.id, [])
+            self._payloads[eq.question_id] = payload
+            self._question_json[eq.question_id] = json.dumps(payload)
+
+        self.variant_plan = VariantPlan(
+            self.exam_id, exam.variant_seed,
+            [(item['question_id'], item['pool']) for item in self.questions],
+            shuffle_questions=exam.shuffle_questions,
+            shuffle_options=exam.shuffle_options,
+            option_ids={qid: [option['id'] for option in opts] for qid, opts in options.items()}
+        )
+
+    @property
+    def question_ids(self):
+        return [item['question_id'] for item in self.questions]
+
+    def has_question(self, question_id):
+        return question_id in self.question_map
+
+    def variant(self, score):
+        """
+        答卷的个性化试卷，结果按答卷缓存，之后的查找不再解析或生成
+
+        Args:
+            score: Score对象
+
+        Returns:
+            ExamVariant
+        """
+        if self.variant_plan is None:
+            return ExamVariant([])
+        key = (score.id, score.variant) if score.variant else score.student_id
+        variant = self._variants.get(key)
+        if variant is None:
+            variant = self._variants[key] = self.variant_plan.resolve(score)
+        return variant
+
+    def variant_questions(self, variant):
+        """按试卷顺序排列的题目dict，order为学生看到的序号"""
+        return [dict(self.question_map[question_id], order=i + 1)
+                for i, question_id in enumerate(variant.question_ids) if question_id in self.question_map]
+
+    def question_json(self, question_id, saved_answer='', variant=None):
+        """
+        拼接题目的响应JSON：预序列化的题目内容加上学生已保存的答案
+
+        Args:
+            question_id: 题目ID
+            saved_answer: 学生已保存的答案
+            variant: 学生的试卷，打乱了该题选项时按学生的顺序重新序列化
+
+        Returns:
+            str: JSON字符串，题目不属于本考试时返回None
+        """
+        static_json = self._question_json.get(question_id)
+        if static_json is None:
+            return None
+        if variant is not None and question_id in variant.option_orders:
+            payload = dict(self._payloads[question_id])
+            payload['options'] = variant.order_options(question_id, payload['options'])
+            static_json = json.dumps(payload)
+        return f'{static_json[:-1]}, "saved_answer": {json.dumps(saved_answer or "")}}}'
+
+
+class ExamSnapshotCache:
+    """按考试ID缓存快照，修改考试、题目或选项的事务提交后失效"""
+
+    def __init__(self, ttl=SNAPSHOT_TTL):
+        self.ttl = ttl
+        self._snapshots = {}  # exam_id -> ExamSnapshot
+        self._generations = {}  # exam_id -> 失效次数，构建期间发生失效时丢弃构建结果
+        self._lock = threading.Lock()
+
+    def get(self, exam_id):
+        """获取考试快照，没有缓存或已过期时构建"""
+        with self._lock:
+            snapshot = self._snapshots.get(exam_id)
+            if snapshot is not None and time.monotonic() - snapshot.built_at < self.ttl:
+                return snapshot
+            generation = self._generations.get(exam_id, 0)
+
+        snapshot = ExamSnapshot(exam_id)
+        with self._lock:
+            if self._generations.get(exam_id, 0) == generation and snapshot.exam is not None:
+                self._snapshots[exam_id] = snapshot
+        return snapshot
+
+    def build(self, exam_id):
+        """立即重建考试快照（发布考试时调用）"""
+        self.invalidate(exam_id)
+        return self.get(exam_id)
+
+    def invalidate(self, exam_id):
+        with self._lock:
+            self._snapshots.pop(exam_id, None)
+            self._generations[exam_id] = self._generations.get(exam_id, 0) + 1
+
+    def invalidate_all(self):
+        with self._lock:
+            for exam_id in list(self._snapshots) + list(self._generations):
+                self._generations[exam_id] = self._generations.get(exam_id, 0) + 1
+            self._snapshots.clear()
+
+    def exams_with_questions(self, question_ids):
+        """返回已缓存快照中包含这些题目的考试ID"""
+        with self._lock:
+            return {exam_id for exam_id, snapshot in self._snapshots.items()
+                    if any(snapshot.has_question(qid) for qid in question_ids)}
+
+
+# 进程内共享的考试快照缓存
+snapshot_cache = ExamSnapshotCache()
+
+
+def get_exam_snapshot(exam_id):
+    """获取考试快照，考试不存在时返回None"""
+    snapshot = snapshot_cache.get(exam_id)
+    return snapshot if snapshot.exam is not None else None
+
+
+def _affected_exam_ids(session):
+    """收集本次flush中修改的对象所影响的考试"""
+    exam_ids = set()
+    question_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Exam):
+            exam_ids.add(obj.id)
+        elif isinstance(obj, ExamQuestion):
+            exam_ids.add(obj.exam_id)
+        elif isinstance(obj, Question):
+            question_ids.add(obj.id)
+        elif isinstance(obj, QuestionOption):
+            question_ids.add(obj.question_id)
+    question_ids.discard(None)
+    if question_ids:
+        exam_ids |= snapshot_cache.exams_with_questions(question_ids)
+    exam_ids.discard(None)
+    return exam_ids
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_snapshot_changes(session, flush_context, instances):
+    exam_ids = _affected_exam_ids(session)
+    if exam_ids:
+        session.info.setdefault('snapshot_exam_ids', set()).update(exam_ids)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_changes(orm_execute_state):
+    # 批量insert和Query.update()/delete()不经过flush，无法得知影响的考试，全部失效；
+    # 调用方通过执行选项snapshot_exam_id指明了考试时只失效这场考试
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ not in _SNAPSHOT_MODELS:
+        return
+    session = orm_execute_state.session
+    exam_id = orm_execute_state.execution_options.get('snapshot_exam_id')
+    if exam_id is not None:
+        session.info.setdefault('snapshot_exam_ids', set()).add(exam_id)
+    else:
+        session.info['snapshot_invalidate_all'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    # 提交之后才失效，避免其它线程在提交前用旧数据重建快照
+    if session.info.pop('snapshot_invalidate_all', False):
+        snapshot_cache.invalidate_all()
+        logger.debug("考试快照已全部失效")
+    for exam_id in session.info.pop('snapshot_exam_ids', ()):
+        snapshot_cache.invalidate(exam_id)
+        logger.debug(f"考试快照已失效: exam={exam_id}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_snapshot_changes(session):
+    session.info.pop('snapshot_invalidate_all', None)
+    session.info.pop('snapshot_exam_ids', None)
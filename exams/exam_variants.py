@@ -0,0 +1,166 @@
+# exam_variants.py - 个性化试卷：按(考试ID, 学生ID, 种子)确定每名学生的题目、题目顺序和选项顺序
+import json
+import random
+
+
+class ExamVariant:
+    """一名学生的试卷：按显示顺序排列的题目ID和选择题的选项顺序"""
+
+    __slots__ = ('question_ids', 'option_orders', '_positions')
+
+    def __init__(self, question_ids, option_orders=None):
+        """
+        Args:
+            question_ids: 按显示顺序排列的题目ID
+            option_orders: question_id -> 按显示顺序排列的选项ID，没有打乱选项时为空
+        """
+        self.question_ids = list(question_ids)
+        self.option_orders = option_orders or {}
+        self._positions = {question_id: i for i, question_id in enumerate(self.question_ids)}
+
+    def has_question(self, question_id):
+        return question_id in self._positions
+
+    def position(self, question_id):
+        """题目在试卷中的序号(从1开始)，不在试卷中时返回None"""
+        index = self._positions.get(question_id)
+        return index + 1 if index is not None else None
+
+    def order_options(self, question_id, options, key=lambda option: option['id']):
+        """按学生看到的顺序排列选项，没有打乱时原样返回"""
+        order = self.option_orders.get(question_id)
+        if not order:
+            return options
+        rank = {option_id: i for i, option_id in enumerate(order)}
+        return sorted(options, key=lambda option: rank.get(key(option), len(rank)))
+
+    def to_json(self):
+        payload = {'q': self.question_ids}
+        if self.option_orders:
+            payload['o'] = {str(question_id): order for question_id, order in self.option_orders.items()}
+        return json.dumps(payload, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, text):
+        payload = json.loads(text)
+        option_orders = {int(question_id): order for question_id, order in payload.get('o', {}).items()}
+        return cls(payload['q'], option_orders)
+
+
+class VariantPlan:
+    """
+    一场考试生成个性化试卷所需的全部数据
+
+    由考试快照或评分上下文构建一次，之后为任意学生生成试卷都只在内存中计算，不查询数据库。
+    """
+
+    def __init__(self, exam_id, seed, items, shuffle_questions=False, shuffle_options=False, option_ids=None):
+        """
+        Args:
+            exam_id: 考试ID
+            seed: 考试的随机种子，为空时按0处理
+            items: 按考试顺序排列的(题目ID, 题组)列表，题组为空表示固定题目
+            shuffle_questions: 是否打乱题目顺序
+            shuffle_options: 是否打乱选择题选项顺序
+            option_ids: question_id -> 按原顺序排列的选项ID（只需要选择题）
+        """
+        self.exam_id = exam_id
+        self.seed = seed or 0
+        self.shuffle_questions = bool(shuffle_questions)
+        self.shuffle_options = bool(shuffle_options)
+        self.option_ids = option_ids or {}
+
+        # 每个位置一组候选题目：固定题目只有一道，同一题组的题目占据该组第一道题的位置
+        self.slots = []
+        pools = {}
+        for question_id, pool in items:
+            if not pool:
+                self.slots.append([question_id])
+            elif pool in pools:
+                pools[pool].append(question_id)
+            else:
+                pools[pool] = [question_id]
+                self.slots.append(pools[pool])
+
+        self.identity = ExamVariant([question_id for question_id, _ in items])
+
+    @property
+    def is_identity(self):
+        """所有学生的试卷都与考试顺序相同"""
+        return not (self.shuffle_questions or self.shuffle_options or any(len(slot) > 1 for slot in self.slots))
+
+    def generate(self, student_id):
+        """
+        生成学生的试卷，相同的考试、学生和种子总是得到相同的结果
+
+        Args:
+            student_id: 学生ID
+
+        Returns:
+            ExamVariant
+        """
+        if self.is_identity:
+            return self.identity
+
+        rng = random.Random(f'{self.exam_id}:{student_id}:{self.seed}')
+        question_ids = [slot[0] if len(slot) == 1 else rng.choice(slot) for slot in self.slots]
+        if self.shuffle_questions:
+            rng.shuffle(question_ids)
+
+        option_orders = {}
+        if self.shuffle_options:
+            for question_id in question_ids:
+                options = list(self.option_ids.get(question_id, ()))
+                if len(options) > 1:
+                    rng.shuffle(options)
+                    option_orders[question_id] = options
+        return ExamVariant(question_ids, option_orders)
+
+    def generate_many(self, student_ids):
+        """批量生成试卷，返回student_id -> ExamVariant"""
+        return {student_id: self.generate(student_id) for student_id in student_ids}
+
+    def resolve(self, score):
+        """
+        答卷的试卷：已保存时使用保存的试卷，否则按学生生成（不保存）
+
+        Args:
+            score: Score对象，或带有student_id和variant属性的对象
+        """
+        if score.variant:
+            return ExamVariant.from_json(score.variant)
+        return self.generate(score.student_id)
+
+    def assign(self, score):
+        """
+        第一次进入考试时生成并保存答卷的试卷，之后修改考试设置不影响已开始的学生
+
+        Returns:
+            ExamVariant（需要由调用方提交事务）
+        """
+        if score.variant:
+            return ExamVariant.from_json(score.variant)
+        variant = self.generate(score.student_id)
+        if variant is not self.identity:
+            score.variant = variant.to_json()
+        return variant
+
+
+def pool_total_score(items):
+    """
+    考试总分：固定题目的分值之和，每个题组只计一道题（取组内最高分值）
+
+    Args:
+        items: (题组, 分值)列表
+
+    Returns:
+        float: 总分
+    """
+    total = 0
+    pool_scores = {}
+    for pool, score in items:
+        if pool:
+            pool_scores[pool] = max(pool_scores.get(pool, 0), score or 0)
+        else:
+            total += score or 0
+    return total + sum(pool_scores.values())
@@ -0,0 +1,133 @@
+# question_ops.py - 考试题目列表的集合操作：添加、移除和排序都用固定条数的SQL语句完成，与题目数量无关
+from sqlalchemy import case, delete, insert, select, update
+from models.db import db
+from models.question import Question
+from models.exam_question import ExamQuestion
+
+
+def _options(exam_id):
+    # 告诉考试快照只有这场考试受影响（批量语句默认使全部快照失效）；
+    # 调用方随后提交事务，会话中的对象在提交时过期，不需要同步
+    return {'snapshot_exam_id': exam_id, 'synchronize_session': False}
+
+
+def bulk_add_exam_questions(exam_id, questions, score=None):
+    """
+    一条INSERT语句把题目添加到考试末尾，已在考试中的题目跳过
+
+    Args:
+        exam_id: 考试ID
+        questions: 题目列表（Question、QuestionRef或带有id和score_default的查询行）
+        score: 每题分值，为空时使用题目的默认分值
+
+    Returns:
+        int: 添加的题目数
+    """
+    existing_ids = {row.question_id for row in db.session.query(ExamQuestion.question_id).filter(
+        ExamQuestion.exam_id == exam_id
+    ).all()}
+    max_order = db.session.query(db.func.max(ExamQuestion.order)).filter(
+        ExamQuestion.exam_id == exam_id
+    ).scalar() or 0
+
+    rows = []
+    for question in questions:
+        if question.id in existing_ids:
+            continue
+        existing_ids.add(question.id)
+        rows.append({
+            'exam_id': exam_id,
+            'question_id': question.id,
+            'order': max_order + len(rows) + 1,
+            'score': score or question.score_default,
+        })
+    if rows:
+        db.session.execute(insert(ExamQuestion), rows, execution_options={'snapshot_exam_id': exam_id})
+    return len(rows)
+
+
+def add_questions_by_id(exam_id, question_ids):
+    """
+    按请求中的顺序把题目添加到考试末尾，不存在的题目跳过
+
+    一次查询读取题目的默认分值，一条INSERT写入。
+
+    Args:
+        exam_id: 考试ID
+        question_ids: 题目ID列表
+
+    Returns:
+        int: 添加的题目数
+    """
+    question_ids = [int(question_id) for question_id in question_ids]
+    found = {row.id: row for row in db.session.query(Question.id, Question.score_default).filter(
+        Question.id.in_(question_ids)
+    ).all()}
+    return bulk_add_exam_questions(exam_id, [found[qid] for qid in question_ids if qid in found])
+
+
+def renumber_exam_questions(exam_id):
+    """
+    一条UPDATE语句把考试题目的顺序号重新编为1..n（按原顺序，顺序相同时按ID）
+
+    用窗口函数row_number()计算新的顺序号，需要SQLite 3.25+、MySQL 8+或PostgreSQL。
+    """
+    ranked = select(
+        ExamQuestion.id.label('id'),
+        db.func.row_number().over(order_by=(ExamQuestion.order, ExamQuestion.id)).label('new_order')
+    ).where(ExamQuestion.exam_id == exam_id).correlate(None).subquery('ranked')
+    new_order = select(ranked.c.new_order).where(ranked.c.id == ExamQuestion.id).scalar_subquery()
+    db.session.execute(
+        update(ExamQuestion).where(ExamQuestion.exam_id == exam_id).values(order=new_order),
+        execution_options=_options(exam_id)
+    )
+
+
+def remove_exam_questions(exam_id, question_ids):
+    """
+    一条DELETE语句移除题目，再一条UPDATE语句重新编号剩余题目
+
+    Args:
+        exam_id: 考试ID
+        question_ids: 要移除的题目ID列表
+
+    Returns:
+        int: 移除的题目数
+    """
+    question_ids = sorted({int(question_id) for question_id in question_ids})
+    if not question_ids:
+        return 0
+    result = db.session.execute(
+        delete(ExamQuestion).where(
+            ExamQuestion.exam_id == exam_id,
+            ExamQuestion.question_id.in_(question_ids)
+        ),
+        execution_options=_options(exam_id)
+    )
+    if result.rowcount:
+        renumber_exam_questions(exam_id)
+    return result.rowcount
+
+
+def reorder_exam_questions(exam_id, question_orders):
+    """
+    一条带CASE表达式的UPDATE语句设置多道题目的顺序号
+
+    Args:
+        exam_id: 考试ID
+        question_orders: question_id -> 新的顺序号
+
+    Returns:
+        int: 更新的题目数
+    """
+    orders = {int(question_id): int(order) for question_id, order in question_orders.items()}
+    if not orders:
+        return 0
+    result = db.session.execute(
+        update(ExamQuestion).where(
+            ExamQuestion.exam_id == exam_id,
+            ExamQuestion.question_id.in_(list(orders))
+        ).values(order=case(orders, value=ExamQuestion.question_id, else_=ExamQuestion.order)),
+        execution_options=_options(exam_id)
+    )
+    return result.rowcount
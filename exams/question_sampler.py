@@ -0,0 +1,232 @@
+# question_sampler.py - 随机抽题：在内存中的题目ID索引上按筛选条件抽样和计数，不再加载完整的题目记录
+import os
+import time
+import random
+import logging
+import threading
+from collections import namedtuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models.db import db
+from models.question import Question
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('question_sampler')
+
+# 索引最长有效期(秒)。同一进程内通过会话修改题目(包括批量UPDATE/DELETE)提交后立即失效，
+# 该值只用于限制其它进程修改后的延迟
+INDEX_TTL = float(os.environ.get('QUESTION_INDEX_TTL', 60))
+
+# 抽题只需要的题目字段；与Question对象一样有id和score_default，可以直接传给add_questions_to_exam
+QuestionRef = namedtuple('QuestionRef', ['id', 'question_type', 'difficulty', 'category_id', 'score_default'])
+
+
+def matches_filter(key, question_type, difficulty_min=0, difficulty_max=0, category_id=None):
+    """
+    (题型, 难度, 分类)分组是否符合筛选条件
+
+    与原来的SQL筛选一致：设置了难度范围时，难度为空的题目不符合。
+    """
+    bucket_type, difficulty, bucket_category = key
+    if bucket_type != question_type:
+        return False
+    if category_id and bucket_category != category_id:
+        return False
+    if (difficulty_min > 0 or difficulty_max > 0) and difficulty is None:
+        return False
+    if difficulty_min > 0 and difficulty < difficulty_min:
+        return False
+    if difficulty_max > 0 and difficulty > difficulty_max:
+        return False
+    return True
+
+
+class QuestionIdIndex:
+    """
+    按(题型, 难度, 分类)分组的题目ID索引
+
+    一次查询读取全部题目的ID和筛选字段，之后的抽题只在内存中进行；
+    题目的增删改（包括批量UPDATE/DELETE）提交后失效，下次使用时重建。
+    """
+
+    def __init__(self, ttl=INDEX_TTL):
+        self.ttl = ttl
+        self._buckets = None  # (question_type, difficulty, category_id) -> [QuestionRef]，按ID排序
+        self._built_at = 0.0
+        self._generation = 0  # 失效次数，构建期间发生失效时丢弃构建结果
+        self._lock = threading.Lock()
+
+    def buckets(self):
+        """获取分组索引，没有缓存或已过期时重建"""
+        with self._lock:
+            if self._buckets is not None and time.monotonic() - self._built_at < self.ttl:
+                return self._buckets
+            generation = self._generation
+
+        buckets = {}
+        rows = db.session.query(
+            Question.id, Question.question_type, Question.difficulty, Question.category_id, Question.score_default
+        ).order_by(Question.id).all()
+        for row in rows:
+            ref = QuestionRef(*row)
+            buckets.setdefault((ref.question_type, ref.difficulty, ref.category_id), []).append(ref)
+        logger.debug(f"题目ID索引已重建: {len(rows)}道题目, {len(buckets)}个分组")
+
+        with self._lock:
+            if self._generation == generation:
+                self._buckets = buckets
+                self._built_at = time.monotonic()
+        return buckets
+
+    def invalidate(self):
+        with self._lock:
+            self._buckets = None
+            self._generation += 1
+
+    def candidates(self, question_type, difficulty_min=0, difficulty_max=0, category_id=None):
+        """
+        符合筛选条件的题目，按ID排序
+
+        Args:
+            question_type: 题型
+            difficulty_min: 最低难度，0表示不限
+            difficulty_max: 最高难度，0表示不限
+            category_id: 分类ID，为空表示不限
+
+        Returns:
+            list: QuestionRef列表
+        """
+        matched = []
+        for key, refs in self.buckets().items():
+            if matches_filter(key, question_type, difficulty_min, difficulty_max, category_id):
+                matched.extend(refs)
+        matched.sort(key=lambda ref: ref.id)
+        return matched
+
+
+class QuestionHistogram:
+    """
+    按(题型, 难度, 分类)分组的题目数量
+
+    一次分组聚合查询，结果缓存在内存中；预览随机抽题时任意筛选条件的可用题目数都由它计算，不查询数据库。
+    题目的增删改（包括批量UPDATE/DELETE）提交后与题目ID索引一起失效，下次使用时重建。
+    """
+
+    def __init__(self, ttl=INDEX_TTL):
+        self.ttl = ttl
+        self._counts = None  # (question_type, difficulty, category_id) -> 题目数
+        self._built_at = 0.0
+        self._generation = 0  # 失效次数，构建期间发生失效时丢弃构建结果
+        self._lock = threading.Lock()
+
+    def counts(self):
+        """获取分组计数，没有缓存或已过期时重建"""
+        with self._lock:
+            if self._counts is not None and time.monotonic() - self._built_at < self.ttl:
+                return self._counts
+            generation = self._generation
+
+        rows = db.session.query(
+            Question.question_type, Question.difficulty, Question.category_id, db.func.count(Question.id)
+        ).group_by(Question.question_type, Question.difficulty, Question.category_id).all()
+        counts = {(question_type, difficulty, category_id): count
+                  for question_type, difficulty, category_id, count in rows}
+        logger.debug(f"题目数量分布已重建: {len(counts)}个分组")
+
+        with self._lock:
+            if self._generation == generation:
+                self._counts = counts
+                self._built_at = time.monotonic()
+        return counts
+
+    def invalidate(self):
+        with self._lock:
+            self._counts = None
+            self._generation += 1
+
+    def count(self, question_type, difficulty_min=0, difficulty_max=0, category_id=None):
+        """
+        符合筛选条件的题目数
+
+        Args:
+            question_type: 题型
+            difficulty_min: 最低难度，0表示不限
+            difficulty_max: 最高难度，0表示不限
+            category_id: 分类ID，为空表示不限
+
+        Returns:
+            int: 题目数
+        """
+        return sum(count for key, count in self.counts().items()
+                   if matches_filter(key, question_type, difficulty_min, difficulty_max, category_id))
+
+
+# 进程内共享的题目ID索引和题目数量分布
+question_index = QuestionIdIndex()
+question_histogram = QuestionHistogram()
+
+
+def new_seed():
+    """生成新的随机种子，返回给前端以便复现同一次抽题"""
+    return random.SystemRandom().randrange(1, 2 ** 31)
+
+
+def sample_questions(rng, question_type, count, difficulty_min=0, difficulty_max=0, category_id=None):
+    """
+    按筛选条件随机抽取题目
+
+    候选题目按ID排序后抽样，所以题库不变时同一种子总是抽到同样的题目。
+
+    Args:
+        rng: random.Random实例
+        question_type: 题型
+        count: 抽取数量，候选题目不足时返回全部
+        difficulty_min: 最低难度，0表示不限
+        difficulty_max: 最高难度，0表示不限
+        category_id: 分类ID，为空表示不限
+
+    Returns:
+        list: QuestionRef列表
+    """
+    candidates = question_index.candidates(question_type, difficulty_min, difficulty_max, category_id)
+    if len(candidates) <= count:
+        return candidates
+    return rng.sample(candidates, count)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_question_changes(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Question):
+            session.info['question_index_dirty'] = True
+            return
+
+
+def _targets_question(orm_execute_state):
+    """语句是否修改question表（ORM实体语句或直接针对question表的Core语句）"""
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None:
+        return mapper.class_ is Question
+    return getattr(orm_execute_state.statement, 'table', None) is Question.__table__
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_question_changes(orm_execute_state):
+    # 批量insert和Query.update()/delete()不经过flush，before_flush看不到这些修改
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if _targets_question(orm_execute_state):
+        orm_execute_state.session.info['question_index_dirty'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('question_index_dirty', False):
+        question_index.invalidate()
+        question_histogram.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_question_changes(session):
+    session.info.pop('question_index_dirty', None)
@@ -0,0 +1,85 @@
+# result_assembly.py - 答题状态与考试结果的组装，查询次数与题目数量无关
+from sqlalchemy import and_
+from sqlalchemy.orm import joinedload
+from models.db import db
+from models.exam_question import ExamQuestion
+from models.question_option import QuestionOption
+from models.student_answer import StudentAnswer
+from exams.answer_buffer import answer_buffer
+from exams.exam_snapshot import get_exam_snapshot
+
+
+def get_answered_question_ids(score_id):
+    """
+    获取一份答卷已作答的题目ID集合（包括缓冲中尚未写入数据库的答案）
+
+    Args:
+        score_id: 学生考试得分记录的ID
+
+    Returns:
+        set: 已作答的题目ID
+    """
+    answered_ids = {row.question_id for row in db.session.query(StudentAnswer.question_id).filter(
+        StudentAnswer.score_id == score_id
+    ).all()}
+    return answered_ids | answer_buffer.pending_question_ids(score_id)
+
+
+def build_question_answers(score):
+    """
+    按学生试卷的顺序组装题目、考试题目关联、学生答案和选项的映射
+
+    题目与答案一次外连接查询，选择题选项一次查询，之后只做字典查找。
+    个性化试卷中没有抽到的题目不包括在内，选项按学生看到的顺序排列。
+
+    Args:
+        score: Score对象
+
+    Returns:
+        dict: question_id -> {'question', 'exam_question', 'answer', 'options', 'correct_options'}，按试卷顺序排列
+    """
+    # 先写入缓冲中尚未保存的答案
+    answer_buffer.flush(score.id)
+
+    rows = db.session.query(ExamQuestion, StudentAnswer).options(
+        joinedload(ExamQuestion.question)
+    ).outerjoin(StudentAnswer, and_(
+        StudentAnswer.score_id == score.id,
+        StudentAnswer.question_id == ExamQuestion.question_id
+    )).filter(
+        ExamQuestion.exam_id == score.exam_id
+    ).order_by(ExamQuestion.order, ExamQuestion.id, StudentAnswer.id).all()
+
+    variant = get_exam_snapshot(score.exam_id).variant(score)
+
+    question_answers = {}
+    for eq, answer in rows:
+        question = eq.question
+        if question is None or question.id in question_answers or not variant.has_question(question.id):
+            # 同一题目有多条答案记录时取最早的一条
+            continue
+        question_answers[question.id] = {
+            'question': question,
+            'exam_question': eq,
+            'answer': answer,
+            'options': [],
+            'correct_options': []
+        }
+
+    # 选择题选项，一次查询
+    choice_ids = [qid for qid, qa in question_answers.items() if qa['question'].question_type == 'choice']
+    if choice_ids:
+        options = QuestionOption.query.filter(
+            QuestionOption.question_id.in_(choice_ids)
+        ).order_by(QuestionOption.question_id, QuestionOption.order, QuestionOption.id).all()
+        for option in options:
+            qa = question_answers[option.question_id]
+            qa['options'].append(option)
+            if option.is_correct:
+                qa['correct_options'].append(option)
+        for qid in choice_ids:
+            qa = question_answers[qid]
+            qa['options'] = variant.order_options(qid, qa['options'], key=lambda option: option.id)
+
+    # 按学生试卷中的顺序排列
+    return {qid: question_answers[qid] for qid in variant.question_ids if qid in question_answers}
@@ -1,4 +1,4 @@
-from flask import render_template, request, redirect, url_for, flash, current_app, jsonify, session
+from flask import render_template, request, redirect, url_for, flash, current_app, jsonify, session, abort
 from flask_login import current_user, login_required
 from sqlalchemy import and_, or_
 from sqlalchemy.sql.expression import func
@@ -14,6 +14,15 @@ from datetime import datetime, timedelta
 from models.user import User
 from models.score import Score
 from models.student_answer import StudentAnswer
+from grading.job_queue import get_latest_job, enqueue_exam_regrade_job, get_latest_exam_regrade_job
+from exams.result_assembly import build_question_answers
+from exams.exam_snapshot import snapshot_cache
+from questions.search_index import filter_by_keyword
+from utils.pagination import keyset_paginate, cached_count
+from exams.question_sampler import sample_questions, new_seed, question_histogram
+from exams.question_ops import (bulk_add_exam_questions, add_questions_by_id, remove_exam_questions,
+                                reorder_exam_questions)
+from exams.exam_variants import pool_total_score
 
 # 关于session的备注：实在无法兼顾自动保存和取消返回上一次保存的功能，先记下
 
@@ -77,10 +86,18 @@ def index():
             except ValueError:
                 pass
 
-    # 排序结果
-    exams = query.order_by(Exam.created_at.desc()).all()
+    # 键集分页：按(创建时间, ID)倒序
+    pagination = keyset_paginate(query, [(Exam.created_at, True), (Exam.id, True)],
+                                 cursor=request.args.get('cursor', ''),
+                                 per_page=current_app.config.get('EXAMS_PER_PAGE', 20))
+    pagination.total = cached_count(query, (
+        'exams', current_user.id, search_keyword, is_published, status, start_date, end_date))
 
-    return render_template('exams/index.html', exams=exams, get_now=datetime.utcnow)
+    # 翻页链接保留筛选条件
+    list_args = {key: value for key, value in request.args.items() if key != 'cursor'}
+
+    return render_template('exams/index.html', exams=pagination.items, pagination=pagination,
+                           list_args=list_args, get_now=datetime.utcnow)
 
 @exams_bp.route('/create_ajax', methods=['POST'])
 @login_required
@@ -563,27 +580,25 @@ def manage_questions(id):
     # 保存原始题目状态到会话
     session[f'exam_{id}_original_questions'] = [eq.question_id for eq in exam_questions]
 
-    # 获取可以添加的题目（首页只显示部分，其余通过AJAX加载）
-    if current_user.is_admin():
-        available_questions = Question.query.filter(
-            ~Question.id.in_([eq.question_id for eq in exam_questions]) if exam_questions else True
-        ).order_by(Question.created_at.desc()).limit(20).all()
-    else:
-        available_questions = Question.query.filter(
-            ~Question.id.in_([eq.question_id for eq in exam_questions]) if exam_questions else True,
-            or_(
-                Question.creator_id == current_user.id,
-                Question.is_public == True
-            )
-        ).order_by(Question.created_at.desc()).limit(20).all()
+    # 获取可以添加的题目（首页只显示部分，其余通过AJAX按游标加载）
+    query = Question.query.filter(
+        ~Question.id.in_([eq.question_id for eq in exam_questions]) if exam_questions else True
+    )
+    if not current_user.is_admin():
+        query = query.filter(or_(
+            Question.creator_id == current_user.id,
+            Question.is_public == True
+        ))
+    first_page = keyset_paginate(query, [(Question.created_at, True), (Question.id, True)], per_page=20)
 
-        # 获取所有分类
-        categories = Category.query.order_by(Category.name).all()
+    # 获取所有分类
+    categories = Category.query.order_by(Category.name).all()
 
     return render_template('exams/manage_questions.html',
                            exam=exam,
                            exam_questions=exam_questions,
-                           available_questions=available_questions,
+                           available_questions=first_page.items,
+                           available_next_cursor=first_page.next_cursor,
                            categories=categories)
 
 
@@ -648,6 +663,13 @@ def apply_random_questions(id):
     if not data:
         return jsonify({'success': False, 'message': '无效的请求数据'}), 400
 
+    # 随机种子：相同的种子和题库抽到相同的题目，未指定时生成新的种子并返回
+    try:
+        seed = int(data.get('seed') or 0) or new_seed()
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': '随机种子必须是整数'}), 400
+    rng = random.Random(seed)
+
     try:
         # 开始数据库事务
         db.session.begin_nested()
@@ -659,6 +681,7 @@ def apply_random_questions(id):
         choice_questions = []
         if data.get('choice_count', 0) > 0:
             choice_questions = get_random_questions(
+                rng,
                 question_type='choice',
                 count=data.get('choice_count', 0),
                 difficulty_min=data.get('choice_difficulty_min', 0),
@@ -672,6 +695,7 @@ def apply_random_questions(id):
         fill_blank_questions = []
         if data.get('fill_blank_count', 0) > 0:
             fill_blank_questions = get_random_questions(
+                rng,
                 question_type='fill_blank',
                 count=data.get('fill_blank_count', 0),
                 difficulty_min=data.get('fill_blank_difficulty_min', 0),
@@ -685,6 +709,7 @@ def apply_random_questions(id):
         programming_questions = []
         if data.get('programming_count', 0) > 0:
             programming_questions = get_random_questions(
+                rng,
                 question_type='programming',
                 count=data.get('programming_count', 0),
                 difficulty_min=data.get('programming_difficulty_min', 0),
@@ -706,7 +731,8 @@ def apply_random_questions(id):
             'fill_blank_count': len(fill_blank_questions),
             'programming_count': len(programming_questions),
             'total_count': len(choice_questions) + len(fill_blank_questions) + len(programming_questions),
-            'total_score': exam.total_score
+            'total_score': exam.total_score,
+            'seed': seed
         })
 
     except Exception as e:
@@ -735,30 +761,8 @@ def batch_add_questions(id):
         return jsonify({'success': False, 'message': '未选择题目'}), 400
 
     try:
-        # 获取当前最大顺序号
-        max_order = db.session.query(db.func.max(ExamQuestion.order)).filter_by(exam_id=id).scalar() or 0
-
-        # 添加题目
-        added_count = 0
-        for i, question_id in enumerate(question_ids):
-            question = Question.query.get(question_id)
-            if not question:
-                continue
-
-            # 检查题目是否已在考试中
-            existing = ExamQuestion.query.filter_by(exam_id=id, question_id=question_id).first()
-            if existing:
-                continue
-
-            # 添加题目
-            exam_question = ExamQuestion(
-                exam_id=id,
-                question_id=question_id,
-                order=max_order + i + 1,
-                score=question.score_default
-            )
-            db.session.add(exam_question)
-            added_count += 1
+        # 一条INSERT添加到考试末尾，不存在或已在考试中的题目跳过
+        added_count = add_questions_by_id(id, question_ids)
 
         # 更新考试总分
         if added_count > 0:
@@ -796,24 +800,12 @@ def batch_remove_questions(id):
         return jsonify({'success': False, 'message': '未选择题目'}), 400
 
     try:
-        # 删除题目
-        removed_count = 0
-        for question_id in question_ids:
-            exam_question = ExamQuestion.query.filter_by(exam_id=id, question_id=question_id).first()
-            if exam_question:
-                db.session.delete(exam_question)
-                removed_count += 1
+        # 一条DELETE删除题目，一条UPDATE重新排序剩余题目
+        removed_count = remove_exam_questions(id, question_ids)
 
         # 更新考试总分
         if removed_count > 0:
             db.session.commit()
-
-            # 重新排序剩余题目
-            remaining_questions = ExamQuestion.query.filter_by(exam_id=id).order_by(ExamQuestion.order).all()
-            for i, eq in enumerate(remaining_questions, 1):
-                eq.order = i
-            db.session.commit()
-
             update_exam_total_score(exam)
 
         return jsonify({
@@ -838,8 +830,8 @@ def available_questions(id):
         return jsonify({'success': False, 'message': '无权限操作'}), 403
 
     # 获取分页和筛选参数
-    page = request.args.get('page', 1, type=int)
-    limit = request.args.get('limit', 20, type=int)
+    cursor = request.args.get('cursor', '')
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
     search = request.args.get('search', '')
     question_type = request.args.get('type', '')
     difficulty = request.args.get('difficulty', 0, type=int)
@@ -854,8 +846,9 @@ def available_questions(id):
         query = query.filter(~Question.id.in_(existing_question_ids))
 
     # 应用筛选条件
+    rank = None
     if search:
-        query = query.filter(Question.title.like(f'%{search}%'))
+        query, rank = filter_by_keyword(query, search)
 
     if question_type:
         query = query.filter(Question.question_type == question_type)
@@ -873,8 +866,13 @@ def available_questions(id):
             Question.is_public == True
         ))
 
-    # 分页
-    questions = query.order_by(Question.created_at.desc()).paginate(page=page, per_page=limit, error_out=False)
+    # 键集分页：按(创建时间, ID)倒序，有相关度时相关度优先
+    order = [(Question.created_at, True), (Question.id, True)]
+    if rank is not None:
+        order.insert(0, (rank, False))
+    questions = keyset_paginate(query, order, cursor=cursor, per_page=limit)
+    questions.total = cached_count(query, (
+        'available_questions', id, current_user.id, search, question_type, difficulty, category_id))
 
     # 格式化结果
     return jsonify({
@@ -892,7 +890,8 @@ def available_questions(id):
         ],
         'total': questions.total,
         'pages': questions.pages,
-        'page': page
+        'has_next': questions.has_next,
+        'next_cursor': questions.next_cursor
     })
 
 
@@ -999,20 +998,14 @@ def remove_question(id, question_id):
         flash('您没有权限修改此考试', 'danger')
         return redirect(url_for('exams.index'))
 
-    # 查找并删除考试题目关联
-    exam_question = ExamQuestion.query.filter_by(exam_id=id, question_id=question_id).first_or_404()
-    db.session.delete(exam_question)
+    # 删除考试题目关联并重新排序剩余题目
+    if not remove_exam_questions(id, [question_id]):
+        abort(404)
     db.session.commit()
 
     # 更新考试总分
     update_exam_total_score(exam)
 
-    # 重新排序剩余题目
-    remaining_questions = ExamQuestion.query.filter_by(exam_id=id).order_by(ExamQuestion.order).all()
-    for i, eq in enumerate(remaining_questions, 1):
-        eq.order = i
-    db.session.commit()
-
     flash('题目已从考试中移除', 'success')
     return redirect(url_for('exams.manage_questions', id=id))
 
@@ -1052,6 +1045,75 @@ def update_question_score(id, question_id):
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
+@exams_bp.route('/<int:id>/update_question_pool/<int:question_id>', methods=['POST'])
+@login_required
+def update_question_pool(id, question_id):
+    """设置考试题目所属的题组，同一题组的题目每名学生随机抽到一道"""
+    exam = Exam.query.get_or_404(id)
+
+    # 检查权限
+    if not (current_user.is_admin() or exam.creator_id == current_user.id):
+        flash('您没有权限修改此考试', 'danger')
+        return redirect(url_for('exams.index'))
+
+    data = request.get_json()
+    if not data or 'pool' not in data:
+        return jsonify({'success': False, 'message': '未收到有效的题组数据'}), 400
+
+    pool = (data.get('pool') or '').strip() or None
+    if pool and len(pool) > 50:
+        return jsonify({'success': False, 'message': '题组名称不能超过50个字符'}), 400
+
+    try:
+        exam_question = ExamQuestion.query.filter_by(exam_id=id, question_id=question_id).first_or_404()
+        exam_question.pool = pool
+        db.session.commit()
+
+        # 题组内只计一道题的分值
+        update_exam_total_score(exam)
+
+        return jsonify({'success': True, 'message': '题组已更新', 'total_score': exam.total_score})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@exams_bp.route('/<int:id>/variant_settings', methods=['POST'])
+@login_required
+def update_variant_settings(id):
+    """设置是否为每名学生打乱题目顺序和选项顺序"""
+    exam = Exam.query.get_or_404(id)
+
+    # 检查权限
+    if not (current_user.is_admin() or exam.creator_id == current_user.id):
+        flash('您没有权限修改此考试', 'danger')
+        return redirect(url_for('exams.index'))
+
+    data = request.get_json()
+    if data is None:
+        return jsonify({'success': False, 'message': '未收到有效的设置数据'}), 400
+
+    try:
+        if 'shuffle_questions' in data:
+            exam.shuffle_questions = bool(data['shuffle_questions'])
+        if 'shuffle_options' in data:
+            exam.shuffle_options = bool(data['shuffle_options'])
+        # 种子只生成一次，已开始考试的学生保存了自己的试卷，不受之后修改的影响
+        if exam.variant_seed is None:
+            exam.variant_seed = new_seed()
+        db.session.commit()
+
+        return jsonify({
+            'success': True,
+            'message': '试卷设置已更新',
+            'shuffle_questions': exam.shuffle_questions,
+            'shuffle_options': exam.shuffle_options
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
 @exams_bp.route('/<int:id>/reorder_questions', methods=['POST'])
 @login_required
 def reorder_questions(id):
@@ -1068,12 +1130,11 @@ def reorder_questions(id):
     if not question_orders:
         return {'success': False, 'message': '未收到排序数据'}, 400
 
-    # 更新排序
-    for question_id, order in question_orders.items():
-        exam_question = ExamQuestion.query.filter_by(
-            exam_id=id, question_id=int(question_id)).first()
-        if exam_question:
-            exam_question.order = order
+    # 一条UPDATE更新全部题目的顺序
+    try:
+        reorder_exam_questions(id, question_orders)
+    except (TypeError, ValueError, AttributeError):
+        return {'success': False, 'message': '排序数据格式错误'}, 400
 
     db.session.commit()
 
@@ -1099,18 +1160,9 @@ def revert_questions(id):
         # 首先清除所有当前题目
         ExamQuestion.query.filter_by(exam_id=id).delete()
 
-        # 如果有原始题目，恢复它们
+        # 如果有原始题目，一条INSERT恢复它们
         if original_question_ids:
-            for i, q_id in enumerate(original_question_ids):
-                question = Question.query.get(q_id)
-                if question:
-                    exam_question = ExamQuestion(
-                        exam_id=id,
-                        question_id=q_id,
-                        order=i + 1,
-                        score=question.score_default
-                    )
-                    db.session.add(exam_question)
+            add_questions_by_id(id, original_question_ids)
 
         db.session.commit()
         update_exam_total_score(exam)
@@ -1140,6 +1192,9 @@ def publish_exam(id):
     exam.is_published = True
     db.session.commit()
 
+    # 发布时构建考试快照，考试期间的答题接口直接读取
+    snapshot_cache.build(exam.id)
+
     flash('考试已发布', 'success')
     return redirect(url_for('exams.view', id=id))
 
@@ -1169,56 +1224,26 @@ def unpublish_exam(id):
 
 
 # 辅助函数
-def get_random_questions(question_type, count, difficulty_min=0, difficulty_max=0, category_id=None, score=None):
-    """随机抽取题目"""
-    query = Question.query.filter_by(question_type=question_type)
-
-    # 根据难度筛选
-    if difficulty_min > 0:
-        query = query.filter(Question.difficulty >= difficulty_min)
-    if difficulty_max > 0:
-        query = query.filter(Question.difficulty <= difficulty_max)
-
-    # 根据分类筛选
-    if category_id:
-        query = query.filter_by(category_id=category_id)
-
-    # 获取可用题目列表
-    available_questions = query.all()
-
-    # 如果可用题目数量不足，返回全部
-    if len(available_questions) <= count:
-        return available_questions
-
-    # 随机抽取指定数量的题目
-    return random.sample(available_questions, count)
+def get_random_questions(rng, question_type, count, difficulty_min=0, difficulty_max=0, category_id=None, score=None):
+    """随机抽取题目（在内存中的题目ID索引上抽样，返回QuestionRef列表）"""
+    return sample_questions(rng, question_type, count,
+                            difficulty_min=difficulty_min or 0,
+                            difficulty_max=difficulty_max or 0,
+                            category_id=int(category_id) if category_id else None)
 
 
 def add_questions_to_exam(exam, questions, score):
-    """将题目添加到考试中"""
-    # 获取当前最大顺序号
-    max_order = db.session.query(db.func.max(ExamQuestion.order)).filter_by(exam_id=exam.id).scalar() or 0
-
-    # 添加题目
-    for i, question in enumerate(questions):
-        # 检查题目是否已在考试中
-        existing = ExamQuestion.query.filter_by(exam_id=exam.id, question_id=question.id).first()
-        if not existing:
-            exam_question = ExamQuestion(
-                exam_id=exam.id,
-                question_id=question.id,
-                order=max_order + i + 1,
-                score=score or question.score_default
-            )
-            db.session.add(exam_question)
-
+    """将题目添加到考试中（一条INSERT语句，已在考试中的题目跳过）"""
+    bulk_add_exam_questions(exam.id, questions, score)
     db.session.commit()
 
 
 def update_exam_total_score(exam):
     """更新考试总分"""
-    # 计算所有题目的分值总和
-    total_score = db.session.query(db.func.sum(ExamQuestion.score)).filter_by(exam_id=exam.id).scalar() or 0
+    # 固定题目的分值之和，每个题组只有一道题计入学生的试卷
+    total_score = pool_total_score(db.session.query(ExamQuestion.pool, ExamQuestion.score).filter_by(
+        exam_id=exam.id
+    ).all())
 
     exam.total_score = total_score
     db.session.commit()
@@ -1228,36 +1253,15 @@ def count_available_questions(category_id=None,
                               choice_difficulty_min=0, choice_difficulty_max=0,
                               fill_blank_difficulty_min=0, fill_blank_difficulty_max=0,
                               programming_difficulty_min=0, programming_difficulty_max=0):
-    """统计可用题目数量"""
-    # 选择题查询
-    choice_query = Question.query.filter_by(question_type='choice')
-    if category_id and int(category_id) > 0:
-        choice_query = choice_query.filter_by(category_id=int(category_id))
-    if choice_difficulty_min > 0:
-        choice_query = choice_query.filter(Question.difficulty >= choice_difficulty_min)
-    if choice_difficulty_max > 0:
-        choice_query = choice_query.filter(Question.difficulty <= choice_difficulty_max)
-    choice_count = choice_query.count()
-
-    # 填空题查询
-    fill_blank_query = Question.query.filter_by(question_type='fill_blank')
-    if category_id and int(category_id) > 0:
-        fill_blank_query = fill_blank_query.filter_by(category_id=int(category_id))
-    if fill_blank_difficulty_min > 0:
-        fill_blank_query = fill_blank_query.filter(Question.difficulty >= fill_blank_difficulty_min)
-    if fill_blank_difficulty_max > 0:
-        fill_blank_query = fill_blank_query.filter(Question.difficulty <= fill_blank_difficulty_max)
-    fill_blank_count = fill_blank_query.count()
-
-    # 编程题查询
-    programming_query = Question.query.filter_by(question_type='programming')
-    if category_id and int(category_id) > 0:
-        programming_query = programming_query.filter_by(category_id=int(category_id))
-    if programming_difficulty_min > 0:
-        programming_query = programming_query.filter(Question.difficulty >= programming_difficulty_min)
-    if programming_difficulty_max > 0:
-        programming_query = programming_query.filter(Question.difficulty <= programming_difficulty_max)
-    programming_count = programming_query.count()
+    """统计可用题目数量（由缓存的题目数量分布计算，不查询数据库）"""
+    category_id = int(category_id) if category_id and int(category_id) > 0 else None
+
+    choice_count = question_histogram.count(
+        'choice', int(choice_difficulty_min or 0), int(choice_difficulty_max or 0), category_id)
+    fill_blank_count = question_histogram.count(
+        'fill_blank', int(fill_blank_difficulty_min or 0), int(fill_blank_difficulty_max or 0), category_id)
+    programming_count = question_histogram.count(
+        'programming', int(programming_difficulty_min or 0), int(programming_difficulty_max or 0), category_id)
 
     return choice_count, fill_blank_count, programming_count
 
@@ -1283,28 +1287,52 @@ def teacher_view_student_result(score_id):
     # 获取学生
     student = User.query.get_or_404(score.student_id)
 
-    # 获取所有答题记录
-    student_answers = StudentAnswer.query.filter_by(score_id=score.id).all()
-
-    # 获取考试题目
-    exam_questions = ExamQuestion.query.filter_by(exam_id=exam.id).order_by(ExamQuestion.order).all()
-
     # 创建题目和答案的映射
-    question_answers = {}
-    for eq in exam_questions:
-        question = eq.question
-        answer = next((a for a in student_answers if a.question_id == question.id), None)
-        question_answers[question.id] = {
-            'question': question,
-            'exam_question': eq,
-            'answer': answer
-        }
+    question_answers = build_question_answers(score)
 
     return render_template('exams/teacher_view_result.html',
                            exam=exam,
                            score=score,
                            student=student,
-                           question_answers=question_answers)
+                           question_answers=question_answers,
+                           grading_job=get_latest_job(score.id))
+
+
+@exams_bp.route('/<int:id>/regrade_all', methods=['POST'])
+@login_required
+def regrade_all(id):
+    """批量重新评分整场考试的全部已提交答卷"""
+    exam = Exam.query.get_or_404(id)
+
+    # 检查权限 - 只有创建者或管理员可以操作
+    if not (current_user.is_admin() or exam.creator_id == current_user.id):
+        flash('您没有权限重新评分此考试', 'danger')
+        return redirect(url_for('exams.index'))
+
+    try:
+        job = enqueue_exam_regrade_job(exam.id, requested_by=current_user.id)
+        flash(f'已加入批量重新评分队列（任务 #{job.id}），完成后刷新页面查看成绩。', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'批量重新评分任务创建失败: {str(e)}', 'danger')
+
+    return redirect(url_for('exams.view', id=exam.id))
+
+
+@exams_bp.route('/<int:id>/regrade_status')
+@login_required
+def regrade_status(id):
+    """查询批量重新评分进度（AJAX）"""
+    exam = Exam.query.get_or_404(id)
+
+    if not (current_user.is_admin() or exam.creator_id == current_user.id):
+        return jsonify({'error': '权限不足', 'message': '无权查看该考试的评分进度'}), 403
+
+    job = get_latest_exam_regrade_job(exam.id)
+    return jsonify({
+        'exam_id': exam.id,
+        'job': job.to_dict() if job else None
+    })
 
 
 @exams_bp.route('/teacher/update_answer_grade/<int:answer_id>', methods=['POST'])
@@ -1,19 +1,20 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, current_app
+from flask import (render_template, request, redirect, url_for, flash, jsonify, current_app, abort,
+                   Response)
 from flask_login import current_user, login_required
 from sqlalchemy import and_, or_
 from exams import exams_bp
 from models.db import db
 from models.exam import Exam
-from models.exam_question import ExamQuestion
-from models.question import Question
 from models.score import Score
 from models.student_answer import StudentAnswer
 from models.question_option import QuestionOption
 from forms.student_answer import StudentAnswerForm
 from datetime import datetime, timedelta
 import json
-import r_setup
-from grading import AutoGrader
+from grading.job_queue import enqueue_grading_job, get_latest_job
+from exams.answer_buffer import answer_buffer, upsert_answers
+from exams.exam_snapshot import get_exam_snapshot
+from exams.result_assembly import build_question_answers, get_answered_question_ids
 
 
 @exams_bp.route('/student/exams')
@@ -45,10 +46,9 @@ def student_exams():
             f"本地时间是否在范围内: {exam.start_time <= now_local <= exam.end_time}"
         )
 
-    # 获取学生已提交的考试ID列表
-    submitted_exam_ids = [score.exam_id for score in Score.query.filter_by(
-        student_id=current_user.id
-    ).filter(
+    # 获取学生已提交的考试ID列表（只查询exam_id，由覆盖索引ix_score_student_status_exam完成）
+    submitted_exam_ids = [row.exam_id for row in db.session.query(Score.exam_id).filter(
+        Score.student_id == current_user.id,
         or_(Score.is_final_submit == True, Score.is_graded == True)
     ).all()]
 
@@ -116,11 +116,14 @@ def take_exam(exam_id):
         flash('只有学生可以参加考试', 'danger')
         return redirect(url_for('exams.student_exams'))
 
-    # 获取考试信息
-    exam = Exam.query.get_or_404(exam_id)
+    # 获取考试快照（考试信息和题目）
+    snapshot = get_exam_snapshot(exam_id)
+    if snapshot is None:
+        abort(404)
+    exam = snapshot.exam
 
     # 检查考试是否已发布
-    if not exam.is_published:
+    if not exam['is_published']:
         flash('该考试尚未发布', 'danger')
         return redirect(url_for('exams.student_exams'))
 
@@ -131,16 +134,16 @@ def take_exam(exam_id):
     current_app.logger.debug(
         f"【参加考试】当前UTC时间: {now_utc.strftime('%Y-%m-%d %H:%M:%S')}, "
         f"当前北京时间: {now_local.strftime('%Y-%m-%d %H:%M:%S')}, "
-        f"考试开始时间: {exam.start_time.strftime('%Y-%m-%d %H:%M:%S')}, "
-        f"结束时间: {exam.end_time.strftime('%Y-%m-%d %H:%M:%S')}"
+        f"考试开始时间: {exam['start_time'].strftime('%Y-%m-%d %H:%M:%S')}, "
+        f"结束时间: {exam['end_time'].strftime('%Y-%m-%d %H:%M:%S')}"
     )
 
     # 检查考试时间 - 使用北京时间
-    if now_local < exam.start_time:
+    if now_local < exam['start_time']:
         flash('考试尚未开始', 'warning')
         return redirect(url_for('exams.student_exams'))
 
-    if now_local > exam.end_time:
+    if now_local > exam['end_time']:
         flash('考试已结束', 'warning')
         return redirect(url_for('exams.student_exams'))
 
@@ -159,7 +162,7 @@ def take_exam(exam_id):
         )
         db.session.add(new_score)
         db.session.commit()
-        score_id = new_score.id
+        score = new_score
     else:
         # 如果已提交，则不能再次参加
         if existing_score.is_graded:
@@ -169,13 +172,19 @@ def take_exam(exam_id):
         if existing_score.is_final_submit:
             flash('您已提交此考试，无法再次修改答案。', 'info')
             return redirect(url_for('exams.view_result', exam_id=exam_id))
-        score_id = existing_score.id
+        score = existing_score
+    score_id = score.id
 
-    # 获取考试题目
-    exam_questions = ExamQuestion.query.filter_by(exam_id=exam_id).order_by(ExamQuestion.order).all()
+    # 个性化试卷：第一次进入考试时生成并保存，之后修改考试设置不影响已开始的学生
+    if not score.variant and not snapshot.variant_plan.is_identity:
+        snapshot.variant_plan.assign(score)
+        db.session.commit()
+
+    # 考试题目（来自快照，按学生的试卷顺序）
+    exam_questions = snapshot.variant_questions(snapshot.variant(score))
 
     # 计算剩余时间（秒）- 使用北京时间
-    remaining_seconds = int((exam.end_time - now_local).total_seconds())
+    remaining_seconds = int((exam['end_time'] - now_local).total_seconds())
 
     # 创建学生答题表单
     answer_form = StudentAnswerForm()
@@ -196,24 +205,11 @@ def get_question(exam_id, question_id):
         if not current_user.is_student():
             return jsonify({'error': '权限不足', 'message': '只有学生可以访问此API'}), 403
 
-        # 获取考试信息
-        exam = Exam.query.get(exam_id)
-        if not exam:
+        # 获取考试快照
+        snapshot = get_exam_snapshot(exam_id)
+        if snapshot is None:
             return jsonify({'error': '考试不存在', 'message': f'找不到ID为{exam_id}的考试'}), 404
 
-        # 获取题目信息
-        question = Question.query.get(question_id)
-        if not question:
-            return jsonify({'error': '题目不存在', 'message': f'找不到ID为{question_id}的题目'}), 404
-
-        # 获取考试题目关联信息
-        exam_question = ExamQuestion.query.filter_by(
-            exam_id=exam_id,
-            question_id=question_id
-        ).first()
-        if not exam_question:
-            return jsonify({'error': '题目不在考试中', 'message': f'题目{question_id}不属于考试{exam_id}'}), 404
-
         # 获取学生得分记录
         score = Score.query.filter_by(
             student_id=current_user.id,
@@ -223,34 +219,23 @@ def get_question(exam_id, question_id):
         if not score:
             return jsonify({'error': '考试记录不存在', 'message': '未找到您的考试记录'}), 404
 
-        # 获取学生已保存的答案
-        student_answer = StudentAnswer.query.filter_by(
-            score_id=score.id,
-            question_id=question_id
-        ).first()
-
-        # 准备题目数据
-        question_data = {
-            'id': question.id,
-            'title': question.title,
-            'content': question.content,
-            'question_type': question.question_type,
-            'score': exam_question.score,
-            'answer_template': question.answer_template,
-            'saved_answer': student_answer.answer_content if student_answer else '',
-        }
+        # 题目必须属于该学生的试卷
+        variant = snapshot.variant(score)
+        if not variant.has_question(question_id):
+            return jsonify({'error': '题目不在考试中', 'message': f'题目{question_id}不属于考试{exam_id}'}), 404
 
-        # 如果是选择题，添加选项
-        if question.question_type == 'choice':
-            options = []
-            for option in question.options:
-                options.append({
-                    'id': option.id,
-                    'content': option.content,
-                })
-            question_data['options'] = options
-
-        return jsonify(question_data)
+        # 获取学生已保存的答案，缓冲中尚未写入数据库的答案更新
+        saved_answer = answer_buffer.get(score.id, question_id)
+        if saved_answer is None:
+            student_answer = StudentAnswer.query.filter_by(
+                score_id=score.id,
+                question_id=question_id
+            ).first()
+            saved_answer = student_answer.answer_content if student_answer else ''
+
+        # 题目内容和选项已在快照中序列化，只拼接已保存的答案
+        return current_app.response_class(snapshot.question_json(question_id, saved_answer, variant=variant),
+                                          mimetype='application/json')
     except Exception as e:
         # 记录错误到日志
         current_app.logger.error(f"获取题目时出错: {str(e)}")
@@ -265,9 +250,9 @@ def get_answer_status(exam_id):
         if not current_user.is_student():
             return jsonify({'error': '权限不足', 'message': '只有学生可以访问此API'}), 403
 
-        # 获取考试信息
-        exam = Exam.query.get(exam_id)
-        if not exam:
+        # 获取考试快照
+        snapshot = get_exam_snapshot(exam_id)
+        if snapshot is None:
             return jsonify({'error': '考试不存在', 'message': f'找不到ID为{exam_id}的考试'}), 404
 
         # 获取学生得分记录
@@ -279,21 +264,21 @@ def get_answer_status(exam_id):
         if not score:
             return jsonify({'error': '考试记录不存在', 'message': '未找到您的考试记录'}), 404
 
-        # 获取考试所有题目
-        exam_questions = ExamQuestion.query.filter_by(exam_id=exam_id).all()
+        # 学生试卷的所有题目（来自快照）
+        exam_question_ids = snapshot.variant(score).question_ids
 
-        # 获取已回答的题目
-        answered_questions = StudentAnswer.query.filter_by(score_id=score.id).all()
+        # 获取已回答的题目（包括缓冲中尚未写入数据库的答案）
+        answered_ids = get_answered_question_ids(score.id)
 
-        # 统计已回答题目数
-        answered_count = len(answered_questions)
-        total_count = len(exam_questions)
+        # 统计已回答题目数（只统计本考试的题目）
+        answered_count = len(answered_ids & set(exam_question_ids))
+        total_count = len(exam_question_ids)
 
         # 创建题目回答状态
         question_status = {}
-        for eq in exam_questions:
-            is_answered = any(a.question_id == eq.question_id for a in answered_questions)
-            question_status[str(eq.question_id)] = is_answered  # 将键转换为字符串，确保JSON序列化正确
+        for question_id in exam_question_ids:
+            is_answered = question_id in answered_ids
+            question_status[str(question_id)] = is_answered  # 将键转换为字符串，确保JSON序列化正确
 
         # 记录一下返回结果用于调试
         result = {
@@ -310,6 +295,21 @@ def get_answer_status(exam_id):
         return jsonify({'error': '服务器错误', 'message': f'获取答题状态时发生错误: {str(e)}'}), 500
 
 
+def normalize_choice_answer(answer_content):
+    """
+    选择题答案统一保存为JSON字符串
+
+    Raises:
+        json.JSONDecodeError: 字符串答案不是有效的JSON
+    """
+    if isinstance(answer_content, str):
+        # 确保是有效的JSON
+        json.loads(answer_content)
+        return answer_content
+    # 如果不是字符串，转换为JSON字符串
+    return json.dumps(answer_content)
+
+
 @exams_bp.route('/student/save_answer', methods=['POST'])
 @login_required
 def save_answer():
@@ -332,91 +332,239 @@ def save_answer():
         # 添加日志，帮助调试
         current_app.logger.debug(f"接收到的答案数据: score_id={score_id}, question_id={question_id}")
 
-        # 获取题目类型，以便进行适当的处理
-        question = Question.query.get(question_id)
-        if not question:
-            return jsonify({'success': False, 'message': '题目不存在'}), 404
+        # 检查得分记录是否存在且属于当前用户
+        score = Score.query.get_or_404(score_id)
+        if score.student_id != current_user.id:
+            return jsonify({'success': False, 'message': '权限不足'}), 403
+        if score.is_final_submit:
+            return jsonify({'success': False, 'message': '考试已提交，无法修改答案'}), 403
+
+        # 题目必须属于该学生的试卷，题型从考试快照中读取
+        snapshot = get_exam_snapshot(score.exam_id)
+        if snapshot is None:
+            return jsonify({'success': False, 'message': '考试不存在'}), 404
+        try:
+            question_id = int(question_id)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': '题目ID格式错误'}), 400
+        if not snapshot.variant(score).has_question(question_id):
+            return jsonify({'success': False, 'message': '题目不属于本场考试'}), 400
+        question_type = snapshot.question_map[question_id]['question']['question_type']
 
         # 对选择题答案的特殊处理
-        if question.question_type == 'choice':
+        if question_type == 'choice':
             try:
-                # 尝试验证JSON格式
-                if isinstance(answer_content, str):
-                    # 确保是有效的JSON
-                    json.loads(answer_content)
-                    current_app.logger.debug(f"选择题答案: {answer_content}")
-                else:
-                    # 如果不是字符串，确保转换为JSON字符串
-                    answer_content = json.dumps(answer_content)
-                    current_app.logger.debug(f"转换后的选择题答案: {answer_content}")
+                answer_content = normalize_choice_answer(answer_content)
+                current_app.logger.debug(f"选择题答案: {answer_content}")
             except json.JSONDecodeError as e:
                 current_app.logger.error(f"选择题答案JSON解析失败: {e}, 原始内容: {answer_content}")
                 return jsonify({'success': False, 'message': f'选择题答案格式错误: {str(e)}'}), 400
 
-        # 检查得分记录是否存在且属于当前用户
-        score = Score.query.get_or_404(score_id)
-        if score.student_id != current_user.id:
-            return jsonify({'success': False, 'message': '权限不足'}), 403
-
         # 检查考试是否在进行中 - 使用北京时间
-        exam = Exam.query.get_or_404(score.exam_id)
+        exam = snapshot.exam
         now_utc = datetime.utcnow()
         now_local = now_utc + timedelta(hours=8)  # UTC+8
 
         current_app.logger.debug(
             f"【保存答案】当前UTC时间: {now_utc.strftime('%Y-%m-%d %H:%M:%S')}, "
             f"当前北京时间: {now_local.strftime('%Y-%m-%d %H:%M:%S')}, "
-            f"考试结束时间: {exam.end_time.strftime('%Y-%m-%d %H:%M:%S')}"
+            f"考试结束时间: {exam['end_time'].strftime('%Y-%m-%d %H:%M:%S')}"
         )
 
-        if now_local > exam.end_time or now_local < exam.start_time:
+        if now_local > exam['end_time'] or now_local < exam['start_time']:
             return jsonify({'success': False, 'message': '考试时间已过或未开始'}), 403
 
-        # 查找已存在的答案记录
-        existing_answer = StudentAnswer.query.filter_by(
-            score_id=score_id,
-            question_id=question_id
-        ).first()
+        client_version = data.get('client_version')
+        try:
+            client_version = int(client_version) if client_version is not None else None
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': '版本号格式错误'}), 400
 
-        if existing_answer:
-            # 更新现有答案
-            existing_answer.answer_content = answer_content
-            existing_answer.submitted_at = datetime.utcnow()
-            current_app.logger.debug(f"更新答案: question_id={question_id}")
-        else:
-            # 创建新答案记录
-            new_answer = StudentAnswer(
+        # 答案先进入写后缓冲，由后台线程批量写入（write_through模式下立即提交）
+        persisted = answer_buffer.put(score.id, question_id, answer_content, exam_end_time=exam['end_time'],
+                                      client_version=client_version)
+        current_app.logger.debug(f"保存答案: question_id={question_id}, 已写入数据库={persisted}")
+
+        return jsonify({
+            'success': True,
+            'message': '答案已保存',
+            'persisted': persisted,
+            'saved_at': now_local.strftime('%Y-%m-%d %H:%M:%S')  # 返回北京时间
+        })
+
+    except Exception as e:
+        current_app.logger.error(f"保存答案时发生错误: {str(e)}")
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'保存答案失败: {str(e)}'}), 500
+
+
+def _save_answers_orm(score_id, latest, submitted_at):
+    """
+    不支持ON CONFLICT的数据库：加锁读取已有答案后逐条插入或更新
+
+    Returns:
+        tuple: (保存的题目ID列表, 被拒绝的题目列表)
+    """
+    existing = {a.question_id: a for a in StudentAnswer.query.filter(
+        StudentAnswer.score_id == score_id,
+        StudentAnswer.question_id.in_(latest.keys())
+    ).with_for_update().all()}
+
+    saved, rejected = [], []
+    for question_id, item in latest.items():
+        client_version = item['client_version']
+        answer = existing.get(question_id)
+        if answer is None:
+            db.session.add(StudentAnswer(
                 score_id=score_id,
                 question_id=question_id,
-                answer_content=answer_content,
+                answer_content=item['answer_content'],
+                client_version=client_version,
+                submitted_at=submitted_at,
                 points_earned=0  # 初始分数为0
-            )
-            db.session.add(new_answer)
-            current_app.logger.debug(f"创建新答案: question_id={question_id}")
+            ))
+        elif (client_version is not None and answer.client_version is not None
+              and client_version < answer.client_version):
+            rejected.append({'question_id': question_id, 'stored_version': answer.client_version})
+            continue
+        else:
+            answer.answer_content = item['answer_content']
+            answer.submitted_at = submitted_at
+            if client_version is not None:
+                answer.client_version = client_version
+        saved.append(question_id)
+    return saved, rejected
+
+
+@exams_bp.route('/student/save_answers', methods=['POST'])
+@login_required
+def save_answers():
+    """
+    批量保存同一答卷的多道题答案（AJAX）
+
+    请求体: {"score_id": 1, "answers": [{"question_id": 2, "answer_content": "...", "client_version": 3}, ...]}
+    client_version为客户端对每道题递增的版本号，小于数据库中已保存版本的答案会被拒绝，
+    避免乱序到达的旧请求覆盖新答案。所有答案用一条INSERT ... ON CONFLICT语句写入，
+    版本比较在数据库中完成，rejected是这条语句实际没有写入的题目。
+    """
+    if not current_user.is_student():
+        return jsonify({'success': False, 'message': '权限不足'}), 403
+
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'success': False, 'message': '无效请求'}), 400
+
+        score_id = data.get('score_id')
+        answers = data.get('answers')
+        if not score_id or not isinstance(answers, list) or not answers:
+            return jsonify({'success': False, 'message': '参数不完整'}), 400
+
+        # 检查得分记录是否存在且属于当前用户（整批只检查一次）
+        score = Score.query.get_or_404(score_id)
+        if score.student_id != current_user.id:
+            return jsonify({'success': False, 'message': '权限不足'}), 403
+        if score.is_final_submit:
+            return jsonify({'success': False, 'message': '考试已提交，无法修改答案'}), 403
+
+        # 检查考试是否在进行中 - 使用北京时间
+        exam = Exam.query.get_or_404(score.exam_id)
+        now_local = datetime.utcnow() + timedelta(hours=8)  # UTC+8
+        if now_local > exam.end_time or now_local < exam.start_time:
+            return jsonify({'success': False, 'message': '考试时间已过或未开始'}), 403
+
+        # 同一题目在一批中出现多次时只保留版本最新的一次
+        latest = {}
+        for item in answers:
+            if not isinstance(item, dict) or not item.get('question_id'):
+                return jsonify({'success': False, 'message': '答案格式错误'}), 400
+            try:
+                question_id = int(item['question_id'])
+                client_version = item.get('client_version')
+                client_version = int(client_version) if client_version is not None else None
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': '题目ID或版本号格式错误'}), 400
+            previous = latest.get(question_id)
+            if previous is None or (client_version or 0) >= (previous['client_version'] or 0):
+                latest[question_id] = {'answer_content': item.get('answer_content'),
+                                       'client_version': client_version}
+
+        # 题目必须属于该学生的试卷，题型从考试快照中读取
+        snapshot = get_exam_snapshot(exam.id)
+        variant = snapshot.variant(score) if snapshot is not None else None
+        missing = [qid for qid in latest if variant is None or not variant.has_question(qid)]
+        if missing:
+            return jsonify({'success': False, 'message': f'题目不属于本场考试: {missing}'}), 400
+
+        for question_id, item in latest.items():
+            if snapshot.question_map[question_id]['question']['question_type'] == 'choice':
+                try:
+                    item['answer_content'] = normalize_choice_answer(item['answer_content'])
+                except json.JSONDecodeError as e:
+                    return jsonify({'success': False,
+                                    'message': f'题目{question_id}的选择题答案格式错误: {str(e)}'}), 400
+
+        # 先写入单题保存留在缓冲中的答案，再以数据库中的版本为准
+        answer_buffer.flush(score.id)
+
+        submitted_at = datetime.utcnow()
+        written = upsert_answers([{
+            'score_id': score.id,
+            'question_id': question_id,
+            'answer_content': item['answer_content'],
+            'client_version': item['client_version'],
+            'submitted_at': submitted_at,
+        } for question_id, item in latest.items()])
+
+        if written is None:
+            saved, rejected = _save_answers_orm(score.id, latest, submitted_at)
+        else:
+            saved = [question_id for question_id in latest if (score.id, question_id) in written]
+            not_written = [question_id for question_id in latest if (score.id, question_id) not in written]
+            stored_versions = dict(db.session.query(StudentAnswer.question_id, StudentAnswer.client_version).filter(
+                StudentAnswer.score_id == score.id,
+                StudentAnswer.question_id.in_(not_written)
+            ).all()) if not_written else {}
+            rejected = [{'question_id': question_id, 'stored_version': stored_versions.get(question_id)}
+                        for question_id in not_written]
 
         db.session.commit()
+        current_app.logger.debug(f"批量保存答案: score_id={score.id}, 保存{len(saved)}, 拒绝{len(rejected)}")
 
         return jsonify({
             'success': True,
-            'message': '答案已保存',
+            'message': f'已保存{len(saved)}道题的答案',
+            'saved': saved,
+            'rejected': rejected,
             'saved_at': now_local.strftime('%Y-%m-%d %H:%M:%S')  # 返回北京时间
         })
 
     except Exception as e:
-        current_app.logger.error(f"保存答案时发生错误: {str(e)}")
+        current_app.logger.error(f"批量保存答案时发生错误: {str(e)}")
         db.session.rollback()
-        return jsonify({'success': False, 'message': f'保存答案失败: {str(e)}'}), 500
+        return jsonify({'success': False, 'message': f'批量保存答案失败: {str(e)}'}), 500
+
+
+# 运行代码的超时时间(秒)；R开始执行后超过该时间加上余量仍未完成的运行视为中断
+RUN_CODE_TIMEOUT = 5
+RUN_CODE_STALE_SECONDS = 60
 
 
 @exams_bp.route('/student/run_code', methods=['POST'])
 @login_required
 def run_code():
-    """仅运行R代码并返回输出，不进行评分"""
+    """
+    仅运行R代码，不进行评分
+
+    R在共享沙箱事件循环中执行，请求只登记运行并立即返回run_id（202），
+    不在R运行期间占用Web工作线程；客户端轮询 /student/run_code/<run_id> 获取输出。
+    """
     if not current_user.is_student():
         return jsonify({'success': False, 'message': '权限不足'}), 403
 
     try:
         from utils.sandbox import RCodeSandbox
+        from utils.code_runs import start_run
 
         data = request.get_json()
         if not data:
@@ -425,7 +573,7 @@ def run_code():
         code = data.get('code', '')
 
         # 创建安全的沙箱环境
-        sandbox = RCodeSandbox(timeout=5)  # 限制运行时间为5秒
+        sandbox = RCodeSandbox(timeout=RUN_CODE_TIMEOUT)  # 限制运行时间为5秒
 
         # 简单运行代码，捕获输出
         test_code = """
@@ -459,12 +607,14 @@ def run_code():
         )
         """
 
-        result = sandbox.execute(code, test_code)
+        run_id = start_run(current_user.id,
+                           lambda on_start: sandbox.execute_async(code, test_code, on_start=on_start))
 
         return jsonify({
             'success': True,
-            'output': result.get('output', '')
-        })
+            'run_id': run_id,
+            'status_url': url_for('exams.run_code_result', run_id=run_id)
+        }), 202
     except Exception as e:
         current_app.logger.error(f"运行代码失败: {str(e)}")
         return jsonify({
@@ -473,6 +623,33 @@ def run_code():
         })
 
 
+@exams_bp.route('/student/run_code/<run_id>')
+@login_required
+def run_code_result(run_id):
+    """
+    查询运行代码的结果（AJAX轮询），done为False时稍后再查询
+
+    排队等待R并发名额的运行返回queued为True，不会因为排队时间长被判为中断。
+    """
+    from utils.code_runs import get_run, is_interrupted, STATUS_DONE, STATUS_QUEUED
+
+    run = get_run(run_id, current_user.id)
+    if run is None:
+        return jsonify({'success': False, 'message': '运行记录不存在'}), 404
+
+    if run['status'] != STATUS_DONE:
+        if is_interrupted(run, RUN_CODE_TIMEOUT + RUN_CODE_STALE_SECONDS):
+            return jsonify({'success': False, 'done': True, 'output': '执行错误: 运行已中断，请重新运行'})
+        return jsonify({'success': True, 'done': False, 'queued': run['status'] == STATUS_QUEUED})
+
+    result = run.get('result') or {}
+    return jsonify({
+        'success': True,
+        'done': True,
+        'output': result.get('output', '')
+    })
+
+
 @exams_bp.route('/student/submit_exam/<int:exam_id>', methods=['POST'])
 @login_required
 def submit_exam(exam_id):
@@ -490,45 +667,25 @@ def submit_exam(exam_id):
         exam_id=exam_id
     ).first_or_404()
 
+    # 交卷前写入缓冲中的答案
+    answer_buffer.flush(score.id)
+
     # 标记为已提交
     score.is_graded = False  # 暂时设为False，等待完全评分
     score.submit_time = datetime.utcnow()
 
     # 设置为最终提交
     score.is_final_submit = True
+    db.session.commit()
 
     try:
-        # 使用自动评分系统评分选择题和填空题
-        grader = AutoGrader(score.id)
-        results = grader.grade_all()
-
-        # 添加：自动评分编程题
-        auto_grade_programming_questions(score)
-
-        # 更新数据库
-        db.session.commit()
-
-        # 重新计算总分
-        total_points = db.session.query(db.func.sum(StudentAnswer.points_earned)).filter(
-            StudentAnswer.score_id == score.id
-        ).scalar() or 0
-
-        score.total_score = total_points
-        db.session.commit()
-
-        # 记录评分结果
-        current_app.logger.info(f"自动评分结果: {results}")
-
-        # 更新Flash消息，包含评分信息
-        flash_message = f'考试已提交，自动评分完成！共计得分: {score.total_score}/{results["max_points"]}分。'
-
-        flash(flash_message, 'success')
+        # 评分在后台工作进程中执行，提交请求立即返回
+        enqueue_grading_job(score.id, requested_by=current_user.id)
+        flash('考试已提交，系统正在自动评分，请稍候查看成绩。', 'success')
     except Exception as e:
-        current_app.logger.error(f"自动评分过程出错: {str(e)}")
-        flash('考试已提交，但自动评分过程出错，请联系教师。', 'warning')
-        # 确保事务可以继续，不会因为评分错误而阻止提交
-
-    db.session.commit()
+        current_app.logger.error(f"评分任务入队失败: {str(e)}")
+        db.session.rollback()
+        flash('考试已提交，但自动评分任务创建失败，请联系教师。', 'warning')
 
     return redirect(url_for('exams.view_result', exam_id=exam_id))
 
@@ -550,215 +707,125 @@ def view_result(exam_id):
         exam_id=exam_id
     ).first_or_404()
 
-    # 获取所有答题记录
-    student_answers = StudentAnswer.query.filter_by(score_id=score.id).all()
-
-    # 获取考试题目
-    exam_questions = ExamQuestion.query.filter_by(exam_id=exam_id).order_by(ExamQuestion.order).all()
-
-    # 创建题目和答案的映射
-    question_answers = {}
-    for eq in exam_questions:
-        question = eq.question
-        answer = next((a for a in student_answers if a.question_id == question.id), None)
-        question_answers[question.id] = {
-            'question': question,
-            'exam_question': eq,
-            'answer': answer
-        }
+    # 创建题目和答案的映射（包括缓冲中尚未写入的答案）
+    question_answers = build_question_answers(score)
 
     return render_template('exams/view_result.html',
                            exam=exam,
                            score=score,
-                           question_answers=question_answers)
+                           question_answers=question_answers,
+                           grading_job=get_latest_job(score.id))
+
+
+@exams_bp.route('/grading_status/<int:score_id>')
+@login_required
+def grading_status(score_id):
+    """查询评分任务状态（AJAX，供结果页轮询）"""
+    score = Score.query.get(score_id)
+    if not score:
+        return jsonify({'error': '考试记录不存在', 'message': f'找不到ID为{score_id}的考试记录'}), 404
+
+    # 学生只能查询自己的记录
+    if current_user.is_student() and score.student_id != current_user.id:
+        return jsonify({'error': '权限不足', 'message': '无权查看该评分状态'}), 403
+
+    job = get_latest_job(score_id)
+    return jsonify({
+        'score_id': score.id,
+        'is_graded': score.is_graded,
+        'total_score': score.total_score,
+        'job': job.to_dict() if job else None
+    })
+
+
+def get_exam_time_status(exam, now_local=None):
+    """
+    计算考试的时间状态
+
+    Args:
+        exam: 考试快照中的考试信息dict
+        now_local: 当前北京时间，默认取当前时间
+
+    Returns:
+        dict: remaining_seconds、status(not_started/in_progress/ended)以及时间字符串
+    """
+    if now_local is None:
+        now_local = datetime.utcnow() + timedelta(hours=8)  # UTC+8
+
+    # 计算剩余时间 - 使用北京时间与考试时间比较
+    if now_local > exam['end_time']:
+        remaining_seconds = 0
+        status = 'ended'
+    elif now_local < exam['start_time']:
+        remaining_seconds = int((exam['start_time'] - now_local).total_seconds())
+        status = 'not_started'
+    else:
+        remaining_seconds = int((exam['end_time'] - now_local).total_seconds())
+        status = 'in_progress'
+
+    return {
+        'remaining_seconds': remaining_seconds,
+        'status': status,
+        'current_time': now_local.strftime('%Y-%m-%d %H:%M:%S'),
+        'start_time': exam['start_time'].strftime('%Y-%m-%d %H:%M:%S'),
+        'end_time': exam['end_time'].strftime('%Y-%m-%d %H:%M:%S'),
+        'server_timestamp': int(now_local.timestamp())
+    }
 
 
 @exams_bp.route('/student/check_time/<int:exam_id>')
 @login_required
 def check_time(exam_id):
-    """检查考试剩余时间（AJAX）"""
+    """检查考试剩余时间（AJAX），考试时间来自进程内的考试快照，不查询数据库"""
     try:
         if not current_user.is_student():
             return jsonify({'error': '权限不足', 'message': '只有学生可以访问此API'}), 403
 
-        # 获取考试信息
-        exam = Exam.query.get(exam_id)
-        if not exam:
+        # 获取考试快照（修改考试后自动失效）
+        snapshot = get_exam_snapshot(exam_id)
+        if snapshot is None:
             return jsonify({'error': '考试不存在', 'message': f'找不到ID为{exam_id}的考试'}), 404
 
-        # 获取当前时间并转换为北京时间
-        now_utc = datetime.utcnow()
-        now_local = now_utc + timedelta(hours=8)  # UTC+8
-
-        current_app.logger.debug(
-            f"【时间检查】当前UTC时间: {now_utc.strftime('%Y-%m-%d %H:%M:%S')}, "
-            f"当前北京时间: {now_local.strftime('%Y-%m-%d %H:%M:%S')}, "
-            f"考试开始时间: {exam.start_time.strftime('%Y-%m-%d %H:%M:%S')}, "
-            f"结束时间: {exam.end_time.strftime('%Y-%m-%d %H:%M:%S')}"
-        )
-
-        # 计算剩余时间 - 使用北京时间与考试时间比较
-        if now_local > exam.end_time:
-            remaining_seconds = 0
-            status = 'ended'
-            current_app.logger.debug("【时间检查】考试已结束")
-        elif now_local < exam.start_time:
-            remaining_seconds = int((exam.start_time - now_local).total_seconds())
-            status = 'not_started'
-            current_app.logger.debug(f"【时间检查】考试未开始，还有 {remaining_seconds} 秒")
-        else:
-            remaining_seconds = int((exam.end_time - now_local).total_seconds())
-            status = 'in_progress'
-            current_app.logger.debug(f"【时间检查】考试进行中，剩余 {remaining_seconds} 秒")
-
-        result = {
-            'remaining_seconds': remaining_seconds,
-            'status': status,
-            'current_time': now_local.strftime('%Y-%m-%d %H:%M:%S'),
-            'start_time': exam.start_time.strftime('%Y-%m-%d %H:%M:%S'),
-            'end_time': exam.end_time.strftime('%Y-%m-%d %H:%M:%S'),
-            'server_timestamp': int(now_local.timestamp())
-        }
-
-        return jsonify(result)
+        return jsonify(get_exam_time_status(snapshot.exam))
     except Exception as e:
         # 记录错误到日志
         current_app.logger.error(f"检查考试时间时出错: {str(e)}")
         return jsonify({'error': '服务器错误', 'message': f'检查考试时间时发生错误: {str(e)}'}), 500
 
 
-def auto_grade_choice_questions(score):
-    """自动评分选择题"""
-    # 获取所有选择题答案
-    student_answers = StudentAnswer.query.join(
-        Question, StudentAnswer.question_id == Question.id
-    ).filter(
-        StudentAnswer.score_id == score.id,
-        Question.question_type == 'choice'
-    ).all()
-
-    total_points = 0
-
-    for answer in student_answers:
-        question = Question.query.get(answer.question_id)
-        exam_question = ExamQuestion.query.filter_by(
-            exam_id=score.exam_id,
-            question_id=question.id
-        ).first()
-
-        if not exam_question:
-            continue
-
-        # 获取题目分值
-        question_score = exam_question.score
-
-        # 解析学生答案（选项ID列表）
-        try:
-            selected_options = json.loads(answer.answer_content)
-        except:
-            selected_options = []
-
-        # 获取正确选项
-        correct_options = [opt.id for opt in question.correct_options]
-
-        # 如果答案完全一致，得满分
-        if set(selected_options) == set(correct_options):
-            answer.points_earned = question_score
-        else:
-            answer.points_earned = 0
-
-        total_points += answer.points_earned
-
-    # 更新总分
-    score.total_score = total_points
-
-
-def auto_grade_programming_questions(score):
-    """自动评分编程题（R语言）"""
-    # 导入沙箱
-    from utils.sandbox import RCodeSandbox
-
-    # 获取所有编程题答案
-    student_answers = StudentAnswer.query.join(
-        Question, StudentAnswer.question_id == Question.id
-    ).filter(
-        StudentAnswer.score_id == score.id,
-        Question.question_type == 'programming'
-    ).all()
-
-    for answer in student_answers:
-        question = Question.query.get(answer.question_id)
-        exam_question = ExamQuestion.query.filter_by(
-            exam_id=score.exam_id,
-            question_id=question.id
-        ).first()
-
-        if not exam_question or not question.test_code:
-            continue
-
-        # 获取题目分值
-        question_score = exam_question.score
-
-        # 获取学生代码和测试代码
-        student_code = answer.answer_content or ""
-        test_code = question.test_code
-
-        # 检查题目是否指定了所需R包
-        required_packages = []
-        if hasattr(question, 'required_packages') and question.required_packages:
-            required_packages = question.required_packages.split(',')
-
-        try:
-            # 创建沙箱并执行评分
-            sandbox = RCodeSandbox(
-                timeout=30,  # 设置超时时间（秒）
-                memory_limit=500,  # 内存限制（MB）
-                required_packages=required_packages  # 所需R包
-            )
+@exams_bp.route('/student/time_stream/<int:exam_id>')
+@login_required
+def time_stream(exam_id):
+    """
+    考试剩余时间的Server-Sent Events推送
+
+    每个连接只推送一个事件就关闭：进行中推送time事件，考试结束时推送ended事件。
+    响应中的retry字段让浏览器的EventSource在EXAM_TIME_STREAM_INTERVAL秒后（考试即将结束时在结束时刻）
+    自动重连，所以不需要异步/gevent工作进程，一个连接只占用工作线程读取一次考试快照的时间。
+    EventSource不可用或彻底失败时，客户端改为轮询check_time。
+    """
+    if not current_user.is_student():
+        return jsonify({'error': '权限不足', 'message': '只有学生可以访问此API'}), 403
 
-            # 执行评分
-            result = sandbox.execute(student_code, test_code)
-
-            # 计算得分
-            if result['status'] == 'success':
-                # 将得分标准化为题目满分
-                score_ratio = min(1.0, max(0.0, float(result.get('score', 0)) / float(result.get('max_score', 100))))
-                answer.points_earned = round(question_score * score_ratio, 2)
-                answer.feedback = result.get('message', '自动评分完成')
-
-                # 如果有详细输出，添加到反馈中
-                if 'output' in result and result['output']:
-                    # 截断过长输出，避免数据库问题
-                    output = result['output']
-                    if len(output) > 5000:
-                        output = output[:5000] + "...(输出过长，已截断)"
-
-                    answer.feedback += f"\n\n程序输出:\n{output}"
-            else:
-                answer.points_earned = 0
-                answer.feedback = result.get('message', '评分错误')
-
-                # 添加错误输出
-                if 'output' in result and result['output']:
-                    output = result['output']
-                    if len(output) > 5000:
-                        output = output[:5000] + "...(输出过长，已截断)"
-
-                    answer.feedback += f"\n\n程序输出:\n{output}"
-        except Exception as e:
-            answer.points_earned = 0
-            answer.feedback = f"评分过程出错: {str(e)}"
-            current_app.logger.error(f"编程题评分出错: {str(e)}")
-
-    # 保存结果
-    db.session.commit()
+    snapshot = get_exam_snapshot(exam_id)
+    if snapshot is None:
+        return jsonify({'error': '考试不存在', 'message': f'找不到ID为{exam_id}的考试'}), 404
 
-    # 计算总得分
-    total_points = db.session.query(db.func.sum(StudentAnswer.points_earned)).filter(
-        StudentAnswer.score_id == score.id
-    ).scalar() or 0
+    status = get_exam_time_status(snapshot.exam)
+    if status['status'] == 'ended':
+        body = f'event: ended\ndata: {json.dumps(status)}\n\n'
+    else:
+        # 考试即将结束时在结束时刻重连，不等满一个间隔
+        wait = current_app.config.get('EXAM_TIME_STREAM_INTERVAL', 15)
+        if status['status'] == 'in_progress':
+            wait = max(1, min(wait, status['remaining_seconds'] + 1))
+        body = f'retry: {int(wait * 1000)}\nevent: time\ndata: {json.dumps(status)}\n\n'
 
-    score.total_score = total_points
+    response = Response(body, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # 关闭反向代理(nginx)的响应缓冲
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @exams_bp.route('/admin/grade_exam/<int:score_id>', methods=['POST'])
@@ -774,28 +841,15 @@ def admin_grade_exam(score_id):
     score = Score.query.get_or_404(score_id)
 
     try:
-        # 使用自动评分系统评分
-        grader = AutoGrader(score.id)
-        results = grader.grade_all()
-
-        # 添加：自动评分编程题
-        auto_grade_programming_questions(score)
-
-        # 更新数据库
-        db.session.commit()
-
-        # 重新计算总分
-        total_points = db.session.query(db.func.sum(StudentAnswer.points_earned)).filter(
-            StudentAnswer.score_id == score.id
-        ).scalar() or 0
-
-        score.total_score = total_points
-        db.session.commit()
+        # 评分可能在独立的工作进程中执行，先写入本进程缓冲中的答案
+        answer_buffer.flush(score.id)
 
-        flash(f'自动评分完成！学生得分: {score.total_score}/{results["max_points"]}', 'success')
+        # 加入评分队列，由后台工作进程执行
+        job = enqueue_grading_job(score.id, requested_by=current_user.id)
+        flash(f'已加入自动评分队列（任务 #{job.id}），评分完成后刷新页面查看结果。', 'success')
     except Exception as e:
         db.session.rollback()
-        flash(f'自动评分失败: {str(e)}', 'danger')
+        flash(f'自动评分任务创建失败: {str(e)}', 'danger')
 
     # 重定向回学生考试结果页面
-    return redirect(url_for('exams.teacher_view_result', score_id=score.id))
\ No newline at end of file
+    return redirect(url_for('exams.teacher_view_student_result', score_id=score.id))
@@ -1,32 +1,45 @@
 # 自动评分系统主模块
 from flask import current_app
 import json
-from models.question import Question
-from models.exam_question import ExamQuestion
+from concurrent.futures import ThreadPoolExecutor
 from models.student_answer import StudentAnswer
 from models.score import Score
 from grading.choice_grader import ChoiceGrader
 from grading.fill_blank_grader import FillBlankGrader
 from grading.programming_grader import ProgrammingGrader
+from grading.context import GradingContext
+from utils.metrics import timed_question
 
 
 class AutoGrader:
     """自动评分系统的主类"""
 
-    def __init__(self, score_id):
+    def __init__(self, score_id, concurrent=None, max_workers=None, context=None):
         """
         初始化评分器
 
         Args:
             score_id: 学生考试得分记录的ID
+            concurrent: 是否并发评分编程题，默认读取配置GRADING_CONCURRENT
+            max_workers: 并发评分的最大线程数，默认读取配置GRADING_MAX_WORKERS
+            context: GradingContext，批量评分同一考试时可共享，默认按考试新建
         """
         self.score_id = score_id
+        if concurrent is None:
+            concurrent = current_app.config.get('GRADING_CONCURRENT', True)
+        if max_workers is None:
+            max_workers = current_app.config.get('GRADING_MAX_WORKERS', 4)
+        self.max_workers = max(1, int(max_workers))
+        self.concurrent = concurrent and self.max_workers > 1
         self.score = Score.query.get(score_id)
         # 添加编程题评分器
         self.programming_grader = ProgrammingGrader()
         if not self.score:
             raise ValueError(f"无法找到ID为{score_id}的得分记录")
 
+        # 预加载考试题目、分值和正确选项
+        self.context = context or GradingContext(self.score.exam_id)
+
         # 初始化各类型题目的评分器
         self.choice_grader = ChoiceGrader()
         self.fill_blank_grader = FillBlankGrader()
@@ -58,45 +71,38 @@ class AutoGrader:
             }
         }
 
-        # 逐个评分
+        # 收集需要评分的答案（题目和分值均从预加载的上下文中读取）
+        gradable = []
         for answer in student_answers:
-            question = Question.query.get(answer.question_id)
-            if not question:
-                current_app.logger.warning(f"无法找到问题ID为{answer.question_id}的题目")
+            question = self.context.get_question(answer.question_id)
+            if not question or not self.context.in_variant(self.score, answer.question_id):
+                current_app.logger.warning(f"题目{answer.question_id}不属于考试{self.score.exam_id}或该学生的试卷")
                 continue
 
-            # 获取题目在考试中的分值
-            exam_question = ExamQuestion.query.filter_by(
-                exam_id=self.score.exam_id,
-                question_id=question.id
-            ).first()
+            gradable.append((answer, question, self.context.get_question_score(question.id)))
 
-            if not exam_question:
-                current_app.logger.warning(f"题目{question.id}不属于考试{self.score.exam_id}")
-                continue
+        # 评分，得到每个答案的得分（None表示未知题型）
+        if self.concurrent:
+            points_list = self._grade_concurrently(gradable)
+        else:
+            points_list = [self._grade_one(answer, question, question_score)
+                           for answer, question, question_score in gradable]
 
-            question_score = exam_question.score
+        # 按答案顺序统计，保证与逐个评分的结果完全一致
+        for (answer, question, question_score), points in zip(gradable, points_list):
             results['total'] += 1
             results['max_points'] += question_score
-            results['by_type'][question.question_type]['count'] += 1
-            results['by_type'][question.question_type]['max'] += question_score
-
-            # 根据题目类型选择评分器
-            if question.question_type == 'choice':
-                points = self.grade_choice_question(answer, question, question_score)
-            elif question.question_type == 'fill_blank':
-                points = self.grade_fill_blank_question(answer, question, question_score)
-            elif question.question_type == 'programming':
-                # 使用编程题评分器
-                points = self.grade_programming_question(answer, question, question_score)
-            else:
-                # 未知题型
-                current_app.logger.warning(f"未知题型: {question.question_type}")
+            # 未知题型也计入统计，不中断评分
+            by_type = results['by_type'].setdefault(question.question_type, {'count': 0, 'points': 0, 'max': 0})
+            by_type['count'] += 1
+            by_type['max'] += question_score
+
+            if points is None:
                 continue
 
             results['graded'] += 1
             results['points_earned'] += points
-            results['by_type'][question.question_type]['points'] += points
+            by_type['points'] += points
 
         # 更新总分
         self.score.total_score = results['points_earned']
@@ -107,9 +113,65 @@ class AutoGrader:
 
         return results
 
+    def _grade_one(self, answer, question, question_score):
+        """根据题目类型选择评分器，未知题型返回None"""
+        with timed_question(question.id, question.question_type):
+            return self._dispatch(answer, question, question_score)
+
+    def _dispatch(self, answer, question, question_score):
+        if question.question_type == 'choice':
+            return self.grade_choice_question(answer, question, question_score)
+        elif question.question_type == 'fill_blank':
+            return self.grade_fill_blank_question(answer, question, question_score)
+        elif question.question_type == 'programming':
+            # 使用编程题评分器
+            return self.grade_programming_question(answer, question, question_score)
+        else:
+            # 未知题型
+            current_app.logger.warning(f"未知题型: {question.question_type}")
+            return None
+
+    def _grade_concurrently(self, gradable):
+        """
+        选择题和填空题直接评分，编程题提交到线程池并发执行R代码，
+        工作线程只处理纯数据，结果回到当前线程后再写入ORM对象
+        """
+        points_list = [None] * len(gradable)
+        futures = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='grader') as executor:
+            for index, (answer, question, question_score) in enumerate(gradable):
+                if question.question_type == 'programming':
+                    futures[index] = executor.submit(
+                        self._evaluate_programming,
+                        answer.answer_content,
+                        question.test_code,
+                        question_score,
+                        question.id,
+                        question.updated_at
+                    )
+                else:
+                    points_list[index] = self._grade_one(answer, question, question_score)
+
+            for index, future in futures.items():
+                answer = gradable[index][0]
+                points, feedback = future.result()
+                answer.points_earned = points
+                answer.feedback = feedback
+                points_list[index] = points
+
+        return points_list
+
+    def _evaluate_programming(self, answer_content, test_code, max_points, question_id, question_version):
+        """在工作线程中评分编程题并记录耗时"""
+        with timed_question(question_id, 'programming'):
+            return self.programming_grader.evaluate(answer_content, test_code, max_points, question_id,
+                                                    question_version)
+
     def grade_choice_question(self, answer, question, max_points):
         """评分选择题"""
-        return self.choice_grader.grade(answer, question, max_points)
+        return self.choice_grader.grade(answer, question, max_points,
+                                        correct_option_ids=self.context.get_correct_option_ids(question.id))
 
     def grade_fill_blank_question(self, answer, question, max_points):
         """评分填空题"""
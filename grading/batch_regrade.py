@@ -0,0 +1,169 @@
+# 整场考试批量重新评分
+import time
+import logging
+from types import SimpleNamespace
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import or_
+from models.db import db
+from models.score import Score
+from models.student_answer import StudentAnswer
+from grading.context import GradingContext
+from grading.choice_grader import ChoiceGrader
+from grading.fill_blank_grader import FillBlankGrader
+from grading.programming_grader import ProgrammingGrader
+from utils.metrics import timed_question, registry as metrics_registry
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('batch_regrade')
+
+
+def _evaluate_programming(grader, answer_content, test_code, max_points, question_id, question_version):
+    """在工作线程中评分编程题并记录耗时"""
+    with timed_question(question_id, 'programming'):
+        return grader.evaluate(answer_content, test_code, max_points, question_id, question_version)
+
+
+def regrade_exam(exam_id, max_workers=None, progress_callback=None):
+    """
+    重新评分一场考试的全部已提交答卷
+
+    按题目分组评分，所有答卷共用同一份预加载的题目数据；编程题提交到线程池并发执行，
+    全部评完后用批量UPDATE写回答案得分和答卷总分。
+
+    Args:
+        exam_id: 考试ID
+        max_workers: 编程题并发线程数，默认读取配置GRADING_MAX_WORKERS
+        progress_callback: 每评完一道题调用一次，参数为当前进度dict
+
+    Returns:
+        dict: 评分报告，包含答卷数、答案数、各题耗时和总耗时
+    """
+    started = time.perf_counter()
+    if max_workers is None:
+        max_workers = current_app.config.get('GRADING_MAX_WORKERS', 4)
+
+    context = GradingContext(exam_id)
+
+    # 已提交的答卷及其个性化试卷
+    scores = db.session.query(Score.id, Score.student_id, Score.variant).filter(
+        Score.exam_id == exam_id,
+        or_(Score.is_final_submit == True, Score.is_graded == True)
+    ).all()
+    score_ids = [row.id for row in scores]
+    variants = {row.id: context.variant(row) for row in scores}
+
+    # 全部答案按题目分组，只取评分需要的列；不属于学生试卷的答案计0分
+    answers_by_question = defaultdict(list)
+    answer_count = 0
+    updates = []
+    if score_ids:
+        rows = db.session.query(
+            StudentAnswer.id, StudentAnswer.score_id, StudentAnswer.question_id, StudentAnswer.answer_content
+        ).filter(StudentAnswer.score_id.in_(score_ids)).all()
+        for row in rows:
+            if not variants[row.score_id].has_question(row.question_id):
+                updates.append({'id': row.id, 'points_earned': 0, 'feedback': None})
+                continue
+            answers_by_question[row.question_id].append(SimpleNamespace(
+                id=row.id,
+                score_id=row.score_id,
+                answer_content=row.answer_content,
+                points_earned=0,
+                feedback=None
+            ))
+            answer_count += 1
+
+    # 按考试题目顺序评分
+    question_order = context.question_order
+
+    report = {
+        'exam_id': exam_id,
+        'scores': len(score_ids),
+        'answers': answer_count,
+        'questions': [],
+        'completed_questions': 0,
+        'total_questions': len(question_order)
+    }
+    logger.info(f"开始批量重新评分: 考试{exam_id}, 答卷{len(score_ids)}份, 答案{answer_count}个")
+
+    choice_grader = ChoiceGrader()
+    fill_blank_grader = FillBlankGrader()
+    programming_grader = ProgrammingGrader()
+
+    ungraded_scores = set()
+
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix='regrade') as executor:
+        for question_id in question_order:
+            question = context.get_question(question_id)
+            answers = answers_by_question.get(question_id, [])
+            max_points = context.get_question_score(question_id)
+            question_started = time.perf_counter()
+
+            if question.question_type == 'choice':
+                correct_ids = context.get_correct_option_ids(question_id)
+                for answer in answers:
+                    with timed_question(question_id, 'choice'):
+                        choice_grader.grade(answer, question, max_points, correct_option_ids=correct_ids)
+            elif question.question_type == 'fill_blank':
+                # 整列答案一起评分，标准答案只编译一次；耗时平均记到每个答案
+                batch_started = time.perf_counter()
+                fill_blank_grader.grade_batch(answers, question, max_points)
+                per_answer = (time.perf_counter() - batch_started) / max(len(answers), 1)
+                for _ in answers:
+                    metrics_registry.observe_question(question_id, 'fill_blank', per_answer)
+            elif question.question_type == 'programming':
+                futures = [
+                    executor.submit(_evaluate_programming, programming_grader, answer.answer_content,
+                                    question.test_code, max_points, question_id, question.updated_at)
+                    for answer in answers
+                ]
+                for answer, future in zip(answers, futures):
+                    answer.points_earned, answer.feedback = future.result()
+            else:
+                logger.warning(f"未知题型: {question.question_type}")
+                ungraded_scores.update(answer.score_id for answer in answers)
+                answers = []
+
+            updates.extend({
+                'id': answer.id,
+                'points_earned': answer.points_earned,
+                'feedback': answer.feedback
+            } for answer in answers)
+
+            elapsed = round(time.perf_counter() - question_started, 3)
+            report['questions'].append({
+                'question_id': question_id,
+                'question_type': question.question_type,
+                'answers': len(answers),
+                'seconds': elapsed
+            })
+            report['completed_questions'] += 1
+            logger.info(f"题目{question_id}({question.question_type})评分完成: "
+                        f"{len(answers)}个答案, 耗时{elapsed}秒 "
+                        f"[{report['completed_questions']}/{report['total_questions']}]")
+            if progress_callback:
+                progress_callback(report)
+
+    # 批量写回答案得分
+    if updates:
+        db.session.bulk_update_mappings(StudentAnswer, updates)
+
+    # 重新计算每份答卷的总分，一次分组查询
+    if score_ids:
+        totals = dict(db.session.query(
+            StudentAnswer.score_id, db.func.sum(StudentAnswer.points_earned)
+        ).filter(StudentAnswer.score_id.in_(score_ids)).group_by(StudentAnswer.score_id).all())
+        db.session.bulk_update_mappings(Score, [{
+            'id': score_id,
+            'total_score': totals.get(score_id) or 0,
+            'is_graded': score_id not in ungraded_scores
+        } for score_id in score_ids])
+
+    db.session.commit()
+
+    report['total_seconds'] = round(time.perf_counter() - started, 3)
+    logger.info(f"批量重新评分完成: 考试{exam_id}, 耗时{report['total_seconds']}秒")
+    return report
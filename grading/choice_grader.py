@@ -17,7 +17,7 @@ class ChoiceGrader:
         self.partial_credit = partial_credit
         self.partial_threshold = partial_threshold
 
-    def grade(self, answer, question, max_points):
+    def grade(self, answer, question, max_points, correct_option_ids=None):
         """
         评分选择题
 
@@ -25,6 +25,7 @@ class ChoiceGrader:
             answer: StudentAnswer对象，学生的答案
             question: Question对象，题目
             max_points: 题目的最大分值
+            correct_option_ids: 预加载的正确选项ID集合，未提供时从题目选项中查询
 
         Returns:
             float: 得分
@@ -48,7 +49,10 @@ class ChoiceGrader:
                 raise ValueError("选项格式无效")
 
             # 获取正确选项ID列表
-            correct_options = [opt.id for opt in question.correct_options]
+            if correct_option_ids is not None:
+                correct_options = list(correct_option_ids)
+            else:
+                correct_options = [opt.id for opt in question.correct_options]
 
             # 计算正确率
             student_set = set(selected_options)
@@ -0,0 +1,89 @@
+# 评分上下文 - 批量预加载一场考试评分所需的数据，避免逐题查询
+from sqlalchemy.orm import joinedload
+from models.db import db
+from models.exam import Exam
+from models.exam_question import ExamQuestion
+from models.question_option import QuestionOption
+
+
+class GradingContext:
+    """
+    一场考试的评分数据快照
+
+    用少量批量查询加载考试的全部题目、各题分值和选择题正确选项，
+    之后评分器只读取内存中的映射，评分查询数与答案数量无关。
+    """
+
+    def __init__(self, exam_id):
+        """
+        Args:
+            exam_id: 考试ID
+        """
+        self.exam_id = exam_id
+        self.questions = {}  # question_id -> Question
+        self.question_scores = {}  # question_id -> 该题在考试中的分值
+        self.correct_options = {}  # question_id -> 正确选项ID集合
+        self.question_order = []  # 按考试顺序排列的题目ID
+        self.variant_plan = None  # 个性化试卷，用于判断题目是否属于某名学生的试卷
+        self._variants = {}  # score_id -> ExamVariant
+        self._load()
+
+    def _load(self):
+        # 延迟导入，避免与考试蓝图循环导入
+        from exams.exam_variants import VariantPlan
+
+        # 考试题目及题目本身，一次联表查询
+        exam_questions = ExamQuestion.query.options(
+            joinedload(ExamQuestion.question)
+        ).filter_by(exam_id=self.exam_id).order_by(ExamQuestion.order, ExamQuestion.id).all()
+
+        pools = []
+        for eq in exam_questions:
+            if eq.question is None:
+                continue
+            self.question_order.append(eq.question_id)
+            self.questions[eq.question_id] = eq.question
+            self.question_scores[eq.question_id] = eq.score
+            pools.append((eq.question_id, eq.pool))
+
+        # 评分只需要知道学生抽到了哪些题目，与选项顺序无关
+        exam = Exam.query.get(self.exam_id)
+        self.variant_plan = VariantPlan(
+            self.exam_id, exam.variant_seed if exam else None, pools,
+            shuffle_questions=exam.shuffle_questions if exam else False
+        )
+
+        # 选择题的正确选项，一次查询
+        choice_ids = [qid for qid, q in self.questions.items() if q.question_type == 'choice']
+        for qid in choice_ids:
+            self.correct_options[qid] = set()
+        if choice_ids:
+            rows = db.session.query(QuestionOption.question_id, QuestionOption.id).filter(
+                QuestionOption.question_id.in_(choice_ids),
+                QuestionOption.is_correct == True
+            ).all()
+            for question_id, option_id in rows:
+                self.correct_options[question_id].add(option_id)
+
+    def get_question(self, question_id):
+        """获取题目，不属于本考试时返回None"""
+        return self.questions.get(question_id)
+
+    def get_question_score(self, question_id):
+        """获取题目在本考试中的分值，不属于本考试时返回None"""
+        return self.question_scores.get(question_id)
+
+    def variant(self, score):
+        """答卷的个性化试卷（只解析或生成一次）"""
+        variant = self._variants.get(score.id)
+        if variant is None:
+            variant = self._variants[score.id] = self.variant_plan.resolve(score)
+        return variant
+
+    def in_variant(self, score, question_id):
+        """题目是否属于该答卷的试卷"""
+        return self.variant(score).has_question(question_id)
+
+    def get_correct_option_ids(self, question_id):
+        """获取选择题的正确选项ID集合"""
+        return self.correct_options.get(question_id, set())
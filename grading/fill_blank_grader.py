@@ -1,8 +1,94 @@
 # 填空题评分逻辑
 import re
+import threading
+from collections import Counter
 from flask import current_app
 from difflib import SequenceMatcher
 
+# 缓存的已编译标准答案上限，超过时清空
+MATCHER_CACHE_MAX_ENTRIES = 4096
+
+_matcher_cache = {}  # (标准答案, 是否区分大小写) -> AnswerMatcher
+_matcher_lock = threading.Lock()
+
+
+class AnswerMatcher:
+    """
+    一道题已编译的标准答案
+
+    标准答案只拆分、规范化一次；精确匹配是一次哈希查找，模糊匹配先用长度和字符计数
+    算出相似度上限，上限达不到阈值的备选答案不再运行SequenceMatcher。
+    """
+
+    __slots__ = ('alternatives', 'exact', 'case_sensitive')
+
+    def __init__(self, standard_answer, case_sensitive=False):
+        """
+        Args:
+            standard_answer: 标准答案，多个答案用分号分隔
+            case_sensitive: 是否区分大小写
+        """
+        self.case_sensitive = case_sensitive
+        # (原始答案, 规范化答案, 长度, 字符计数)，保持标准答案中的顺序
+        self.alternatives = []
+        self.exact = {}  # 规范化答案 -> 原始答案
+        for correct in (ans.strip() for ans in standard_answer.split(';')):
+            normalized = self.normalize(correct)
+            self.alternatives.append((correct, normalized, len(normalized), Counter(normalized)))
+            self.exact.setdefault(normalized, correct)
+
+    def normalize(self, value):
+        return value if self.case_sensitive else value.lower()
+
+    def best_match(self, student, threshold):
+        """
+        与规范化后的学生答案最相似的标准答案
+
+        只在相似度可能达到threshold并超过当前最佳值时才计算SequenceMatcher.ratio()，
+        结果与对每个备选答案都计算ratio()相同。
+
+        Args:
+            student: 规范化后的学生答案
+            threshold: 模糊匹配的相似度阈值
+
+        Returns:
+            tuple: (相似度, 原始标准答案)，没有达到阈值的答案时相似度为0
+        """
+        best, best_answer = 0, ''
+        length = len(student)
+        counts = None
+        for correct, normalized, standard_length, standard_counts in self.alternatives:
+            total = length + standard_length
+            if not total:
+                continue
+            floor = max(best, threshold)
+            # 长度上限，等同于SequenceMatcher.real_quick_ratio()
+            if 2.0 * min(length, standard_length) / total < floor:
+                continue
+            # 字符计数上限，等同于SequenceMatcher.quick_ratio()
+            if counts is None:
+                counts = Counter(student)
+            common = sum((counts & standard_counts).values())
+            if 2.0 * common / total < floor:
+                continue
+            similarity = SequenceMatcher(None, student, normalized).ratio()
+            if similarity > best:
+                best, best_answer = similarity, correct
+        return best, best_answer
+
+
+def get_matcher(standard_answer, case_sensitive=False):
+    """获取标准答案的已编译匹配器（按标准答案文本缓存，修改标准答案后自然重新编译）"""
+    key = (standard_answer, case_sensitive)
+    matcher = _matcher_cache.get(key)
+    if matcher is None:
+        matcher = AnswerMatcher(standard_answer, case_sensitive)
+        with _matcher_lock:
+            if len(_matcher_cache) >= MATCHER_CACHE_MAX_ENTRIES:
+                _matcher_cache.clear()
+            _matcher_cache[key] = matcher
+    return matcher
+
 
 class FillBlankGrader:
     """填空题评分器"""
@@ -38,57 +124,71 @@ class FillBlankGrader:
             answer.feedback = "未作答"
             return 0
 
-        # 学生答案(去除首尾空白)
-        student_answer = answer.answer_content.strip()
-
         # 获取标准答案(可能有多个，用分号分隔)
         if not question.standard_answer:
             answer.points_earned = 0
             answer.feedback = "题目缺少标准答案，请联系老师"
             return 0
 
-        # 分割多个标准答案
-        correct_answers = [ans.strip() for ans in question.standard_answer.split(';')]
+        matcher = get_matcher(question.standard_answer, self.case_sensitive)
+        answer.points_earned, answer.feedback = self._evaluate(matcher, answer.answer_content, max_points)
+        return answer.points_earned
 
-        # 精确匹配
-        for correct in correct_answers:
-            # 如果不区分大小写，转换为小写比较
-            if not self.case_sensitive:
-                if student_answer.lower() == correct.lower():
-                    answer.points_earned = max_points
-                    answer.feedback = "回答正确"
-                    return max_points
-            else:
-                if student_answer == correct:
-                    answer.points_earned = max_points
-                    answer.feedback = "回答正确"
-                    return max_points
+    def grade_batch(self, answers, question, max_points):
+        """
+        评分同一道填空题的一组答案
 
-        # 模糊匹配
-        if self.fuzzy_match:
-            best_match = 0
-            best_match_answer = ""
+        标准答案只编译一次，内容相同的答案只计算一次（同一个班级的答案大量重复）。
+
+        Args:
+            answers: StudentAnswer对象（或有answer_content、points_earned、feedback属性的对象）列表
+            question: Question对象，题目
+            max_points: 题目的最大分值
+
+        Returns:
+            list: 每个答案的得分
+        """
+        if not question.standard_answer:
+            for answer in answers:
+                self.grade(answer, question, max_points)
+            return [answer.points_earned for answer in answers]
+
+        matcher = get_matcher(question.standard_answer, self.case_sensitive)
+        results = {}  # 答案内容 -> (得分, 反馈)
+        for answer in answers:
+            content = answer.answer_content
+            if not content or not content.strip():
+                answer.points_earned = 0
+                answer.feedback = "未作答"
+                continue
+            result = results.get(content)
+            if result is None:
+                result = results[content] = self._evaluate(matcher, content, max_points)
+            answer.points_earned, answer.feedback = result
+        return [answer.points_earned for answer in answers]
+
+    def _evaluate(self, matcher, answer_content, max_points):
+        """
+        用已编译的标准答案评分一个非空答案
 
-            for correct in correct_answers:
-                # 如果不区分大小写，转换为小写比较
-                student = student_answer.lower() if not self.case_sensitive else student_answer
-                standard = correct.lower() if not self.case_sensitive else correct
+        Returns:
+            tuple: (得分, 反馈)
+        """
+        # 学生答案(去除首尾空白)
+        student = matcher.normalize(answer_content.strip())
 
-                # 计算相似度
-                similarity = SequenceMatcher(None, student, standard).ratio()
+        # 精确匹配
+        if student in matcher.exact:
+            return max_points, "回答正确"
 
-                if similarity > best_match:
-                    best_match = similarity
-                    best_match_answer = correct
+        # 模糊匹配
+        if self.fuzzy_match:
+            best_match, best_match_answer = matcher.best_match(student, self.fuzzy_threshold)
 
             # 如果相似度超过阈值，给予部分得分
             if best_match >= self.fuzzy_threshold:
                 points = max_points * best_match
-                answer.points_earned = round(points, 2)  # 保留两位小数
-                answer.feedback = f"接近正确答案 '{best_match_answer}'，相似度: {best_match:.2f}"
-                return answer.points_earned
+                return round(points, 2), f"接近正确答案 '{best_match_answer}'，相似度: {best_match:.2f}"  # 保留两位小数
 
         # 答案错误
-        answer.points_earned = 0
-        answer.feedback = "回答错误，请参考正确答案"
-        return 0
\ No newline at end of file
+        return 0, "回答错误，请参考正确答案"
@@ -0,0 +1,332 @@
+# 评分任务队列 - 以数据库表作为持久化队列，由本地后台工作线程/进程执行
+import json
+import time
+import logging
+import threading
+import traceback
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+from models.db import db
+from models.score import Score
+from models.student_answer import StudentAnswer
+from models.grading_job import (GradingJob, JOB_PENDING, JOB_RUNNING, JOB_SUCCESS, JOB_FAILED,
+                                JOB_TYPE_SCORE, JOB_TYPE_EXAM_REGRADE)
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('grading_queue')
+
+# 单个任务最多尝试次数
+MAX_ATTEMPTS = 3
+# 空闲时轮询间隔(秒)
+POLL_INTERVAL = 1.0
+# 任务租约时长(秒)：执行任务的工作进程每 LEASE_RENEW_INTERVAL 秒续期一次，
+# 租约过期说明工作进程已崩溃或被杀死，任务由其它工作进程重新放回队列
+LEASE_SECONDS = 120
+LEASE_RENEW_INTERVAL = 30
+# 工作循环中检查租约过期任务的间隔(秒)
+RECOVERY_INTERVAL = 60
+# 没有租约的运行中任务(升级前领取的任务)超过该时间未完成视为工作进程已崩溃
+STALE_JOB_MINUTES = 30
+
+
+def _lease_deadline():
+    return datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)
+
+
+def enqueue_grading_job(score_id, requested_by=None):
+    """
+    为得分记录创建评分任务，已有待执行或执行中的任务时直接返回该任务（同一份答卷不会同时评分两次）
+
+    Args:
+        score_id: 学生考试得分记录的ID
+        requested_by: 发起评分的用户ID
+
+    Returns:
+        GradingJob: 评分任务
+    """
+    job = GradingJob.query.filter(
+        GradingJob.job_type == JOB_TYPE_SCORE,
+        GradingJob.score_id == score_id,
+        GradingJob.status.in_([JOB_PENDING, JOB_RUNNING])
+    ).first()
+    if job:
+        return job
+
+    job = GradingJob(job_type=JOB_TYPE_SCORE, score_id=score_id, status=JOB_PENDING, requested_by=requested_by)
+    db.session.add(job)
+    db.session.commit()
+    logger.info(f"评分任务已入队: job={job.id}, score={score_id}")
+    return job
+
+
+def enqueue_exam_regrade_job(exam_id, requested_by=None):
+    """
+    为整场考试创建批量重新评分任务，已有未完成任务时直接返回该任务
+
+    Args:
+        exam_id: 考试ID
+        requested_by: 发起评分的用户ID
+
+    Returns:
+        GradingJob: 评分任务
+    """
+    job = GradingJob.query.filter(
+        GradingJob.job_type == JOB_TYPE_EXAM_REGRADE,
+        GradingJob.exam_id == exam_id,
+        GradingJob.status.in_([JOB_PENDING, JOB_RUNNING])
+    ).first()
+    if job:
+        return job
+
+    job = GradingJob(job_type=JOB_TYPE_EXAM_REGRADE, exam_id=exam_id, status=JOB_PENDING,
+                     requested_by=requested_by)
+    db.session.add(job)
+    db.session.commit()
+    logger.info(f"批量重新评分任务已入队: job={job.id}, exam={exam_id}")
+    return job
+
+
+def get_latest_job(score_id):
+    """获取得分记录最近的评分任务"""
+    return GradingJob.query.filter_by(job_type=JOB_TYPE_SCORE, score_id=score_id).order_by(
+        GradingJob.id.desc()).first()
+
+
+def get_latest_exam_regrade_job(exam_id):
+    """获取考试最近的批量重新评分任务"""
+    return GradingJob.query.filter_by(job_type=JOB_TYPE_EXAM_REGRADE, exam_id=exam_id).order_by(
+        GradingJob.id.desc()).first()
+
+
+def grade_score(score_id):
+    """
+    对一份答卷执行完整的自动评分并保存总分
+
+    Returns:
+        dict: AutoGrader的评分结果统计
+    """
+    # 延迟导入，避免与考试蓝图循环导入
+    from grading.auto_grader import AutoGrader
+    from exams.answer_buffer import answer_buffer
+
+    score = Score.query.get(score_id)
+    if not score:
+        raise ValueError(f"无法找到ID为{score_id}的得分记录")
+
+    # 评分前写入本进程缓冲中的答案
+    answer_buffer.flush(score.id)
+
+    # 编程题也在grade_all中评分（并发、常驻R进程池和结果缓存），不再逐个重新运行
+    grader = AutoGrader(score.id)
+    results = grader.grade_all()
+
+    db.session.commit()
+
+    # 重新计算总分
+    total_points = db.session.query(db.func.sum(StudentAnswer.points_earned)).filter(
+        StudentAnswer.score_id == score.id
+    ).scalar() or 0
+
+    score.total_score = total_points
+    db.session.commit()
+
+    return results
+
+
+def claim_next_job():
+    """
+    领取一个待执行任务，多个工作进程同时领取时只有一个会成功
+
+    Returns:
+        GradingJob或None
+    """
+    while True:
+        job = GradingJob.query.filter_by(status=JOB_PENDING).order_by(GradingJob.id).first()
+        if not job:
+            return None
+
+        claimed = GradingJob.query.filter_by(id=job.id, status=JOB_PENDING).update({
+            'status': JOB_RUNNING,
+            'started_at': datetime.utcnow(),
+            'lease_expires_at': _lease_deadline(),
+            'attempts': (job.attempts or 0) + 1
+        }, synchronize_session=False)
+        db.session.commit()
+
+        if claimed:
+            db.session.refresh(job)
+            return job
+
+
+def _held_lease(job_id, attempt):
+    """
+    本工作进程持有的租约：任务仍在运行，且尝试次数仍是领取时的值
+
+    每次领取都会增加attempts，所以它同时是租约的编号：任务被恢复后由其它工作进程重新领取时，
+    attempts随之改变，原来的工作进程不能再续期或写入结果。
+    """
+    return GradingJob.query.filter_by(id=job_id, status=JOB_RUNNING, attempts=attempt)
+
+
+def _save_progress(job_id, attempt, progress):
+    """记录批量评分任务的执行进度（同时续期租约）"""
+    _held_lease(job_id, attempt).update({
+        'progress': json.dumps(progress, ensure_ascii=False),
+        'lease_expires_at': _lease_deadline()
+    }, synchronize_session=False)
+    db.session.commit()
+
+
+def renew_lease(job_id, attempt):
+    """
+    续期运行中任务的租约
+
+    Args:
+        job_id: 任务ID
+        attempt: 领取任务时的尝试次数
+
+    Returns:
+        bool: 任务仍由本工作进程持有时为True（已被恢复、重新领取或已结束时为False）
+    """
+    renewed = _held_lease(job_id, attempt).update({
+        'lease_expires_at': _lease_deadline()
+    }, synchronize_session=False)
+    db.session.commit()
+    return bool(renewed)
+
+
+def _keep_lease(app, job_id, attempt, stop_event):
+    """后台续期线程：任务执行期间每 LEASE_RENEW_INTERVAL 秒续期一次，使用独立的数据库会话"""
+    with app.app_context():
+        while not stop_event.wait(LEASE_RENEW_INTERVAL):
+            try:
+                if not renew_lease(job_id, attempt):
+                    logger.warning(f"评分任务租约已失效: job={job_id}")
+                    break
+            except Exception as e:
+                # 续期失败(例如SQLite被评分事务锁住)时下一轮再试，租约时长留有余量
+                logger.warning(f"续期评分任务租约失败: job={job_id}, 错误: {e}")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+
+def run_job(job):
+    """
+    执行一个已领取的评分任务并记录结果，执行期间由后台线程续期租约
+
+    只有任务仍由本工作进程持有(见_held_lease)时才写入结果；租约已失效时任务可能已被放回队列
+    或由其它工作进程重新领取，本次的结果直接丢弃。
+
+    Returns:
+        GradingJob: 执行后的任务
+    """
+    from flask import current_app
+
+    logger.info(f"开始执行评分任务: job={job.id}, type={job.job_type}, score={job.score_id}, "
+                f"exam={job.exam_id}, attempt={job.attempts}")
+    job_id, attempt = job.id, job.attempts
+    stop_lease = threading.Event()
+    lease_keeper = threading.Thread(target=_keep_lease,
+                                    args=(current_app._get_current_object(), job_id, attempt, stop_lease),
+                                    name=f'grading-lease-{job_id}', daemon=True)
+    lease_keeper.start()
+    try:
+        if job.job_type == JOB_TYPE_EXAM_REGRADE:
+            from grading.batch_regrade import regrade_exam
+            results = regrade_exam(job.exam_id,
+                                   progress_callback=lambda report: _save_progress(job_id, attempt, report))
+        else:
+            results = grade_score(job.score_id)
+        outcome = {'status': JOB_SUCCESS, 'result': json.dumps(results, ensure_ascii=False), 'error': None}
+        logger.info(f"评分任务完成: job={job_id}, 结果: {results}")
+    except Exception as e:
+        logger.error(f"评分任务失败: job={job_id}, 错误: {e}\n{traceback.format_exc()}")
+        db.session.rollback()
+        outcome = {'status': JOB_PENDING if attempt < MAX_ATTEMPTS else JOB_FAILED, 'error': str(e)}
+    finally:
+        stop_lease.set()
+        lease_keeper.join()
+
+    outcome['finished_at'] = datetime.utcnow() if outcome['status'] in (JOB_SUCCESS, JOB_FAILED) else None
+    outcome['lease_expires_at'] = None
+    written = _held_lease(job_id, attempt).update(outcome, synchronize_session=False)
+    db.session.commit()
+    if not written:
+        logger.warning(f"评分任务租约已失效，丢弃本次结果: job={job_id}, attempt={attempt}")
+    return GradingJob.query.get(job_id)
+
+
+def recover_stale_jobs():
+    """
+    将租约已过期的运行中任务(工作进程崩溃/被杀死)重新放回队列，已达到最多尝试次数的任务标记为失败
+
+    Returns:
+        int: 处理的任务数
+    """
+    now = datetime.utcnow()
+    expired = and_(
+        GradingJob.status == JOB_RUNNING,
+        or_(
+            GradingJob.lease_expires_at < now,
+            and_(GradingJob.lease_expires_at.is_(None),
+                    GradingJob.started_at < now - timedelta(minutes=STALE_JOB_MINUTES))
+        )
+    )
+    failed = GradingJob.query.filter(expired, GradingJob.attempts >= MAX_ATTEMPTS).update({
+        'status': JOB_FAILED,
+        'error': '工作进程在执行任务时中断',
+        'finished_at': now,
+        'lease_expires_at': None
+    }, synchronize_session=False)
+    recovered = GradingJob.query.filter(expired).update({
+        'status': JOB_PENDING,
+        'lease_expires_at': None
+    }, synchronize_session=False)
+    db.session.commit()
+    if recovered or failed:
+        logger.warning(f"已恢复{recovered}个中断的评分任务，{failed}个任务达到最多尝试次数")
+    return recovered + failed
+
+
+def run_worker(app, poll_interval=POLL_INTERVAL, stop_event=None):
+    """
+    评分工作循环，持续领取并执行任务
+
+    Args:
+        app: Flask应用实例
+        poll_interval: 队列为空时的轮询间隔(秒)
+        stop_event: threading.Event，设置后退出循环
+    """
+    with app.app_context():
+        logger.info("评分工作进程已启动")
+        last_recovery = None
+
+        while not (stop_event and stop_event.is_set()):
+            try:
+                # 定期恢复租约过期的任务，其它工作进程崩溃时不必等到重启
+                if last_recovery is None or time.monotonic() - last_recovery >= RECOVERY_INTERVAL:
+                    last_recovery = time.monotonic()
+                    recover_stale_jobs()
+
+                job = claim_next_job()
+                if job:
+                    run_job(job)
+                else:
+                    time.sleep(poll_interval)
+            except Exception as e:
+                logger.error(f"评分工作循环出错: {e}")
+                db.session.rollback()
+                time.sleep(poll_interval)
+            finally:
+                db.session.remove()
+
+
+def start_grading_worker(app):
+    """在当前进程中启动后台评分线程"""
+    stop_event = threading.Event()
+    worker = threading.Thread(target=run_worker, args=(app,), kwargs={'stop_event': stop_event},
+                              name='grading-worker', daemon=True)
+    worker.start()
+    return worker, stop_event
@@ -5,6 +5,7 @@ import re
 from flask import current_app
 # 导入新创建的R代码评分器
 from grading.r_code_grader import RCodeGrader
+from grading.result_cache import get_result_cache, get_r_version, make_cache_key, is_cacheable
 
 # 配置日志
 logging.basicConfig(level=logging.INFO,
@@ -15,7 +16,7 @@ logger = logging.getLogger('programming_grader')
 class ProgrammingGrader:
     """R编程题评分器"""
 
-    def __init__(self, timeout=30, memory_limit=500, cpu_limit=1.0):
+    def __init__(self, timeout=30, memory_limit=500, cpu_limit=1.0, use_cache=True):
         """
         初始化编程题评分器
 
@@ -23,12 +24,14 @@ class ProgrammingGrader:
             timeout: 代码执行超时时间(秒)
             memory_limit: 内存限制(MB)
             cpu_limit: CPU使用限制(核心数)
+            use_cache: 是否使用评分结果缓存，相同代码不再重复运行R
         """
         self.timeout = timeout
         self.memory_limit = memory_limit
         self.cpu_limit = cpu_limit
         # 使用新的R代码评分器
         self.r_grader = RCodeGrader(timeout, memory_limit, cpu_limit)
+        self.result_cache = get_result_cache() if use_cache else None
         logger.info(f"初始化R编程题评分器: timeout={timeout}s, memory_limit={memory_limit}MB, cpu_limit={cpu_limit}")
 
     def grade(self, answer, question, max_points):
@@ -45,30 +48,45 @@ class ProgrammingGrader:
         """
         logger.info(f"开始评分R编程题 - 问题ID: {question.id}, 答案ID: {answer.id}, 最大分值: {max_points}")
 
-        if not answer.answer_content or not answer.answer_content.strip():
+        points, feedback = self.evaluate(answer.answer_content, question.test_code, max_points, question.id,
+                                         question_version=question.updated_at)
+        answer.points_earned = points
+        answer.feedback = feedback
+        return points
+
+    def evaluate(self, answer_content, test_code, max_points, question_id=None, question_version=None):
+        """
+        评分R编程题的核心逻辑，不访问ORM对象，可在工作线程中调用
+
+        Args:
+            answer_content: 学生提交的代码
+            test_code: 题目的R测试代码
+            max_points: 题目的最大分值
+            question_id: 题目ID，仅用于日志
+            question_version: 题目版本(updated_at)，题目修改后缓存自动失效
+
+        Returns:
+            tuple: (得分, 反馈)
+        """
+        if not answer_content or not answer_content.strip():
             # 未回答，得0分
-            answer.points_earned = 0
-            answer.feedback = "未作答"
             logger.info("未作答，得分: 0")
-            return 0
+            return 0, "未作答"
 
-        if not question.test_code or not question.test_code.strip():
+        if not test_code or not test_code.strip():
             # 没有测试代码，无法评分
-            answer.points_earned = 0
-            answer.feedback = "题目缺少测试代码，请联系教师手动评分"
-            logger.warning(f"问题 {question.id} 缺少测试代码")
-            return 0
+            logger.warning(f"问题 {question_id} 缺少测试代码")
+            return 0, "题目缺少测试代码，请联系教师手动评分"
 
         # 获取学生代码和测试代码
-        student_code = answer.answer_content.strip()
-        test_code = question.test_code.strip()
+        student_code = answer_content.strip()
+        test_code = test_code.strip()
 
         # 确定需要的R包
-        required_packages = self._get_required_packages(question, student_code)
+        required_packages = self._get_required_packages(student_code)
 
         try:
-            # 使用新的R代码评分器
-            result = self.r_grader.grade(student_code, test_code, required_packages)
+            result = self._run_with_cache(student_code, test_code, required_packages, question_version)
 
             # 解析结果
             status = result.get('status', 'error')
@@ -82,8 +100,7 @@ class ProgrammingGrader:
                 points = round(max_points * score_ratio, 2)
 
                 # 设置得分和反馈
-                answer.points_earned = points
-                answer.feedback = result.get('message', '自动评分完成')
+                feedback = result.get('message', '自动评分完成')
 
                 # 如果有详细输出，添加到反馈中
                 if 'output' in result and result['output']:
@@ -92,18 +109,17 @@ class ProgrammingGrader:
                     if len(output) > 5000:
                         output = output[:5000] + "...(输出过长，已截断)"
 
-                    answer.feedback += f"\n\n程序输出:\n{output}"
+                    feedback += f"\n\n程序输出:\n{output}"
 
                 logger.info(f"评分成功: {points}/{max_points}")
-                return points
+                return points, feedback
             else:
                 # 执行出错
-                answer.points_earned = 0
                 error_message = result.get('message', '代码执行出错')
 
                 # 尝试提供更友好的错误消息
                 friendly_message = self._get_friendly_error_message(error_message)
-                answer.feedback = f"评分错误: {friendly_message}"
+                feedback = f"评分错误: {friendly_message}"
 
                 # 如果有详细输出，添加到反馈中
                 if 'output' in result and result['output']:
@@ -112,10 +128,10 @@ class ProgrammingGrader:
                     if len(output) > 5000:
                         output = output[:5000] + "...(输出过长，已截断)"
 
-                    answer.feedback += f"\n\n程序输出:\n{output}"
+                    feedback += f"\n\n程序输出:\n{output}"
 
                 logger.warning(f"评分错误: {error_message}")
-                return 0
+                return 0, feedback
 
         except Exception as e:
             # 评分过程出现异常
@@ -123,11 +139,28 @@ class ProgrammingGrader:
             error_trace = traceback.format_exc()
             logger.error(f"R编程题评分异常: {str(e)}\n{error_trace}")
 
-            answer.points_earned = 0
-            answer.feedback = f"评分过程异常: {str(e)}"
-            return 0
+            return 0, f"评分过程异常: {str(e)}"
+
+    def _run_with_cache(self, student_code, test_code, required_packages, question_version):
+        """运行R评分，规范化后相同的代码直接使用缓存结果"""
+        if self.result_cache is None:
+            return self.r_grader.grade(student_code, test_code, required_packages)
+
+        r_version = get_r_version(self.r_grader.get_r_executable())
+        cache_key = make_cache_key(student_code, test_code, required_packages, r_version,
+                                   str(question_version) if question_version else None)
+        result = self.result_cache.get(cache_key)
+        if result is not None:
+            logger.info(f"评分结果缓存命中: {cache_key[:12]}")
+            return result
+
+        # 使用新的R代码评分器
+        result = self.r_grader.grade(student_code, test_code, required_packages)
+        if is_cacheable(result):
+            self.result_cache.put(cache_key, result)
+        return result
 
-    def _get_required_packages(self, question, student_code):
+    def _get_required_packages(self, student_code):
         """根据题目和学生代码分析需要的R包"""
         required_packages = []
 
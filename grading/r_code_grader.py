@@ -5,25 +5,51 @@ import tempfile
 import logging
 import subprocess
 import sys
+import time
 from flask import current_app
+from grading.r_worker_pool import get_worker_pool
+from utils.resource_limits import ResourceLimiter
+from utils.metrics import registry, PhaseTimer
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('r_code_grader')
 
+# 等待R进程期间采样资源用量的间隔(秒)
+USAGE_SAMPLE_INTERVAL = 0.2
+
 
 class RCodeGrader:
     """专门用于R编程题评分的类"""
 
-    def __init__(self, timeout=30, memory_limit=500, cpu_limit=1.0):
-        """初始化R代码评分器"""
+    def __init__(self, timeout=30, memory_limit=500, cpu_limit=1.0, use_worker_pool=True):
+        """
+        初始化R代码评分器
+
+        Args:
+            timeout: 代码执行超时时间(秒)
+            memory_limit: 内存限制(MB)
+            cpu_limit: CPU使用限制(核心数)
+            use_worker_pool: 是否使用常驻R工作进程池，否则每次评分启动新的R进程
+        """
         self.timeout = timeout
         self.memory_limit = memory_limit
         self.cpu_limit = cpu_limit
-        logger.info(f"初始化R代码评分器: timeout={timeout}s, memory_limit={memory_limit}MB, cpu_limit={cpu_limit}")
+        self.use_worker_pool = use_worker_pool
+        logger.info(f"初始化R代码评分器: timeout={timeout}s, memory_limit={memory_limit}MB, cpu_limit={cpu_limit}, "
+                    f"use_worker_pool={use_worker_pool}")
 
     def get_r_executable(self):
         """获取R可执行文件路径"""
+        # 环境变量R_EXECUTABLE指定的R优先（基准测试用它替换为模拟R）
+        r_executable = os.environ.get('R_EXECUTABLE')
+        if r_executable:
+            return r_executable
+
+        # 第一次评分时初始化R环境（设置R_HOME和PATH），Web进程启动时不加载R
+        import r_setup
+        r_setup.ensure_r_environment()
+
         # 优先使用conda环境中的R
         conda_prefix = os.environ.get('CONDA_PREFIX')
         if conda_prefix:
@@ -82,6 +108,8 @@ class RCodeGrader:
         if required_packages is None:
             required_packages = []
 
+        timer = PhaseTimer()
+        source = 'grader_process'
         try:
             # 创建临时目录用于测试文件
             temp_dir = tempfile.mkdtemp(prefix="r_test_")
@@ -93,11 +121,122 @@ class RCodeGrader:
                 f.write(student_code)
             logger.info(f"学生代码保存至: {student_file_path}")
 
-            # 创建测试脚本
-            test_file_path = os.path.join(temp_dir, "test_script.R")
+            timer.mark('prepare')
+
+            # 优先在常驻工作进程中执行，失败时退回到单次R进程
+            stdout, stderr = '', ''
+            if self.use_worker_pool:
+                try:
+                    source = 'grader_worker'
+                    resource_usage = self._run_in_worker_pool(temp_dir, test_code, required_packages)
+                    timer.timings.update(resource_usage.pop('phases', {}))
+                except subprocess.TimeoutExpired:
+                    raise
+                except Exception as e:
+                    logger.warning(f"R工作进程池执行失败，改用单次R进程: {e}")
+                    source = 'grader_process'
+                    stdout, stderr, resource_usage = self._run_single_process(
+                        temp_dir, student_file_path, test_code, required_packages)
+            else:
+                stdout, stderr, resource_usage = self._run_single_process(
+                    temp_dir, student_file_path, test_code, required_packages)
+            timer.mark('process')
+            stderr = timer.add_r_phases(stderr)
+
+            # 读取结果文件
+            result_file = os.path.join(temp_dir, "result.json")
+            if os.path.exists(result_file):
+                logger.info(f"找到结果文件: {result_file}")
+                with open(result_file, 'r', encoding='utf-8') as f:
+                    result = json.load(f)
+                    logger.debug(f"结果: {json.dumps(result, ensure_ascii=False, indent=2)}")
+            else:
+                # 如果结果文件不存在，可能是R脚本没有正确执行
+                logger.error(f"未找到结果文件: {result_file}")
+                result = {
+                    'status': 'error',
+                    'score': 0,
+                    'max_score': 100,
+                    'message': f'无法获取测试结果',
+                    'debug_info': stdout + "\n" + stderr
+                }
+
+            # 如果存在测试输出文件，读取并添加到结果中
+            test_output_file = os.path.join(temp_dir, "test_output.txt")
+            if os.path.exists(test_output_file):
+                with open(test_output_file, 'r', encoding='utf-8') as f:
+                    test_output = f.read()
+                    logger.debug(f"测试输出: {test_output}")
+                    if 'debug_info' not in result:
+                        result['debug_info'] = test_output
+
+                    # 将测试输出作为单独的字段供显示
+                    result['output'] = test_output
+
+            timer.mark('parse')
+            result['resource_usage'] = resource_usage
+            result['timings'] = timer.finish()
+            registry.observe_execution(source, result.get('status', 'error'), result['timings'], resource_usage)
+            logger.info(f"R代码评分耗时: {result['timings']}")
+            return result
+
+        except subprocess.TimeoutExpired:
+            registry.observe_execution(source, 'timeout', timer.finish())
+            logger.error(f"R代码执行超时（超过{self.timeout}秒）")
+            return {
+                'status': 'error',
+                'score': 0,
+                'max_score': 100,
+                'message': f'代码执行超时（超过{self.timeout}秒）',
+                'debug_info': ''
+            }
+        except Exception as e:
+            registry.observe_execution(source, 'exception', timer.finish())
+            logger.error(f"执行过程中出现异常: {e}")
+            return {
+                'status': 'error',
+                'score': 0,
+                'max_score': 100,
+                'message': f'执行异常: {str(e)}',
+                'debug_info': ''
+            }
+        finally:
+            # 清理临时文件
+            try:
+                # 列出所有临时文件用于调试
+                logger.debug(f"临时目录内容: {os.listdir(temp_dir)}")
+                for file in os.listdir(temp_dir):
+                    os.unlink(os.path.join(temp_dir, file))
+                os.rmdir(temp_dir)
+                logger.info("临时文件已清理")
+            except Exception as e:
+                logger.warning(f"清理临时文件时出错: {e}")
+
+    def _run_in_worker_pool(self, temp_dir, test_code, required_packages):
+        """在常驻R工作进程中执行评分，结果写入temp_dir，返回资源用量"""
+        with open(os.path.join(temp_dir, "test_code.R"), 'w', encoding='utf-8') as f:
+            f.write(test_code)
+
+        pool = get_worker_pool(self.get_r_executable(), memory_limit=self.memory_limit)
+        logger.info(f"使用R工作进程池执行评分，任务目录: {temp_dir}")
+        return pool.run(temp_dir, required_packages, self.timeout)
+
+    def _run_single_process(self, temp_dir, student_file_path, test_code, required_packages):
+        """启动单次R进程执行评分，结果写入temp_dir，返回(stdout, stderr, 资源用量)"""
+        # 创建测试脚本
+        test_file_path = os.path.join(temp_dir, "test_script.R")
+
+        # 准备R测试脚本
+        r_script = """
+# 阶段计时：向标准错误输出 "[PHASE] <阶段> <秒数>"，第一次调用统计R进程启动时间
+phase_clock <- 0
+mark_phase <- function(phase) {
+  now <- proc.time()[["elapsed"]]
+  cat(sprintf("[PHASE] %s %.4f\\n", phase, now - phase_clock), file = stderr())
+  phase_clock <<- now
+}
+mark_phase("startup")
 
-            # 准备R测试脚本
-            r_script = """
 # 确保必要的库已安装
 packages_to_install <- c("jsonlite")
 for (pkg in packages_to_install) {
@@ -109,6 +248,7 @@ library(jsonlite)
 
 # 加载测试所需的其他包
 REQUIRED_PACKAGES
+mark_phase("packages")
 
 # 创建学生环境
 student_env <- new.env()
@@ -142,6 +282,7 @@ tryCatch({
   # 加载学生代码到学生环境
   student_code_text <- readLines("STUDENT_PATH")
   eval(parse(text = paste(student_code_text, collapse = "\\n")), envir = student_env)
+  mark_phase("student_code")
 
   # 将student_env放入全局环境，供测试代码访问
   assign("student_env", student_env, envir = .GlobalEnv)
@@ -163,6 +304,7 @@ tryCatch({
 
   # 执行测试代码
   TEST_CODE_PLACEHOLDER
+  mark_phase("test_code")
 
   # 测试代码执行完毕
   cat("====== 测试结束 ======\\n")
@@ -192,109 +334,68 @@ tryCatch({
 })
 """
 
-            # 替换占位符
-            r_script = r_script.replace("STUDENT_PATH", student_file_path.replace('\\', '/'))
-            r_script = r_script.replace("TEST_CODE_PLACEHOLDER", test_code)
-            r_script = r_script.replace("RESULT_PATH", os.path.join(temp_dir, "result.json").replace('\\', '/'))
-            r_script = r_script.replace("TEST_OUTPUT_PATH",
-                                        os.path.join(temp_dir, "test_output.txt").replace('\\', '/'))
-
-            # 添加所需包
-            packages_code = ""
-            if required_packages:
-                for pkg in required_packages:
-                    packages_code += f"""
+        # 替换占位符
+        r_script = r_script.replace("STUDENT_PATH", student_file_path.replace('\\', '/'))
+        r_script = r_script.replace("TEST_CODE_PLACEHOLDER", test_code)
+        r_script = r_script.replace("RESULT_PATH", os.path.join(temp_dir, "result.json").replace('\\', '/'))
+        r_script = r_script.replace("TEST_OUTPUT_PATH",
+                                    os.path.join(temp_dir, "test_output.txt").replace('\\', '/'))
+
+        # 添加所需包
+        packages_code = ""
+        if required_packages:
+            for pkg in required_packages:
+                packages_code += f"""
 if (!requireNamespace("{pkg}", quietly = TRUE)) {{
   install.packages("{pkg}", repos = "https://cloud.r-project.org", quiet = TRUE)
 }}
 library({pkg})
 """
-            r_script = r_script.replace("REQUIRED_PACKAGES", packages_code)
-
-            with open(test_file_path, 'w', encoding='utf-8') as f:
-                f.write(r_script)
-            logger.info(f"测试脚本保存至: {test_file_path}")
-
-            # 获取R可执行文件路径
-            r_executable = self.get_r_executable()
-            logger.info(f"使用R可执行文件: {r_executable}")
-
-            # 运行R脚本
-            logger.info(f"开始执行R脚本，工作目录: {temp_dir}")
-
-            process = subprocess.run(
-                [r_executable, "--vanilla", "-f", test_file_path],
-                cwd=temp_dir,
-                timeout=self.timeout,  # 设置超时时间
-                capture_output=True,
-                text=True,
-                encoding='utf-8'  # 明确指定UTF-8编码
-            )
-
-            logger.info(f"R进程返回码: {process.returncode}")
-            if process.stdout and len(process.stdout.strip()) > 0:
-                logger.debug(f"R标准输出: {process.stdout}")
-            if process.stderr and len(process.stderr.strip()) > 0:
-                logger.warning(f"R标准错误: {process.stderr}")
-
-            # 读取结果文件
-            result_file = os.path.join(temp_dir, "result.json")
-            if os.path.exists(result_file):
-                logger.info(f"找到结果文件: {result_file}")
-                with open(result_file, 'r', encoding='utf-8') as f:
-                    result = json.load(f)
-                    logger.debug(f"结果: {json.dumps(result, ensure_ascii=False, indent=2)}")
-            else:
-                # 如果结果文件不存在，可能是R脚本没有正确执行
-                logger.error(f"未找到结果文件: {result_file}")
-                result = {
-                    'status': 'error',
-                    'score': 0,
-                    'max_score': 100,
-                    'message': f'无法获取测试结果',
-                    'debug_info': process.stdout + "\n" + process.stderr
-                }
-
-            # 如果存在测试输出文件，读取并添加到结果中
-            test_output_file = os.path.join(temp_dir, "test_output.txt")
-            if os.path.exists(test_output_file):
-                with open(test_output_file, 'r', encoding='utf-8') as f:
-                    test_output = f.read()
-                    logger.debug(f"测试输出: {test_output}")
-                    if 'debug_info' not in result:
-                        result['debug_info'] = test_output
-
-                    # 将测试输出作为单独的字段供显示
-                    result['output'] = test_output
-
-            return result
-
-        except subprocess.TimeoutExpired:
-            logger.error(f"R代码执行超时（超过{self.timeout}秒）")
-            return {
-                'status': 'error',
-                'score': 0,
-                'max_score': 100,
-                'message': f'代码执行超时（超过{self.timeout}秒）',
-                'debug_info': ''
-            }
-        except Exception as e:
-            logger.error(f"执行过程中出现异常: {e}")
-            return {
-                'status': 'error',
-                'score': 0,
-                'max_score': 100,
-                'message': f'执行异常: {str(e)}',
-                'debug_info': ''
-            }
-        finally:
-            # 清理临时文件
+        r_script = r_script.replace("REQUIRED_PACKAGES", packages_code)
+
+        with open(test_file_path, 'w', encoding='utf-8') as f:
+            f.write(r_script)
+        logger.info(f"测试脚本保存至: {test_file_path}")
+
+        # 获取R可执行文件路径
+        r_executable = self.get_r_executable()
+        logger.info(f"使用R可执行文件: {r_executable}")
+
+        # 运行R脚本
+        logger.info(f"开始执行R脚本，工作目录: {temp_dir}")
+
+        limiter = ResourceLimiter(self.memory_limit, self.cpu_limit, self.timeout)
+        limiter.start()
+        process = subprocess.Popen(
+            [r_executable, "--vanilla", "-f", test_file_path],
+            cwd=temp_dir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',  # 明确指定UTF-8编码
+            preexec_fn=limiter.preexec_fn
+        )
+
+        # 等待进程结束，期间采样资源用量，超时后终止进程
+        deadline = time.monotonic() + self.timeout
+        while True:
+            limiter.sample(process.pid)
+            remaining = deadline - time.monotonic()
             try:
-                # 列出所有临时文件用于调试
-                logger.debug(f"临时目录内容: {os.listdir(temp_dir)}")
-                for file in os.listdir(temp_dir):
-                    os.unlink(os.path.join(temp_dir, file))
-                os.rmdir(temp_dir)
-                logger.info("临时文件已清理")
-            except Exception as e:
-                logger.warning(f"清理临时文件时出错: {e}")
\ No newline at end of file
+                stdout, stderr = process.communicate(timeout=max(0.01, min(remaining, USAGE_SAMPLE_INTERVAL)))
+                break
+            except subprocess.TimeoutExpired:
+                if remaining <= USAGE_SAMPLE_INTERVAL:
+                    process.kill()
+                    process.communicate()
+                    limiter.finish()
+                    raise subprocess.TimeoutExpired(process.args, self.timeout)
+
+        resource_usage = limiter.finish()
+        logger.info(f"R进程返回码: {process.returncode}, 资源用量: {resource_usage}")
+        if stdout and len(stdout.strip()) > 0:
+            logger.debug(f"R标准输出: {stdout}")
+        if stderr and len(stderr.strip()) > 0:
+            logger.warning(f"R标准错误: {stderr}")
+
+        return stdout or '', stderr or '', resource_usage
@@ -0,0 +1,309 @@
+# grading/r_worker_pool.py - 常驻R工作进程池
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+import subprocess
+from collections import deque
+from utils.resource_limits import ResourceLimiter, read_process_usage
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('r_worker_pool')
+
+# 工作进程脚本
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'r_scripts', 'grader_worker.R')
+
+# 启动时预加载的常用包（只加载命名空间，任务需要时再附加）
+PRELOAD_PACKAGES = ['dplyr', 'ggplot2', 'tidyr', 'readr']
+
+# 默认进程池参数
+DEFAULT_POOL_SIZE = min(4, os.cpu_count() or 1)
+DEFAULT_MAX_JOBS_PER_WORKER = 50
+# R进程启动并预加载包所需的最长时间(秒)
+WORKER_START_TIMEOUT = 120
+# 进程池已满时等待空闲工作进程的最长时间(秒)，超时后由调用方改用单次R进程
+DEFAULT_ACQUIRE_TIMEOUT = float(os.environ.get('R_WORKER_ACQUIRE_TIMEOUT', 60))
+
+
+class RWorker:
+    """单个常驻R进程"""
+
+    def __init__(self, r_executable, preload_packages=None, memory_limit=None):
+        self.r_executable = r_executable
+        self.preload_packages = preload_packages or []
+        self.jobs_done = 0
+        self.memory_mb = 0.0
+        self.tainted = False  # 工作进程的协议代码被任务修改过，不能再使用
+        self._lines = queue.Queue()
+
+        cmd = [r_executable, '--vanilla', '--slave', '-f', WORKER_SCRIPT.replace('\\', '/'), '--args']
+        cmd.extend(self.preload_packages)
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            bufsize=1,
+            # 常驻进程的CPU时间会跨任务累计，只限制内存和进程数
+            preexec_fn=ResourceLimiter(memory_limit, limit_cpu_time=False).preexec_fn
+        )
+
+        # 后台线程持续读取输出，避免管道写满阻塞R进程
+        self._reader = threading.Thread(target=self._read_output, daemon=True)
+        self._reader.start()
+        logger.info(f"启动R工作进程: pid={self.process.pid}")
+
+    def _read_output(self):
+        """读取工作进程输出，协议行放入队列，其余输出写入调试日志"""
+        for line in self.process.stdout:
+            line = line.rstrip('\n')
+            if line.startswith('JOB_DONE ') or line.startswith('[PHASE] '):
+                self._lines.put(line)
+            elif line.strip():
+                logger.debug(f"[R worker {self.process.pid}] {line}")
+        # 进程退出
+        self._lines.put(None)
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def run_job(self, job_dir, timeout):
+        """
+        在工作进程中执行一个评分任务
+
+        每个任务使用一个只通过标准输入传给工作进程的随机令牌，完成行必须带回该令牌，
+        学生代码无法从任务目录中读到它来伪造完成行。
+
+        Args:
+            job_dir: 任务目录
+            timeout: 超时时间(秒)
+
+        Returns:
+            dict: 本次任务的资源用量，内存为任务结束时R的内存占用，phases为R内各阶段耗时
+
+        Raises:
+            subprocess.TimeoutExpired: 任务超时，工作进程已被终止
+            RuntimeError: 工作进程意外退出，或协议代码被任务修改（结果不可信）
+        """
+        token = uuid.uuid4().hex
+        usage_before = read_process_usage(self.process.pid)
+        self.process.stdin.write(job_dir.replace('\\', '/') + '\t' + token + '\n')
+        self.process.stdin.flush()
+
+        # 首个任务需要等待R启动和预加载包
+        wait = timeout if self.jobs_done > 0 else timeout + WORKER_START_TIMEOUT
+        phases = {}
+        while True:
+            try:
+                line = self._lines.get(timeout=wait)
+            except queue.Empty:
+                self.kill()
+                raise subprocess.TimeoutExpired(self.process.args, timeout)
+
+            if line is None:
+                raise RuntimeError(f"R工作进程意外退出，返回码: {self.process.poll()}")
+
+            if line.startswith('[PHASE] '):
+                _, phase, seconds = line.split(' ', 2)
+                phases[f'r_{phase}'] = phases.get(f'r_{phase}', 0.0) + float(seconds)
+                continue
+
+            fields = line.split(' ')
+            if len(fields) != 4 or fields[1] != token:
+                # 上一个超时任务的迟到回复，或学生代码打印的伪造行，忽略
+                phases = {}
+                continue
+            _, _, memory_mb, integrity = fields
+
+            self.jobs_done += 1
+            try:
+                self.memory_mb = float(memory_mb)
+            except ValueError:
+                pass
+            if integrity != 'ok':
+                # 学生代码修改了工作进程的协议代码，本次结果可能是伪造的，进程不能再使用
+                self.tainted = True
+                raise RuntimeError(f"R工作进程 {self.process.pid} 的协议代码被任务修改")
+
+            usage_after = read_process_usage(self.process.pid)
+            cpu_seconds = None
+            if usage_before and usage_after:
+                cpu_seconds = round(usage_after[1] - usage_before[1], 3)
+            return {
+                'peak_rss_mb': self.memory_mb,
+                'cpu_seconds': cpu_seconds,
+                'memory_limit_mb': None,
+                'accounting': 'worker',
+                'phases': phases
+            }
+
+    def stop(self):
+        """正常关闭工作进程"""
+        try:
+            if self.is_alive():
+                self.process.stdin.write('\n')
+                self.process.stdin.flush()
+                self.process.wait(timeout=5)
+        except Exception:
+            self.kill()
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except Exception as e:
+            logger.warning(f"终止R工作进程时出错: {e}")
+
+
+class RWorkerPool:
+    """常驻R工作进程池，进程在执行N个任务或内存超限后回收"""
+
+    def __init__(self, r_executable, size=DEFAULT_POOL_SIZE, max_jobs_per_worker=DEFAULT_MAX_JOBS_PER_WORKER,
+                 memory_limit=500, preload_packages=None, acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        """
+        Args:
+            r_executable: R可执行文件路径
+            size: 最大工作进程数
+            max_jobs_per_worker: 单个进程执行多少个任务后回收
+            memory_limit: 单个进程内存上限(MB)，超过后回收
+            preload_packages: 启动时预加载的包
+            acquire_timeout: 进程池已满时等待空闲工作进程的最长时间(秒)
+        """
+        self.r_executable = r_executable
+        self.size = max(1, size)
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.memory_limit = memory_limit
+        self.preload_packages = PRELOAD_PACKAGES if preload_packages is None else preload_packages
+        self.acquire_timeout = acquire_timeout
+
+        # 空闲进程和已启动进程数都由同一个条件变量保护；
+        # 归还或回收进程时通知等待者，回收后等待者可以启动替代进程
+        self._idle = deque()
+        self._available = threading.Condition()
+        self._started = 0
+        self._closed = False
+        logger.info(f"初始化R工作进程池: size={self.size}, max_jobs={max_jobs_per_worker}, "
+                    f"memory_limit={memory_limit}MB")
+
+    def _acquire(self):
+        """
+        取得一个空闲工作进程，必要时启动新进程
+
+        Raises:
+            RuntimeError: 进程池已关闭，或等待acquire_timeout秒仍没有可用的工作进程
+        """
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._available:
+            while True:
+                if self._closed:
+                    raise RuntimeError("R工作进程池已关闭")
+                if self._idle:
+                    return self._idle.popleft()
+                if self._started < self.size:
+                    # 先占用名额，在锁外启动进程
+                    self._started += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RuntimeError(f"等待空闲R工作进程超时({self.acquire_timeout}秒)")
+                self._available.wait(remaining)
+
+        try:
+            return RWorker(self.r_executable, self.preload_packages, self.memory_limit)
+        except Exception:
+            self._free_slot()
+            raise
+
+    def _free_slot(self):
+        """释放一个进程名额并唤醒一个等待者"""
+        with self._available:
+            self._started -= 1
+            self._available.notify()
+
+    def _release(self, worker):
+        """归还工作进程，达到回收条件时关闭它"""
+        recycle = (
+            self._closed
+            or worker.tainted
+            or not worker.is_alive()
+            or worker.jobs_done >= self.max_jobs_per_worker
+            or (self.memory_limit and worker.memory_mb >= self.memory_limit)
+        )
+        if recycle:
+            logger.info(f"回收R工作进程: pid={worker.process.pid}, jobs={worker.jobs_done}, "
+                        f"memory={worker.memory_mb}MB, tainted={worker.tainted}")
+            if worker.tainted:
+                worker.kill()
+            else:
+                worker.stop()
+            self._free_slot()
+            return
+        with self._available:
+            self._idle.append(worker)
+            self._available.notify()
+
+    def run(self, job_dir, required_packages, timeout):
+        """
+        执行一个评分任务，结果写入job_dir中的result.json和test_output.txt
+
+        Args:
+            job_dir: 已写入student_code.R和test_code.R的任务目录
+            required_packages: 需要附加的R包列表
+            timeout: 超时时间(秒)
+
+        Returns:
+            dict: 本次任务的资源用量
+        """
+        job_id = os.path.basename(job_dir.rstrip('/\\'))
+        with open(os.path.join(job_dir, 'job.json'), 'w', encoding='utf-8') as f:
+            json.dump({'job_id': job_id, 'required_packages': list(required_packages or [])}, f)
+
+        worker = self._acquire()
+        try:
+            resource_usage = worker.run_job(job_dir, timeout)
+            resource_usage['memory_limit_mb'] = self.memory_limit
+            logger.info(f"R工作进程 {worker.process.pid} 完成任务 {job_id}, 资源用量: {resource_usage}")
+            return resource_usage
+        finally:
+            self._release(worker)
+
+    def shutdown(self):
+        """关闭所有空闲工作进程，正在执行任务的进程在归还时关闭"""
+        with self._available:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._available.notify_all()
+        for worker in idle:
+            worker.stop()
+            self._free_slot()
+
+
+# 进程级共享的进程池
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool(r_executable, memory_limit=500, size=None, max_jobs_per_worker=None):
+    """获取共享的R工作进程池（首次调用时创建）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RWorkerPool(
+                r_executable,
+                size=size or int(os.environ.get('R_WORKER_POOL_SIZE', DEFAULT_POOL_SIZE)),
+                max_jobs_per_worker=max_jobs_per_worker or int(
+                    os.environ.get('R_WORKER_MAX_JOBS', DEFAULT_MAX_JOBS_PER_WORKER)),
+                memory_limit=memory_limit
+            )
+            atexit.register(_pool.shutdown)
+        return _pool
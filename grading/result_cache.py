@@ -0,0 +1,227 @@
+# grading/result_cache.py - R编程题评分结果缓存
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import subprocess
+from collections import OrderedDict
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('grading_cache')
+
+# 默认缓存容量
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_MAX_DISK_ENTRIES = 100000
+
+# 这些结果由超时或系统异常导致，与代码本身无关，不缓存
+TRANSIENT_MESSAGE_PREFIXES = ('代码执行超时', '执行异常', '无法获取测试结果')
+
+# 只属于某一次执行的字段（耗时和资源用量），不缓存；缓存命中的结果带有cached=True，
+# 统计和基准测试据此区分，不把命中当成一次R执行
+RUN_SPECIFIC_FIELDS = ('timings', 'resource_usage')
+
+# R原始字符串的开头：r"(...)"、R'[...]'、r"--{...}--" 等
+_RAW_STRING_START = re.compile(r'[rR](["\'])(-*)([(\[{])')
+_RAW_STRING_CLOSE = {'(': ')', '[': ']', '{': '}'}
+
+_r_version = None
+_r_version_lock = threading.Lock()
+
+
+def get_r_version(r_executable):
+    """获取R版本字符串（每个进程只查询一次）"""
+    global _r_version
+    with _r_version_lock:
+        if _r_version is None:
+            try:
+                process = subprocess.run([r_executable, '--version'], capture_output=True, text=True,
+                                         encoding='utf-8', errors='replace', timeout=30)
+                lines = process.stdout.strip().splitlines()
+                _r_version = lines[0] if lines else 'unknown'
+            except Exception as e:
+                logger.warning(f"获取R版本失败: {e}")
+                _r_version = 'unknown'
+        return _r_version
+
+
+def _string_line_ends(code):
+    """
+    找出位于R字符串字面量内部的换行符
+
+    Returns:
+        set: 字符串内部换行符的位置
+    """
+    inside = set()
+    i, n = 0, len(code)
+    while i < n:
+        ch = code[i]
+        if ch == '#':
+            # 注释到行尾
+            end = code.find('\n', i)
+            i = n if end < 0 else end
+            continue
+
+        raw = _RAW_STRING_START.match(code, i)
+        if raw and (i == 0 or not (code[i - 1].isalnum() or code[i - 1] in '._')):
+            quote, dashes, opening = raw.groups()
+            end = code.find(_RAW_STRING_CLOSE[opening] + dashes + quote, raw.end())
+            end = n if end < 0 else end + len(dashes) + 2
+            inside.update(pos for pos in range(raw.end(), end) if code[pos] == '\n')
+            i = end
+            continue
+
+        if ch in '"\'`':
+            i += 1
+            while i < n and code[i] != ch:
+                if code[i] == '\\':  # 转义字符（可能是转义的换行）
+                    i += 1
+                if i < n and code[i] == '\n':
+                    inside.add(i)
+                i += 1
+        i += 1
+    return inside
+
+
+def normalize_code(code):
+    """
+    规范化代码：统一换行符，去掉行尾空白和首尾空行
+
+    字符串字面量(包括原始字符串)内部的行尾空白属于字符串内容，保持不变，
+    所以只在字符串内容上不同的代码不会得到相同的缓存键。
+    """
+    code = code.replace('\r\n', '\n').replace('\r', '\n')
+    in_string = _string_line_ends(code)
+    # 按字符串外部的换行切分，每段的结尾都在字符串外部
+    line_ends = [pos for pos, ch in enumerate(code) if ch == '\n' and pos not in in_string]
+    lines, start = [], 0
+    for end in line_ends + [len(code)]:
+        lines.append(code[start:end].rstrip())
+        start = end + 1
+    return '\n'.join(lines).strip('\n')
+
+
+def make_cache_key(student_code, test_code, required_packages, r_version, question_version=None):
+    """根据规范化后的学生代码、测试代码、R包集合、R版本和题目版本计算缓存键"""
+    payload = json.dumps({
+        'student_code': normalize_code(student_code),
+        'test_code': normalize_code(test_code),
+        'packages': sorted(set(required_packages or [])),
+        'r_version': r_version,
+        'question_version': question_version,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_cacheable(result):
+    """判断评分结果是否可以缓存"""
+    message = str(result.get('message', ''))
+    return not message.startswith(TRANSIENT_MESSAGE_PREFIXES)
+
+
+def _without_run_fields(result):
+    """去掉只属于某一次执行的字段"""
+    return {key: value for key, value in result.items() if key not in RUN_SPECIFIC_FIELDS and key != 'cached'}
+
+
+class GradingResultCache:
+    """LRU内存缓存，可选SQLite磁盘持久化"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, db_path=None, max_disk_entries=DEFAULT_MAX_DISK_ENTRIES):
+        """
+        Args:
+            max_entries: 内存中最多保存的结果数
+            db_path: SQLite文件路径，为空时只使用内存
+            max_disk_entries: 磁盘中最多保存的结果数
+        """
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS grading_result_cache ('
+                'key TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+            self._conn.commit()
+        logger.info(f"初始化评分结果缓存: max_entries={max_entries}, db_path={db_path or '无'}")
+
+    def get(self, key):
+        """查找缓存结果，未命中返回None；命中的结果不含耗时和资源用量，并带有cached=True"""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(result, cached=True)
+
+            if self._conn is not None:
+                row = self._conn.execute('SELECT result FROM grading_result_cache WHERE key = ?', (key,)).fetchone()
+                if row:
+                    # 旧版本写入的记录可能还带有执行字段
+                    result = _without_run_fields(json.loads(row[0]))
+                    self._remember(key, result)
+                    self.hits += 1
+                    return dict(result, cached=True)
+
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        """保存评分结果（不保存耗时和资源用量）"""
+        result = _without_run_fields(result)
+        with self._lock:
+            self._remember(key, result)
+
+            if self._conn is not None:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO grading_result_cache (key, result, created_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(result, ensure_ascii=False), time.time())
+                )
+                # 超出容量时删除最早的记录
+                self._conn.execute(
+                    'DELETE FROM grading_result_cache WHERE key IN ('
+                    'SELECT key FROM grading_result_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+                    (self.max_disk_entries,)
+                )
+                self._conn.commit()
+
+    def _remember(self, key, result):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空全部缓存"""
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute('DELETE FROM grading_result_cache')
+                self._conn.commit()
+
+
+# 进程级共享的缓存
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """获取共享的评分结果缓存（首次调用时按环境变量创建）"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = GradingResultCache(
+                max_entries=int(os.environ.get('GRADING_CACHE_SIZE', DEFAULT_MAX_ENTRIES)),
+                db_path=os.environ.get('GRADING_CACHE_DB') or None
+            )
+        return _cache
@@ -0,0 +1,14 @@
+# grading_worker.py - 独立的评分工作进程
+# 用法: GRADING_WORKER_INLINE=0 的Web进程 + 单独运行 python grading_worker.py
+import os
+
+# 本进程自己执行评分循环，不再额外启动后台线程
+os.environ['GRADING_WORKER_INLINE'] = '0'
+
+from app import create_app
+from grading.job_queue import run_worker
+
+
+if __name__ == '__main__':
+    app = create_app()
+    run_worker(app)
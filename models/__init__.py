@@ -9,5 +9,7 @@ from models.exam import Exam
 from models.exam_question import ExamQuestion
 from models.score import Score
 from models.student_answer import StudentAnswer
+from models.grading_job import GradingJob
+from models.schema_migration import SchemaMigration
 
 # 第六次：debug，典型的循环导入问题，在使用SQLAlchemy定义模型关系时很常见
\ No newline at end of file
@@ -1,4 +1,91 @@
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 
 # 创建数据库实例
-db = SQLAlchemy()
\ No newline at end of file
+db = SQLAlchemy()
+
+# SQLite连接参数的默认值
+DEFAULT_SQLITE_JOURNAL_MODE = 'WAL'  # 读写互不阻塞，并发自动保存不再频繁出现 database is locked
+DEFAULT_SQLITE_SYNCHRONOUS = 'NORMAL'  # WAL模式下只在检查点同步磁盘，断电时可能丢失最后几个事务
+DEFAULT_SQLITE_BUSY_TIMEOUT_MS = 5000  # 写锁被占用时等待的时间，而不是立即报错
+
+
+def build_engine_options(uri, pool_size=10, max_overflow=20, pool_timeout=30, pool_recycle=1800):
+    """
+    根据数据库URL生成SQLALCHEMY_ENGINE_OPTIONS
+
+    Args:
+        uri: 数据库URL
+        pool_size: 连接池保持的连接数
+        max_overflow: 连接池满时允许额外创建的连接数
+        pool_timeout: 等待空闲连接的最长时间(秒)
+        pool_recycle: 连接最长使用时间(秒)，超过后重建，避免被服务器端超时断开
+
+    Returns:
+        dict: 引擎参数
+    """
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        if not url.database or url.database == ':memory:':
+            # 内存数据库只能使用单连接池，不支持连接池参数
+            return {}
+        # SQLite只有一个写者，连接池保持少量连接即可；等待写锁由busy_timeout控制
+        return {
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_timeout': pool_timeout,
+            'connect_args': {'check_same_thread': False},
+        }
+
+    # MySQL/PostgreSQL等服务器数据库
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+        'pool_pre_ping': True,
+    }
+
+
+def configure_sqlite(engine, journal_mode=DEFAULT_SQLITE_JOURNAL_MODE, synchronous=DEFAULT_SQLITE_SYNCHRONOUS,
+                     busy_timeout_ms=DEFAULT_SQLITE_BUSY_TIMEOUT_MS):
+    """
+    在SQLite引擎的每个新连接上设置PRAGMA，非SQLite引擎不做处理
+
+    Args:
+        engine: SQLAlchemy引擎
+        journal_mode: 日志模式(WAL/DELETE等)，为空时不修改
+        synchronous: 同步级别(NORMAL/FULL等)，为空时不修改
+        busy_timeout_ms: 等待写锁的毫秒数，为None时使用驱动默认值
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            if busy_timeout_ms is not None:
+                cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+            if journal_mode:
+                cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+            if synchronous:
+                cursor.execute(f'PRAGMA synchronous={synchronous}')
+        finally:
+            cursor.close()
+
+
+def init_db(app):
+    """初始化数据库扩展，并按配置设置SQLite连接参数"""
+    db.init_app(app)
+    with app.app_context():
+        configure_sqlite(
+            db.engine,
+            journal_mode=app.config.get('SQLITE_JOURNAL_MODE', DEFAULT_SQLITE_JOURNAL_MODE),
+            synchronous=app.config.get('SQLITE_SYNCHRONOUS', DEFAULT_SQLITE_SYNCHRONOUS),
+            busy_timeout_ms=app.config.get('SQLITE_BUSY_TIMEOUT_MS', DEFAULT_SQLITE_BUSY_TIMEOUT_MS),
+        )
@@ -17,6 +17,10 @@ class Exam(db.Model):
     creator_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     has_duration = db.Column(db.Boolean, default=False)
     duration_minutes = db.Column(db.Integer, default=120)  # 默认120分钟
+    # 个性化试卷：每名学生的题目顺序、选项顺序和题组抽题由(考试ID, 学生ID, 种子)确定
+    shuffle_questions = db.Column(db.Boolean, default=False)  # 打乱题目顺序
+    shuffle_options = db.Column(db.Boolean, default=False)  # 打乱选择题选项顺序
+    variant_seed = db.Column(db.Integer)  # 个性化试卷的随机种子
 
     # 建立与题目的多对多关系，通过中间表
     questions = db.relationship('ExamQuestion', back_populates='exam')
@@ -24,6 +28,13 @@ class Exam(db.Model):
     # 分数关系
     scores = db.relationship('Score', backref='exam', lazy='dynamic')
 
+    # 学生端按发布状态和考试时间筛选考试
+    __table_args__ = (
+        db.Index('ix_exam_published_time', 'is_published', 'start_time', 'end_time'),
+        # 考试列表按(创建时间, ID)键集分页
+        db.Index('ix_exam_created_id', 'created_at', 'id'),
+    )
+
     def __repr__(self):
         return f'<Exam {self.id}: {self.title}>'
 
@@ -7,6 +7,7 @@ class ExamQuestion(db.Model):
     question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
     order = db.Column(db.Integer, default=0)  # 题目在考试中的顺序
     score = db.Column(db.Float, nullable=False)  # 该题在此考试中的分值
+    pool = db.Column(db.String(50))  # 题组：同一题组的题目可以互换，每名学生只抽到其中一道
 
     # 建立与考试和题目的关系
     exam = db.relationship('Exam', back_populates='questions')
@@ -14,6 +15,8 @@ class ExamQuestion(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('exam_id', 'question_id', name='uq_exam_question'),
+        # 按考试取题目并按顺序排列
+        db.Index('ix_exam_question_exam_order', 'exam_id', 'order'),
     )
 
     def __repr__(self):
@@ -0,0 +1,56 @@
+import json
+from datetime import datetime
+from models.db import db
+
+# 评分任务状态
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_SUCCESS = 'success'
+JOB_FAILED = 'failed'
+
+# 评分任务类型
+JOB_TYPE_SCORE = 'score'  # 评分单份答卷
+JOB_TYPE_EXAM_REGRADE = 'exam_regrade'  # 整场考试批量重新评分
+
+
+class GradingJob(db.Model):
+    """自动评分任务（持久化队列，重启后可继续执行）"""
+    __tablename__ = 'grading_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(20), nullable=False, default=JOB_TYPE_SCORE)
+    score_id = db.Column(db.Integer, db.ForeignKey('score.id'), index=True)
+    exam_id = db.Column(db.Integer, db.ForeignKey('exam.id'), index=True)  # 批量重新评分的考试
+    status = db.Column(db.String(20), nullable=False, default=JOB_PENDING, index=True)
+    attempts = db.Column(db.Integer, default=0)  # 已尝试次数
+    result = db.Column(db.Text)  # 评分结果统计(JSON)
+    error = db.Column(db.Text)  # 失败原因
+    progress = db.Column(db.Text)  # 执行进度(JSON)，批量重新评分时更新
+    requested_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    lease_expires_at = db.Column(db.DateTime)  # 运行中任务的租约到期时间，执行任务的工作进程定期续期
+
+    score = db.relationship('Score', backref=db.backref('grading_jobs', lazy='dynamic'))
+
+    @property
+    def is_finished(self):
+        return self.status in (JOB_SUCCESS, JOB_FAILED)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'job_type': self.job_type,
+            'score_id': self.score_id,
+            'exam_id': self.exam_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'error': self.error,
+            'progress': json.loads(self.progress) if self.progress else None,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f'<GradingJob {self.id}: {self.job_type}, Score {self.score_id}, Exam {self.exam_id}, {self.status}>'
@@ -38,6 +38,13 @@ class Question(db.Model):
     # 选择题选项
     options = db.relationship('QuestionOption', backref='question', lazy='dynamic', cascade='all, delete-orphan')
 
+    # 题库按题型、难度和分类筛选
+    __table_args__ = (
+        db.Index('ix_question_type_difficulty_category', 'question_type', 'difficulty', 'category_id'),
+        # 题目列表按(创建时间, ID)键集分页
+        db.Index('ix_question_created_id', 'created_at', 'id'),
+    )
+
     # 建立与考试的多对多关系，通过中间表
     exams = db.relationship('ExamQuestion', back_populates='question')
 
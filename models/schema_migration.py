@@ -0,0 +1,14 @@
+from datetime import datetime
+from models.db import db
+
+
+class SchemaMigration(db.Model):
+    """已执行的数据库迁移（见 bootstrap.py），每个版本只执行一次"""
+    __tablename__ = 'schema_migration'
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SchemaMigration {self.version}: {self.name}>'
@@ -12,12 +12,16 @@ class Score(db.Model):
     submit_time = db.Column(db.DateTime, default=datetime.utcnow)
     is_graded = db.Column(db.Boolean, default=False)  # 是否已评分
     is_final_submit = db.Column(db.Boolean, default=False)  # 是否最终提交
+    variant = db.Column(db.Text)  # 学生的个性化试卷(JSON)，第一次进入考试时生成，为空表示按考试顺序
 
     # 建立与学生答案的关系
     student_answers = db.relationship('StudentAnswer', backref='score', lazy='dynamic')
 
     __table_args__ = (
         db.UniqueConstraint('student_id', 'exam_id', name='uq_student_exam'),
+        # 学生的已提交/已评分考试ID列表（覆盖索引：查询只读exam_id，不回表；
+        # 查询整行时SQLite会改用uq_student_exam，所以列表查询只选exam_id）
+        db.Index('ix_score_student_status_exam', 'student_id', 'is_final_submit', 'is_graded', 'exam_id'),
     )
 
     def __repr__(self):
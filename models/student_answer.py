@@ -11,6 +11,12 @@ class StudentAnswer(db.Model):
     points_earned = db.Column(db.Float, default=0)  # 该题得分
     feedback = db.Column(db.Text)  # 教师反馈
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    client_version = db.Column(db.Integer)  # 客户端答案版本号，用于拒绝乱序到达的旧答案
+
+    # 每份答卷的每道题只有一条答案，保存答案可以使用upsert
+    __table_args__ = (
+        db.Index('uq_student_answer_score_question', 'score_id', 'question_id', unique=True),
+    )
 
     def __repr__(self):
         return f'<StudentAnswer: Score {self.score_id}, Question {self.question_id}, Points {self.points_earned}>'
\ No newline at end of file
@@ -11,6 +11,8 @@ from models.tag import Tag
 from models.exam import Exam
 from forms.question import QuestionForm, QuestionSearchForm, CodeTemplateForm
 from models.code_template import CodeTemplate
+from questions.search_index import filter_by_keyword
+from utils.pagination import keyset_paginate, cached_count
 
 
 @questions_bp.route('/')
@@ -24,7 +26,7 @@ def index():
                                                        Category.query.order_by(Category.name).all()]
 
     # 获取查询参数
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', '')
     keyword = request.args.get('keyword', '')
     question_type = request.args.get('question_type', '')
     category_id = request.args.get('category_id', 0, type=int)
@@ -35,11 +37,10 @@ def index():
     # 构建查询
     query = Question.query
 
+    # 全文检索，有相关度时按相关度排序
+    rank = None
     if keyword:
-        query = query.filter(or_(
-            Question.title.contains(keyword),
-            Question.content.contains(keyword)
-        ))
+        query, rank = filter_by_keyword(query, keyword)
 
     if question_type:
         query = query.filter(Question.question_type == question_type)
@@ -76,16 +77,24 @@ def index():
         # 学生只能看到自己参加的考试中的题目
         query = query.filter(Question.creator_id == current_user.id)
 
-    # 分页
-    pagination = query.order_by(Question.created_at.desc()).paginate(
-        page=page, per_page=current_app.config.get('QUESTIONS_PER_PAGE', 10), error_out=False
-    )
+    # 键集分页：按(创建时间, ID)倒序，有相关度时相关度优先
+    order = [(Question.created_at, True), (Question.id, True)]
+    if rank is not None:
+        order.insert(0, (rank, False))
+    pagination = keyset_paginate(query, order, cursor=cursor,
+                                 per_page=current_app.config.get('QUESTIONS_PER_PAGE', 10))
+    pagination.total = cached_count(query, (
+        'questions', current_user.id, keyword, question_type, category_id, tag, difficulty_min, difficulty_max))
 
     questions = pagination.items
 
+    # 翻页链接保留筛选条件
+    list_args = {key: value for key, value in request.args.items() if key not in ('cursor', 'page')}
+
     return render_template('questions/index.html',
                            questions=questions,
                            pagination=pagination,
+                           list_args=list_args,
                            search_form=search_form)
 
 
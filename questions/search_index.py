@@ -0,0 +1,221 @@
+# search_index.py - 题库全文检索：SQLite FTS5索引题目标题、内容、解析和标签，由模型事件维护
+import re
+import logging
+from sqlalchemy import bindparam, event, false, or_, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from models.db import db
+from models.question import Question
+from models.question_tag import question_tag
+from models.tag import Tag
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('search_index')
+
+FTS_TABLE = 'question_fts'
+
+# 各列在bm25排序中的权重(标题, 内容, 解析, 标签)，分值越小越相关
+RANK_WEIGHTS = (10.0, 1.0, 2.0, 5.0)
+
+# 中日韩文字。unicode61分词器会把连续的汉字当成一个词，索引前在每个字两侧加空格，
+# 查询时把关键词拆成相邻字组成的短语，这样任意长度的中文子串都能匹配
+_CJK = re.compile('([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af])')
+_TOKEN = re.compile(r'\w+')
+
+# 重建索引时每批写入的题目数
+REBUILD_BATCH_SIZE = 500
+
+# 数据库URL -> 是否存在全文索引表
+_availability = {}
+
+
+def segment(value):
+    """把文本中的中日韩文字逐字分开，其它文字不变"""
+    return _CJK.sub(r' \1 ', value or '')
+
+
+def build_match_query(keyword):
+    """
+    把用户输入的关键词转换为FTS5的MATCH表达式
+
+    空格分隔的每个词都必须出现；中文按相邻字组成的短语匹配，以英文或数字结尾的词按前缀匹配。
+
+    Args:
+        keyword: 用户输入的关键词
+
+    Returns:
+        str: MATCH表达式，关键词中没有可检索的字符时返回None
+    """
+    phrases = []
+    for term in keyword.split():
+        tokens = _TOKEN.findall(segment(term))
+        if not tokens:
+            continue
+        phrase = '"' + ' '.join(tokens) + '"'
+        if not _CJK.fullmatch(tokens[-1]):
+            phrase += '*'
+        phrases.append(phrase)
+    return ' '.join(phrases) or None
+
+
+def search_index_available(connection=None):
+    """
+    当前数据库是否已建立全文索引（非SQLite或SQLite不支持FTS5时为False）
+
+    Args:
+        connection: 数据库连接，为空时使用当前会话的连接
+    """
+    connection = connection if connection is not None else db.session.connection()
+    key = str(connection.engine.url)
+    if key not in _availability:
+        if connection.dialect.name != 'sqlite':
+            _availability[key] = False
+        else:
+            _availability[key] = connection.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+            ), {'name': FTS_TABLE}).first() is not None
+    return _availability[key]
+
+
+def _reindex(connection, question_ids):
+    """从题目表重新写入这些题目的索引行，已删除的题目只删除索引行"""
+    question_ids = sorted(question_ids)
+    if not question_ids:
+        return
+    connection.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid IN :ids').bindparams(
+        bindparam('ids', expanding=True)), {'ids': question_ids})
+
+    questions = connection.execute(
+        select(Question.id, Question.title, Question.content, Question.explanation).where(
+            Question.id.in_(question_ids))
+    ).all()
+    if not questions:
+        return
+    tags = {}
+    for question_id, name in connection.execute(
+        select(question_tag.c.question_id, Tag.name).join_from(
+            question_tag, Tag, question_tag.c.tag_id == Tag.id
+        ).where(question_tag.c.question_id.in_(question_ids))
+    ):
+        tags.setdefault(question_id, []).append(name)
+
+    connection.execute(text(
+        f'INSERT INTO {FTS_TABLE} (rowid, title, content, explanation, tags) '
+        f'VALUES (:id, :title, :content, :explanation, :tags)'
+    ), [{
+        'id': row.id,
+        'title': segment(row.title),
+        'content': segment(row.content),
+        'explanation': segment(row.explanation),
+        'tags': segment(' '.join(tags.get(row.id, []))),
+    } for row in questions])
+
+
+def create_search_index(connection):
+    """
+    创建全文索引表
+
+    Returns:
+        bool: 是否创建成功（非SQLite或SQLite未编译FTS5时为False）
+    """
+    _availability.pop(str(connection.engine.url), None)
+    if connection.dialect.name != 'sqlite':
+        return False
+    try:
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(title, content, explanation, tags, tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+    except OperationalError as e:
+        logger.warning(f"SQLite不支持FTS5，题库搜索使用LIKE: {e}")
+        return False
+    return True
+
+
+def rebuild_search_index():
+    """
+    重建全部题目的全文索引（索引表不存在时先创建）
+
+    Returns:
+        int: 写入索引的题目数，数据库不支持全文索引时返回None
+    """
+    connection = db.session.connection()
+    if not create_search_index(connection):
+        return None
+    connection.execute(text(f'DELETE FROM {FTS_TABLE}'))
+    all_ids = [row.id for row in db.session.query(Question.id).order_by(Question.id).all()]
+    for start in range(0, len(all_ids), REBUILD_BATCH_SIZE):
+        _reindex(connection, all_ids[start:start + REBUILD_BATCH_SIZE])
+    db.session.commit()
+    logger.info(f"题库全文索引已重建: {len(all_ids)}道题目")
+    return len(all_ids)
+
+
+def filter_by_keyword(query, keyword):
+    """
+    按关键词筛选题目
+
+    有全文索引时同时返回相关度(bm25)列，调用方按该列升序排列即为相关度从高到低；
+    没有全文索引时退回到标题和内容的LIKE匹配。
+
+    Args:
+        query: Question查询
+        keyword: 用户输入的关键词
+
+    Returns:
+        tuple: (筛选后的查询, 相关度列)，没有全文索引时相关度列为None
+    """
+    keyword = (keyword or '').strip()
+    if not keyword:
+        return query, None
+    if not search_index_available():
+        return query.filter(or_(
+            Question.title.contains(keyword),
+            Question.content.contains(keyword)
+        )), None
+
+    match = build_match_query(keyword)
+    if match is None:
+        return query.filter(false()), None
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    hits = text(
+        f'SELECT rowid AS question_id, bm25({FTS_TABLE}, {weights}) AS rank '
+        f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match'
+    ).bindparams(match=match).columns(question_id=db.Integer, rank=db.Float).subquery('question_fts_hits')
+    return query.join(hits, hits.c.question_id == Question.id), hits.c.rank
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_tag_changes(session, flush_context, instances):
+    # 标签改名或删除时需要更新使用该标签的题目；删除后关联行已不存在，所以在flush之前查询
+    tag_ids = [obj.id for obj in list(session.dirty) + list(session.deleted)
+               if isinstance(obj, Tag) and obj.id is not None]
+    if not tag_ids:
+        return
+    connection = session.connection()
+    if not search_index_available(connection):
+        return
+    question_ids = {row.question_id for row in connection.execute(
+        question_tag.select().where(question_tag.c.tag_id.in_(tag_ids))
+    )}
+    session.info.setdefault('search_question_ids', set()).update(question_ids)
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_search_index(session, flush_context):
+    # 与题目的修改在同一事务中更新索引，回滚时一起撤销
+    question_ids = session.info.pop('search_question_ids', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Question) and obj.id is not None:
+            question_ids.add(obj.id)
+    if not question_ids:
+        return
+    connection = session.connection()
+    if search_index_available(connection):
+        _reindex(connection, question_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_search_changes(session):
+    session.info.pop('search_question_ids', None)
@@ -1,4 +1,5 @@
 import r_setup
+r_setup.ensure_rpy2_ready()  # 初始化R环境
 import os
 import sys # 表示：如果找不到需要的工具，就告诉用户问题所在，然后干脆停止工作
 
@@ -5,10 +5,8 @@ import tempfile
 import json
 import traceback
 import logging
+import threading
 import subprocess
-import rpy2.robjects as ro
-from rpy2.robjects import pandas2ri
-from rpy2.robjects.conversion import localconverter
 
 # 配置日志记录
 logging.basicConfig(level=logging.INFO,
@@ -92,10 +90,22 @@ def initialize_r_environment():
 # 定义一个全局变量，存储完整的Rscript路径（如果需要）
 CONDA_R_SCRIPT_PATH = None
 
-# 初始化R环境
-r_initialized = initialize_r_environment()
-if not r_initialized:
-    logger.error("!!! R环境初始化失败，可能会影响后续操作 !!!")
+# R环境在第一次使用R时初始化，导入本模块不会启动R或rpy2，Web进程可以快速启动
+# None表示尚未初始化
+r_initialized = None
+jsonlite_available = None
+_init_lock = threading.Lock()
+
+
+def ensure_r_environment():
+    """第一次使用R时初始化R环境（只执行一次），返回是否成功"""
+    global r_initialized
+    with _init_lock:
+        if r_initialized is None:
+            r_initialized = initialize_r_environment()
+            if not r_initialized:
+                logger.error("!!! R环境初始化失败，可能会影响后续操作 !!!")
+    return r_initialized
 
 
 # 安全转换R输出为Python字符串
@@ -152,10 +162,16 @@ def ensure_jsonlite_package():
         return False
 
 
-# 加载jsonlite包
-jsonlite_available = ensure_jsonlite_package()
-if not jsonlite_available:
-    logger.warning("jsonlite包不可用，可能会影响JSON处理功能")
+def ensure_rpy2_ready():
+    """第一次通过rpy2执行R代码时初始化R环境并加载jsonlite包（只执行一次）"""
+    global jsonlite_available
+    ensure_r_environment()
+    with _init_lock:
+        if jsonlite_available is None:
+            jsonlite_available = ensure_jsonlite_package()
+            if not jsonlite_available:
+                logger.warning("jsonlite包不可用，可能会影响JSON处理功能")
+    return jsonlite_available
 
 
 # R高级接口 - 基于文献中的高级接口实现
@@ -263,8 +279,12 @@ class RLowLevelInterface:
 def run_r_test(student_code, test_code):
     """运行R代码测试，返回测试结果"""
     try:
-        # 初始化R环境
+        # 初始化R环境（第一次调用时）
         logger.info("初始化R环境...")
+        ensure_rpy2_ready()
+        import rpy2.robjects as ro
+        from rpy2.robjects import pandas2ri
+        from rpy2.robjects.conversion import localconverter
 
         # 使用localconverter确保转换规则的上下文正确传递
         with localconverter(ro.default_converter):
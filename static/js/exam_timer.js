@@ -19,6 +19,7 @@ class ExamTimer {
             checkServerTime: false,               // 是否检查服务器时间
             serverTimeCheckInterval: 60,          // 服务器时间检查间隔(秒)
             serverTimeUrl: '/check-time',         // 服务器时间检查URL
+            serverEventsUrl: null,                // 服务器时间推送(SSE)URL，设置后优先使用推送
             examId: null,                         // 考试ID
             autoSubmitUrl: null                   // 自动提交URL
         }, options);
@@ -35,6 +36,7 @@ class ExamTimer {
         this.isRunning = false;
         this.timerInterval = null;
         this.serverCheckInterval = null;
+        this.eventSource = null;
         this.hasWarned = false;
         this.hasDanger = false;
 
@@ -58,11 +60,11 @@ class ExamTimer {
         // 设置计时器
         this.timerInterval = setInterval(() => this.tick(), 1000);
 
-        // 如果需要定期检查服务器时间
-        if (this.options.checkServerTime && this.options.examId) {
-            this.serverCheckInterval = setInterval(() => {
-                this.syncWithServerTime();
-            }, this.options.serverTimeCheckInterval * 1000);
+        // 优先使用服务器推送，不支持时定期检查服务器时间
+        if (this.options.serverEventsUrl && this.options.examId && window.EventSource) {
+            this.connectServerEvents();
+        } else if (this.options.checkServerTime && this.options.examId) {
+            this.startServerPolling();
         }
 
         console.log(`计时器已启动，剩余时间：${this.formatTime(this.remainingSeconds)}`);
@@ -78,6 +80,10 @@ class ExamTimer {
         if (this.serverCheckInterval) {
             clearInterval(this.serverCheckInterval);
         }
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
 
         this.timerInterval = null;
         this.serverCheckInterval = null;
@@ -252,6 +258,71 @@ class ExamTimer {
         }
     }
 
+    /**
+     * 定期轮询服务器时间
+     */
+    startServerPolling() {
+        if (this.serverCheckInterval) return;
+        this.serverCheckInterval = setInterval(() => {
+            this.syncWithServerTime();
+        }, this.options.serverTimeCheckInterval * 1000);
+    }
+
+    /**
+     * 连接服务器时间推送(SSE)。服务器每个连接只推送一个事件就关闭，
+     * 浏览器按事件中的retry间隔自动重连；EventSource彻底失败时改为轮询check_time
+     */
+    connectServerEvents() {
+        const source = new EventSource(`${this.options.serverEventsUrl}/${this.options.examId}`);
+        this.eventSource = source;
+
+        source.addEventListener('time', event => {
+            this.applyServerTime(JSON.parse(event.data));
+        });
+
+        source.addEventListener('ended', () => {
+            console.log('服务器推送考试已结束，强制结束计时');
+            source.close();
+            this.eventSource = null;
+            this.timeUp();
+        });
+
+        source.onerror = () => {
+            // 连接关闭时EventSource处于CONNECTING状态并自动重连；彻底失败时改为轮询
+            if (source.readyState === EventSource.CLOSED) {
+                console.warn('服务器时间推送不可用，改为定期检查服务器时间');
+                this.eventSource = null;
+                if (this.options.checkServerTime) {
+                    this.startServerPolling();
+                }
+            }
+        };
+    }
+
+    /**
+     * 应用服务器返回的剩余时间
+     */
+    applyServerTime(data) {
+        if (data.remaining_seconds === undefined) return;
+
+        // 记录时间差异
+        const diff = Math.abs(this.remainingSeconds - data.remaining_seconds);
+        console.log(`服务器时间同步：本地剩余${this.remainingSeconds}秒，服务器剩余${data.remaining_seconds}秒，差异${diff}秒`);
+
+        // 如果差异超过10秒，更新本地时间 - 减小阈值提高精度
+        if (diff > 10) {
+            this.remainingSeconds = data.remaining_seconds;
+            this.updateDisplay();
+            console.log(`已同步时间到服务器时间，剩余${this.remainingSeconds}秒`);
+        }
+
+        // 如果考试已结束，强制结束计时
+        if (data.status === 'ended' || data.remaining_seconds <= 0) {
+            console.log('服务器指示考试已结束，强制结束计时');
+            this.timeUp();
+        }
+    }
+
     /**
      * 与服务器时间同步
      */
@@ -270,25 +341,7 @@ class ExamTimer {
             })
             .then(data => {
                 console.log('服务器时间同步数据:', data);
-
-                if (data.remaining_seconds !== undefined) {
-                    // 记录时间差异
-                    const diff = Math.abs(this.remainingSeconds - data.remaining_seconds);
-                    console.log(`服务器时间同步：本地剩余${this.remainingSeconds}秒，服务器剩余${data.remaining_seconds}秒，差异${diff}秒`);
-
-                    // 如果差异超过10秒，更新本地时间 - 减小阈值提高精度
-                    if (diff > 10) {
-                        this.remainingSeconds = data.remaining_seconds;
-                        this.updateDisplay();
-                        console.log(`已同步时间到服务器时间，剩余${this.remainingSeconds}秒`);
-                    }
-
-                    // 如果考试已结束，强制结束计时
-                    if (data.status === 'ended' || data.remaining_seconds <= 0) {
-                        console.log('服务器指示考试已结束，强制结束计时');
-                        this.timeUp();
-                    }
-                }
+                this.applyServerTime(data);
             })
             .catch(error => {
                 console.error('服务器时间同步失败:', error);
@@ -0,0 +1,25 @@
+/**
+ * 评分任务状态轮询
+ * 结果页在评分任务排队或执行中时定期查询状态，完成后自动刷新页面
+ */
+function pollGradingStatus(statusUrl, interval = 3000) {
+    function check() {
+        fetch(statusUrl, { credentials: 'same-origin' })
+            .then(response => response.json())
+            .then(data => {
+                const job = data.job;
+                if (!job || job.status === 'success' || job.status === 'failed') {
+                    // 评分结束，刷新页面显示最新成绩
+                    window.location.reload();
+                    return;
+                }
+                setTimeout(check, interval);
+            })
+            .catch(error => {
+                console.error('查询评分状态失败:', error);
+                setTimeout(check, interval * 2);
+            });
+    }
+
+    setTimeout(check, interval);
+}
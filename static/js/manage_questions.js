@@ -4,9 +4,10 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // 全局变量
     let hasUnsavedChanges = false;
-    let currentPage = 1;
+    // 下一页的游标（键集分页），为空表示没有更多题目
+    let nextCursor = typeof AVAILABLE_NEXT_CURSOR !== 'undefined' ? AVAILABLE_NEXT_CURSOR : null;
     let isLoadingMore = false;
-    let noMoreQuestions = false;
+    let noMoreQuestions = !nextCursor;
     const ITEMS_PER_PAGE = 20;
 
     // DOM元素引用
@@ -96,6 +97,20 @@ document.addEventListener('DOMContentLoaded', function() {
             });
         });
 
+        // 题组变更自动保存
+        document.querySelectorAll('.pool-input').forEach(input => {
+            input.addEventListener('change', function() {
+                updateQuestionPool(this.getAttribute('data-question-id'), this.value.trim());
+            });
+        });
+
+        // 个性化试卷设置
+        document.querySelectorAll('.variant-setting').forEach(checkbox => {
+            checkbox.addEventListener('change', function() {
+                updateVariantSetting(this.getAttribute('data-setting'), this.checked);
+            });
+        });
+
         // 单个题目添加/移除按钮
         document.querySelectorAll('.add-btn').forEach(btn => {
             btn.addEventListener('click', function() {
@@ -202,6 +217,10 @@ document.addEventListener('DOMContentLoaded', function() {
             loadMoreBtn.addEventListener('click', function() {
                 loadMoreQuestions();
             });
+            if (noMoreQuestions) {
+                loadMoreBtn.textContent = '没有更多题目';
+                loadMoreBtn.disabled = true;
+            }
         }
 
         // 随机抽题预览和应用
@@ -372,6 +391,57 @@ document.addEventListener('DOMContentLoaded', function() {
         markUnsaved();
     }
 
+    // 更新题目所属的题组
+    function updateQuestionPool(questionId, pool) {
+        fetch(`/exams/${EXAM_ID}/update_question_pool/${questionId}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': CSRF_TOKEN
+            },
+            body: JSON.stringify({ pool: pool })
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                showSaveStatus('题组已保存');
+                updateStats();
+            } else {
+                console.error('更新题组失败:', data.message);
+                alert('更新题组失败: ' + data.message);
+            }
+        })
+        .catch(error => {
+            console.error('更新题组请求失败:', error);
+            alert('更新题组请求失败，请重试');
+        });
+    }
+
+    // 更新打乱题目/选项设置
+    function updateVariantSetting(setting, enabled) {
+        fetch(`/exams/${EXAM_ID}/variant_settings`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': CSRF_TOKEN
+            },
+            body: JSON.stringify({ [setting]: enabled })
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                showSaveStatus('试卷设置已保存');
+            } else {
+                console.error('更新试卷设置失败:', data.message);
+                alert('更新试卷设置失败: ' + data.message);
+            }
+        })
+        .catch(error => {
+            console.error('更新试卷设置请求失败:', error);
+            alert('更新试卷设置请求失败，请重试');
+        });
+    }
+
     // 添加题目
     function addQuestion(questionId) {
         fetch(`/exams/${EXAM_ID}/add_question/${questionId}`, {
@@ -754,7 +824,6 @@ document.addEventListener('DOMContentLoaded', function() {
         if (isLoadingMore || noMoreQuestions) return;
 
         isLoadingMore = true;
-        currentPage++;
 
         // 更新按钮状态
         loadMoreBtn.textContent = '加载中...';
@@ -767,10 +836,19 @@ document.addEventListener('DOMContentLoaded', function() {
         const categoryFilter = filterCategory ? filterCategory.value : '';
 
         // 发送请求加载更多题目
-        fetch(`/exams/${EXAM_ID}/available_questions?page=${currentPage}&limit=${ITEMS_PER_PAGE}&search=${searchText}&type=${typeFilter}&difficulty=${difficultyFilter}&category=${categoryFilter}`)
+        const params = new URLSearchParams({
+            cursor: nextCursor || '',
+            limit: ITEMS_PER_PAGE,
+            search: searchText,
+            type: typeFilter,
+            difficulty: difficultyFilter,
+            category: categoryFilter
+        });
+        fetch(`/exams/${EXAM_ID}/available_questions?${params.toString()}`)
             .then(response => response.json())
             .then(data => {
                 if (data.success) {
+                    nextCursor = data.next_cursor;
                     if (data.questions.length === 0) {
                         noMoreQuestions = true;
                         loadMoreBtn.textContent = '没有更多题目';
@@ -784,8 +862,14 @@ document.addEventListener('DOMContentLoaded', function() {
                         });
 
                         // 恢复按钮状态
-                        loadMoreBtn.textContent = '加载更多题目';
-                        loadMoreBtn.disabled = false;
+                        if (data.has_next) {
+                            loadMoreBtn.textContent = '加载更多题目';
+                            loadMoreBtn.disabled = false;
+                        } else {
+                            noMoreQuestions = true;
+                            loadMoreBtn.textContent = '没有更多题目';
+                            loadMoreBtn.disabled = true;
+                        }
 
                         // 为新添加的行绑定事件
                         document.querySelectorAll('.available-question-row:not(.initialized)').forEach(row => {
@@ -926,7 +1010,7 @@ document.addEventListener('DOMContentLoaded', function() {
         .then(response => response.json())
         .then(data => {
             if (data.success) {
-                showSaveStatus(`已随机抽取 ${data.total_count} 道题目`);
+                showSaveStatus(`已随机抽取 ${data.total_count} 道题目（随机种子: ${data.seed}）`);
                 hasUnsavedChanges = false;
                 setTimeout(() => {
                     window.location.reload();
@@ -949,6 +1033,7 @@ document.addEventListener('DOMContentLoaded', function() {
     function getRandomSettings() {
         return {
             category_id: document.getElementById('category_id').value,
+            seed: document.getElementById('random_seed') ? (parseInt(document.getElementById('random_seed').value) || null) : null,
             choice_count: parseInt(document.getElementById('choice_count').value) || 0,
             choice_difficulty_min: parseInt(document.getElementById('choice_difficulty_min').value) || 0,
             choice_difficulty_max: parseInt(document.getElementById('choice_difficulty_max').value) || 0,
@@ -1032,11 +1117,20 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('fill_blank_questions_count').textContent = fillBlankCount;
         document.getElementById('programming_questions_count').textContent = programmingCount;
 
-        // 计算总分值
+        // 计算总分值：同一题组只计一道题（取最高分值）
         let totalScore = 0;
+        const poolScores = {};
         document.querySelectorAll('.score-input').forEach(input => {
-            totalScore += parseFloat(input.value) || 0;
+            const value = parseFloat(input.value) || 0;
+            const poolInput = input.closest('tr').querySelector('.pool-input');
+            const pool = poolInput ? poolInput.value.trim() : '';
+            if (pool) {
+                poolScores[pool] = Math.max(poolScores[pool] || 0, value);
+            } else {
+                totalScore += value;
+            }
         });
+        Object.values(poolScores).forEach(value => { totalScore += value; });
 
         document.getElementById('total_score').textContent = totalScore.toFixed(1);
     }
@@ -1,5 +1,6 @@
 # test_r_integration.py
 import r_setup  # 首先导入r_setup
+r_setup.ensure_rpy2_ready()  # 初始化R环境
 
 import os
 import sys
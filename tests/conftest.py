@@ -0,0 +1,44 @@
+# 测试公共夹具：每个测试使用临时目录中的全新SQLite数据库，不启动后台评分线程
+import os
+import sys
+
+import pytest
+
+# 允许在项目根目录直接运行 pytest
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+pytest.importorskip('flask_sqlalchemy')
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """按测试配置创建的应用，测试期间处于应用上下文中"""
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///' + str(tmp_path / 'test.db'))
+    monkeypatch.setenv('GRADING_WORKER_INLINE', '0')
+    monkeypatch.setenv('ANSWER_BUFFER_MODE', 'write_through')
+    monkeypatch.setenv('GRADING_CONCURRENT', '0')
+
+    from app import create_app
+    from models.db import db
+    from exams.exam_snapshot import snapshot_cache
+    from exams.question_sampler import question_index, question_histogram
+
+    # 进程内缓存按ID缓存，每个测试的数据库都从ID 1开始，先清空
+    snapshot_cache.invalidate_all()
+    question_index.invalidate()
+    question_histogram.invalidate()
+
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def session(app):
+    from models.db import db
+    return db.session
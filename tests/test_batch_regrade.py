@@ -0,0 +1,124 @@
+# 整场考试批量重新评分与逐份答卷评分(grade_score)的结果一致
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from exams.exam_variants import ExamVariant
+from grading.batch_regrade import regrade_exam
+from grading.job_queue import grade_score
+from models.exam import Exam
+from models.exam_question import ExamQuestion
+from models.question import Question
+from models.question_option import QuestionOption
+from models.score import Score
+from models.student_answer import StudentAnswer
+
+
+@pytest.fixture
+def exam(session):
+    """
+    一场带题组和未知题型的考试，三份已提交答卷：
+    每份答卷都回答了题组中的两道题（其中一道不属于该学生的试卷），
+    第一份答卷还回答了未知题型的题目
+    """
+    now = datetime.utcnow()
+    exam = Exam(title='考试', start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=1),
+                variant_seed=7)
+    session.add(exam)
+
+    choice = Question(title='选择题', content='内容', question_type='choice')
+    fill = Question(title='填空题', content='内容', question_type='fill_blank', standard_answer='mean;average')
+    pool_a = Question(title='题组A', content='内容', question_type='fill_blank', standard_answer='vector')
+    pool_b = Question(title='题组B', content='内容', question_type='fill_blank', standard_answer='list')
+    essay = Question(title='简答题', content='内容', question_type='essay')
+    session.add_all([choice, fill, pool_a, pool_b, essay])
+    session.flush()
+
+    right = QuestionOption(question_id=choice.id, content='对', is_correct=True, order=0)
+    wrong = QuestionOption(question_id=choice.id, content='错', is_correct=False, order=1)
+    session.add_all([right, wrong])
+    session.add_all([
+        ExamQuestion(exam_id=exam.id, question_id=choice.id, order=0, score=5),
+        ExamQuestion(exam_id=exam.id, question_id=fill.id, order=1, score=4),
+        ExamQuestion(exam_id=exam.id, question_id=pool_a.id, order=2, score=3, pool='P'),
+        ExamQuestion(exam_id=exam.id, question_id=pool_b.id, order=3, score=3, pool='P'),
+        ExamQuestion(exam_id=exam.id, question_id=essay.id, order=4, score=2),
+    ])
+    session.flush()
+
+    def add_score(student_id, question_ids, answers):
+        score = Score(student_id=student_id, exam_id=exam.id, is_final_submit=True,
+                      variant=ExamVariant(question_ids).to_json() if question_ids else None)
+        session.add(score)
+        session.flush()
+        session.add_all(StudentAnswer(score_id=score.id, question_id=question_id, answer_content=content)
+                        for question_id, content in answers)
+
+    # 题组外的答案都填标准答案：如果被评分就会得分
+    add_score(1, [choice.id, fill.id, pool_a.id, essay.id], [
+        (choice.id, json.dumps([right.id])),
+        (fill.id, 'Mean'),
+        (pool_a.id, 'vectr'),
+        (pool_b.id, 'list'),
+        (essay.id, '答案'),
+    ])
+    add_score(2, [choice.id, fill.id, pool_b.id, essay.id], [
+        (choice.id, json.dumps([wrong.id])),
+        (fill.id, 'averge'),
+        (pool_a.id, 'vector'),
+        (pool_b.id, 'list'),
+    ])
+    # 没有保存试卷时按种子生成，题组中的一道题不属于该学生的试卷
+    add_score(3, None, [
+        (choice.id, ''),
+        (fill.id, 'median'),
+        (pool_a.id, 'vector'),
+        (pool_b.id, 'list'),
+    ])
+    session.commit()
+    return exam
+
+
+def _results(exam_id):
+    scores = Score.query.filter_by(exam_id=exam_id).order_by(Score.id).all()
+    answers = StudentAnswer.query.filter(
+        StudentAnswer.score_id.in_([score.id for score in scores])
+    ).order_by(StudentAnswer.id).all()
+    return ([(score.id, score.total_score, score.is_graded) for score in scores],
+            [(answer.id, answer.points_earned, answer.feedback) for answer in answers])
+
+
+def _reset(session, exam_id):
+    score_ids = [score.id for score in Score.query.filter_by(exam_id=exam_id)]
+    StudentAnswer.query.filter(StudentAnswer.score_id.in_(score_ids)).update(
+        {'points_earned': 0, 'feedback': None}, synchronize_session=False)
+    Score.query.filter(Score.id.in_(score_ids)).update(
+        {'total_score': 0, 'is_graded': False}, synchronize_session=False)
+    session.commit()
+    session.expire_all()
+
+
+def test_regrade_exam_matches_per_score_grading(session, exam):
+    for score in Score.query.filter_by(exam_id=exam.id).order_by(Score.id).all():
+        grade_score(score.id)
+    session.expire_all()
+    expected_scores, expected_answers = _results(exam.id)
+
+    _reset(session, exam.id)
+    report = regrade_exam(exam.id, max_workers=1)
+    session.expire_all()
+    scores, answers = _results(exam.id)
+
+    assert report['scores'] == 3
+    assert scores == expected_scores
+    assert answers == expected_answers
+
+    # 有未知题型答案的答卷不标记为已评分，其余答卷已评分
+    assert [is_graded for _, _, is_graded in scores] == [False, True, True]
+    # 不属于学生试卷的题组答案计0分，即使内容是标准答案
+    pool_answers = StudentAnswer.query.filter(StudentAnswer.answer_content.in_(['vector', 'list'])).all()
+    assert sorted(answer.points_earned for answer in pool_answers) == [0, 0, 0, 3, 3]
+    # 总分等于答案得分之和
+    for score_id, total_score, _ in scores:
+        assert total_score == sum(answer.points_earned for answer in StudentAnswer.query.filter_by(score_id=score_id))
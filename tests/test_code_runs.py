@@ -0,0 +1,66 @@
+# "运行代码"的后台执行状态：排队、开始执行、完成和中断判断
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils import code_runs
+
+
+@pytest.fixture(autouse=True)
+def runs_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(code_runs, 'RUNS_DIR', str(tmp_path))
+
+
+def _wait_for(run_id, status, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        run = code_runs.get_run(run_id, 1)
+        if run['status'] == status:
+            return run
+        time.sleep(0.01)
+    raise AssertionError(f'运行没有进入{status}状态')
+
+
+def test_run_is_queued_until_started():
+    start = threading.Event()
+    finish = threading.Event()
+
+    async def execute(on_start):
+        # 模拟等待并发名额
+        await asyncio.get_running_loop().run_in_executor(None, start.wait)
+        on_start()
+        await asyncio.get_running_loop().run_in_executor(None, finish.wait)
+        return {'output': 'ok'}
+
+    run_id = code_runs.start_run(1, execute)
+    run = code_runs.get_run(run_id, 1)
+    assert run['status'] == code_runs.STATUS_QUEUED
+    # 排队时间再长也不算中断
+    assert not code_runs.is_interrupted(run, max_run_seconds=0)
+
+    start.set()
+    run = _wait_for(run_id, code_runs.STATUS_RUNNING)
+    assert run['started_at'] >= run.get('queued_at', 0)
+    assert not code_runs.is_interrupted(run, max_run_seconds=60)
+    assert code_runs.is_interrupted(dict(run, started_at=time.time() - 61), max_run_seconds=60)
+
+    finish.set()
+    run = _wait_for(run_id, code_runs.STATUS_DONE)
+    assert run['result'] == {'output': 'ok'}
+
+
+def test_run_belongs_to_its_user():
+    async def execute(on_start):
+        on_start()
+        return {'output': ''}
+
+    run_id = code_runs.start_run(1, execute)
+    assert code_runs.get_run(run_id, 2) is None
+    assert code_runs.get_run('../' + run_id, 1) is None
+
+
+def test_unfinished_run_of_exited_process_is_interrupted():
+    run = {'status': code_runs.STATUS_QUEUED, 'pid': 2 ** 22 + 12345, 'queued_at': time.time()}
+    assert code_runs.is_interrupted(run, max_run_seconds=60)
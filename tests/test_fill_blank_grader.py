@@ -0,0 +1,122 @@
+# 填空题评分：已编译的标准答案和相似度上限剪枝与逐个计算ratio()的原始实现结果一致
+import random
+from difflib import SequenceMatcher
+from types import SimpleNamespace
+
+import pytest
+
+from grading.fill_blank_grader import FillBlankGrader, get_matcher
+
+
+def _brute_force(grader, answer_content, standard_answer, max_points):
+    """编译标准答案之前的评分循环：逐个精确比较，再对每个备选答案计算ratio()"""
+    if not answer_content or not answer_content.strip():
+        return 0, "未作答"
+    student_answer = answer_content.strip()
+    if not standard_answer:
+        return 0, "题目缺少标准答案，请联系老师"
+
+    correct_answers = [ans.strip() for ans in standard_answer.split(';')]
+    for correct in correct_answers:
+        if not grader.case_sensitive:
+            if student_answer.lower() == correct.lower():
+                return max_points, "回答正确"
+        elif student_answer == correct:
+            return max_points, "回答正确"
+
+    if grader.fuzzy_match:
+        best_match = 0
+        best_match_answer = ""
+        for correct in correct_answers:
+            student = student_answer.lower() if not grader.case_sensitive else student_answer
+            standard = correct.lower() if not grader.case_sensitive else correct
+            similarity = SequenceMatcher(None, student, standard).ratio()
+            if similarity > best_match:
+                best_match = similarity
+                best_match_answer = correct
+        if best_match >= grader.fuzzy_threshold:
+            return round(max_points * best_match, 2), f"接近正确答案 '{best_match_answer}'，相似度: {best_match:.2f}"
+
+    return 0, "回答错误，请参考正确答案"
+
+
+def _assert_same(grader, standard_answer, contents, max_points=10):
+    question = SimpleNamespace(standard_answer=standard_answer)
+    expected = [_brute_force(grader, content, standard_answer, max_points) for content in contents]
+
+    graded = []
+    for content in contents:
+        answer = SimpleNamespace(answer_content=content, points_earned=None, feedback=None)
+        grader.grade(answer, question, max_points)
+        graded.append((answer.points_earned, answer.feedback))
+    assert graded == expected
+
+    answers = [SimpleNamespace(answer_content=content, points_earned=None, feedback=None) for content in contents]
+    grader.grade_batch(answers, question, max_points)
+    assert [(answer.points_earned, answer.feedback) for answer in answers] == expected
+
+
+@pytest.mark.parametrize('case_sensitive', [False, True])
+def test_case_sensitivity(case_sensitive):
+    grader = FillBlankGrader(case_sensitive=case_sensitive)
+    _assert_same(grader, 'Mean;sd', ['Mean', 'mean', 'MEAN', ' mEan ', 'Meen', 'SD', 'Sd', 'sdd', 'median'])
+
+
+def test_duplicate_alternatives():
+    # 重复的备选答案：相似度相同时保留第一个，反馈中的标准答案与原实现一致
+    grader = FillBlankGrader()
+    _assert_same(grader, 'vector;Vector;vector;VECTOR', ['vectr', 'Vectorr', 'vector', 'vec'])
+    _assert_same(FillBlankGrader(case_sensitive=True), 'abcd;ABCD;abcd', ['abce', 'ABCE', 'abCD'])
+
+
+def test_empty_alternatives():
+    grader = FillBlankGrader()
+    for standard_answer in ['a;;b', 'mean;', ';mean', ';', ' ; ;', '', 'mean; ;median']:
+        _assert_same(grader, standard_answer, ['a', 'b', 'mean', 'meen', 'x', '', '   ', ';'])
+
+
+def test_threshold_boundary():
+    # 'abcde'与'abcdf'的相似度正好是0.8，与阈值相等时给部分分
+    assert SequenceMatcher(None, 'abcdf', 'abcde').ratio() == 0.8
+    for threshold in [0.8, 0.8000001, 0.7999999]:
+        grader = FillBlankGrader(fuzzy_threshold=threshold)
+        _assert_same(grader, 'abcde', ['abcdf', 'abcd', 'abcdef', 'bcdf'])
+        _assert_same(grader, 'xyz;abcde', ['abcdf'])
+    # 第二个备选答案的上限正好等于当前最佳值时不能替换第一个
+    _assert_same(FillBlankGrader(fuzzy_threshold=0.5), 'abcdx;abcdy', ['abcdz'])
+
+
+def test_fuzzy_match_disabled():
+    _assert_same(FillBlankGrader(fuzzy_match=False), 'mean;average', ['mean', 'meen', 'Average'])
+
+
+@pytest.mark.parametrize('case_sensitive', [False, True])
+@pytest.mark.parametrize('threshold', [0.5, 0.75, 0.8, 0.9])
+def test_random_answers_match_brute_force(case_sensitive, threshold):
+    # 小字母表生成大量相近的答案，覆盖剪枝的各个分支
+    rng = random.Random(f'{case_sensitive}:{threshold}')
+    alphabet = 'aAbBc '
+
+    def word(max_length):
+        return ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, max_length)))
+
+    grader = FillBlankGrader(case_sensitive=case_sensitive, fuzzy_threshold=threshold)
+    for _ in range(50):
+        standard_answer = ';'.join(word(6) for _ in range(rng.randint(1, 5)))
+        contents = [word(7) for _ in range(20)]
+        _assert_same(grader, standard_answer, contents)
+
+
+def test_best_match_equals_max_ratio():
+    alternatives = ['abc', 'abd', 'xbc', '', 'abcd']
+    matcher = get_matcher(';'.join(alternatives), case_sensitive=True)
+    for student in ['abc', 'ab', 'abce', 'zzz', 'bcd']:
+        best, best_answer = 0, ''
+        for alternative in alternatives:
+            similarity = SequenceMatcher(None, student, alternative).ratio()
+            if similarity > best:
+                best, best_answer = similarity, alternative
+        # 阈值不超过最佳相似度时结果相同，超过时不会返回达到阈值的答案
+        assert matcher.best_match(student, 0) == (best, best_answer)
+        assert matcher.best_match(student, best) == (best, best_answer)
+        assert matcher.best_match(student, best + 0.01)[0] < best + 0.01
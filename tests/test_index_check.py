@@ -0,0 +1,16 @@
+# 常用查询的索引检查：在迁移后的数据库上执行 EXPLAIN QUERY PLAN，每个查询都必须使用预期的索引
+from benchmarks.index_check import check_hot_queries, check_plan, explain
+from models.question import Question
+
+
+def test_hot_queries_use_expected_indexes(app):
+    results = check_hot_queries()
+    assert results
+    failures = {name: (problems, plan) for name, plan, problems in results if problems}
+    assert not failures, failures
+
+
+def test_check_plan_reports_full_scan(app):
+    plan = explain(Question.query.filter_by(title='题目').statement)
+    problems = check_plan(plan, 'question', None, False)
+    assert 'question 全表扫描' in problems
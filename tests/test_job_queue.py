@@ -0,0 +1,143 @@
+# 评分任务队列：领取、去重、租约续期、过期恢复和租约失效后的结果丢弃
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from grading import job_queue
+from models.grading_job import (GradingJob, JOB_PENDING, JOB_RUNNING, JOB_SUCCESS, JOB_FAILED,
+                                JOB_TYPE_SCORE)
+
+
+def _expire_lease(session, job_id):
+    GradingJob.query.filter_by(id=job_id).update({'lease_expires_at': datetime.utcnow() - timedelta(seconds=1)})
+    session.commit()
+
+
+def test_claim_next_job_takes_oldest_pending_and_sets_lease(session):
+    first = job_queue.enqueue_grading_job(1)
+    second = job_queue.enqueue_grading_job(2)
+
+    job = job_queue.claim_next_job()
+    assert job.id == first.id
+    assert job.status == JOB_RUNNING
+    assert job.attempts == 1
+    assert job.lease_expires_at > datetime.utcnow()
+
+    assert job_queue.claim_next_job().id == second.id
+    assert job_queue.claim_next_job() is None
+
+
+def test_enqueue_reuses_pending_and_running_jobs(session):
+    job = job_queue.enqueue_grading_job(1)
+    assert job_queue.enqueue_grading_job(1).id == job.id
+
+    job_queue.claim_next_job()
+    # 执行中再次提交/重新评分不会排入第二个任务
+    assert job_queue.enqueue_grading_job(1).id == job.id
+    assert GradingJob.query.filter_by(score_id=1).count() == 1
+
+    GradingJob.query.filter_by(id=job.id).update({'status': JOB_SUCCESS})
+    session.commit()
+    assert job_queue.enqueue_grading_job(1).id != job.id
+
+
+def test_enqueue_exam_regrade_reuses_running_job(session):
+    job = job_queue.enqueue_exam_regrade_job(1)
+    job_queue.claim_next_job()
+    assert job_queue.enqueue_exam_regrade_job(1).id == job.id
+
+
+def test_renew_lease_only_for_current_claim(session):
+    job = job_queue.enqueue_grading_job(1)
+    job = job_queue.claim_next_job()
+    _expire_lease(session, job.id)
+
+    assert job_queue.renew_lease(job.id, attempt=1)
+    session.expire_all()
+    assert session.get(GradingJob, job.id).lease_expires_at > datetime.utcnow()
+    # 其它领取编号的租约不能续期
+    assert not job_queue.renew_lease(job.id, attempt=2)
+
+
+def test_recover_stale_jobs_requeues_expired_leases(session):
+    live = job_queue.enqueue_grading_job(1)
+    expired = job_queue.enqueue_grading_job(2)
+    job_queue.claim_next_job()
+    job_queue.claim_next_job()
+    _expire_lease(session, expired.id)
+
+    assert job_queue.recover_stale_jobs() == 1
+    session.expire_all()
+    assert session.get(GradingJob, live.id).status == JOB_RUNNING
+    recovered = session.get(GradingJob, expired.id)
+    assert recovered.status == JOB_PENDING
+    assert recovered.lease_expires_at is None
+
+
+def test_recover_stale_jobs_fails_jobs_out_of_attempts(session):
+    job = job_queue.enqueue_grading_job(1)
+    job_queue.claim_next_job()
+    GradingJob.query.filter_by(id=job.id).update({'attempts': job_queue.MAX_ATTEMPTS})
+    session.commit()
+    _expire_lease(session, job.id)
+
+    assert job_queue.recover_stale_jobs() == 1
+    session.expire_all()
+    failed = session.get(GradingJob, job.id)
+    assert failed.status == JOB_FAILED
+    assert failed.finished_at is not None
+
+
+def test_recover_stale_jobs_handles_jobs_without_lease(session):
+    job = GradingJob(job_type=JOB_TYPE_SCORE, score_id=1, status=JOB_RUNNING, attempts=1,
+                     started_at=datetime.utcnow() - timedelta(minutes=job_queue.STALE_JOB_MINUTES + 1))
+    session.add(job)
+    session.commit()
+
+    assert job_queue.recover_stale_jobs() == 1
+    session.expire_all()
+    assert session.get(GradingJob, job.id).status == JOB_PENDING
+
+
+def test_run_job_records_success(session, monkeypatch):
+    monkeypatch.setattr(job_queue, 'grade_score', lambda score_id: {'graded': score_id})
+    job_queue.enqueue_grading_job(7)
+
+    job = job_queue.run_job(job_queue.claim_next_job())
+    assert job.status == JOB_SUCCESS
+    assert json.loads(job.result) == {'graded': 7}
+    assert job.finished_at is not None
+    assert job.lease_expires_at is None
+
+
+def test_run_job_requeues_failed_attempt(session, monkeypatch):
+    def fail(score_id):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(job_queue, 'grade_score', fail)
+    job_queue.enqueue_grading_job(7)
+
+    job = job_queue.run_job(job_queue.claim_next_job())
+    assert job.status == JOB_PENDING
+    assert job.error == 'boom'
+    assert job.finished_at is None
+
+
+def test_run_job_drops_result_after_lease_was_lost(session, monkeypatch):
+    def grade_while_recovered(score_id):
+        # 评分期间租约过期，任务被恢复并由另一个工作进程重新领取
+        _expire_lease(session, job_id)
+        job_queue.recover_stale_jobs()
+        assert job_queue.claim_next_job().attempts == 2
+        return {'graded': score_id}
+
+    monkeypatch.setattr(job_queue, 'grade_score', grade_while_recovered)
+    job_id = job_queue.enqueue_grading_job(7).id
+
+    job = job_queue.run_job(job_queue.claim_next_job())
+    # 新的领取不受旧工作进程的结果影响
+    assert job.status == JOB_RUNNING
+    assert job.attempts == 2
+    assert job.result is None
+    assert job.lease_expires_at is not None
@@ -0,0 +1,79 @@
+# 随机抽题的题目ID索引：会话中的逐条修改和批量语句提交后都会失效
+import random
+
+import pytest
+from sqlalchemy import delete, update
+
+from exams.question_sampler import question_index, sample_questions
+from models.question import Question
+
+
+@pytest.fixture
+def questions(session):
+    rows = [Question(title=f'题目{i}', content='内容', question_type='choice', difficulty=3) for i in range(4)]
+    session.add_all(rows)
+    session.commit()
+    return [row.id for row in rows]
+
+
+def _choice_ids():
+    return [ref.id for ref in question_index.candidates('choice')]
+
+
+def test_index_sees_flushed_changes(session, questions):
+    assert _choice_ids() == questions
+    session.add(Question(title='新题目', content='内容', question_type='choice', difficulty=3))
+    session.commit()
+    assert len(_choice_ids()) == len(questions) + 1
+
+
+def test_index_invalidated_by_query_update_and_delete(session, questions):
+    assert _choice_ids() == questions
+
+    Question.query.filter(Question.id == questions[0]).update({'question_type': 'fill_blank'})
+    session.commit()
+    assert _choice_ids() == questions[1:]
+
+    Question.query.filter(Question.id == questions[1]).delete()
+    session.commit()
+    assert _choice_ids() == questions[2:]
+
+
+def test_index_invalidated_by_core_statements(session, questions):
+    assert _choice_ids() == questions
+
+    session.execute(update(Question.__table__).where(Question.__table__.c.id == questions[0])
+                    .values(question_type='programming'))
+    session.commit()
+    assert _choice_ids() == questions[1:]
+
+    session.execute(delete(Question).where(Question.id == questions[1]))
+    session.commit()
+    assert _choice_ids() == questions[2:]
+
+
+def test_rolled_back_bulk_change_keeps_index(session, questions):
+    assert _choice_ids() == questions
+    Question.query.filter(Question.id == questions[0]).delete()
+    session.rollback()
+    assert _choice_ids() == questions
+    assert len(sample_questions(random.Random(1), 'choice', 2)) == 2
+
+
+def test_histogram_invalidated_by_bulk_statements(session, questions):
+    from exams.question_sampler import question_histogram
+
+    assert question_histogram.count('choice', 3, 3) == 4
+
+    Question.query.filter(Question.id == questions[0]).update({'difficulty': 5})
+    session.commit()
+    assert question_histogram.count('choice', 3, 3) == 3
+    assert question_histogram.count('choice', 4, 5) == 1
+
+    session.execute(delete(Question.__table__).where(Question.__table__.c.id == questions[1]))
+    session.commit()
+    assert question_histogram.count('choice') == 3
+
+    Question.query.filter(Question.id.in_(questions[2:])).delete()
+    session.commit()
+    assert question_histogram.count('choice') == 1
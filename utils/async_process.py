@@ -0,0 +1,141 @@
+# async_process.py - 基于asyncio的R子进程执行
+import os
+import signal
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 配置日志记录
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('r_async_process')
+
+# 同时运行的R进程数上限
+DEFAULT_MAX_CONCURRENCY = max(1, os.cpu_count() or 1)
+
+IS_WINDOWS = os.name == 'nt'
+
+# 运行期间采样资源用量的间隔(秒)
+USAGE_SAMPLE_INTERVAL = 0.2
+
+_loop = None
+_loop_lock = threading.Lock()
+_semaphore = None
+_rpy2_executor = None
+
+
+def get_max_concurrency():
+    """读取R进程并发上限(环境变量R_SANDBOX_MAX_CONCURRENCY)"""
+    try:
+        return max(1, int(os.environ.get('R_SANDBOX_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY)))
+    except ValueError:
+        return DEFAULT_MAX_CONCURRENCY
+
+
+def get_event_loop():
+    """
+    获取进程内共享的沙箱事件循环
+
+    所有R子进程都在这个循环中启动和等待，由同一个信号量限制并发，
+    等待中的请求不占用额外线程。
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name='r-sandbox-loop', daemon=True)
+            thread.start()
+            _loop = loop
+        return _loop
+
+
+def get_rpy2_executor():
+    """rpy2内嵌R不是线程安全的，所有rpy2调用在同一个线程中串行执行"""
+    global _rpy2_executor
+    with _loop_lock:
+        if _rpy2_executor is None:
+            _rpy2_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rpy2')
+        return _rpy2_executor
+
+
+async def run_on_sandbox_loop(coro):
+    """在共享沙箱事件循环中执行协程，可以从任意事件循环中await"""
+    loop = get_event_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+def run_sync(coro):
+    """在共享沙箱事件循环中执行协程，阻塞当前线程直到完成"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
+def _kill_process(process):
+    """终止进程及其进程组"""
+    try:
+        if IS_WINDOWS:
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def run_process(cmd, timeout, env=None, limiter=None, on_start=None):
+    """
+    异步执行外部命令，超时后终止进程
+
+    Args:
+        cmd: 命令及参数列表
+        timeout: 超时时间(秒)
+        env: 环境变量
+        limiter: ResourceLimiter，设置资源限制并统计资源用量
+        on_start: 无参函数，取得并发名额、即将启动进程时调用（在此之前一直在排队）
+
+    Returns:
+        tuple: (返回代码, 标准输出, 标准错误, 是否超时)
+    """
+    global _semaphore
+    # 信号量只在共享循环中创建和使用
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(get_max_concurrency())
+
+    async with _semaphore:
+        if on_start:
+            on_start()
+        if limiter:
+            limiter.start()
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=env,
+            # 独立进程组，超时时连同R启动的子进程一起终止
+            start_new_session=not IS_WINDOWS,
+            preexec_fn=limiter.preexec_fn if limiter else None
+        )
+        timed_out = False
+        communicate = asyncio.ensure_future(process.communicate())
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not communicate.done():
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            if limiter:
+                limiter.sample(process.pid)
+            await asyncio.wait({communicate}, timeout=min(remaining, USAGE_SAMPLE_INTERVAL))
+
+        if not communicate.done():
+            timed_out = True
+            logger.warning(f"R进程执行超时({timeout}秒)，终止进程: pid={process.pid}")
+            _kill_process(process)
+        stdout, stderr = await communicate
+
+    return (
+        process.returncode,
+        stdout.decode('utf-8', errors='replace'),
+        stderr.decode('utf-8', errors='replace'),
+        timed_out
+    )
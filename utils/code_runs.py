@@ -0,0 +1,154 @@
+# code_runs.py - 学生"运行代码"的后台执行：请求只登记任务并立即返回，R在共享沙箱事件循环中运行，客户端轮询结果
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import logging
+import tempfile
+from utils.async_process import get_event_loop
+
+# 配置日志记录
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('code_runs')
+
+# 运行结果保存在文件中，同一台机器上的多个Web进程都能读取，轮询请求不必回到启动运行的进程
+RUNS_DIR = os.environ.get('CODE_RUN_DIR', os.path.join(tempfile.gettempdir(), 'r_exam_code_runs'))
+# 结果文件保留时间(秒)，超过后在登记新任务时删除
+RESULT_TTL = float(os.environ.get('CODE_RUN_RESULT_TTL', 3600))
+
+# 运行状态：queued 等待并发名额（R_SANDBOX_MAX_CONCURRENCY），running R已开始执行，done 已完成
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+
+_RUN_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _path(run_id):
+    return os.path.join(RUNS_DIR, f'{run_id}.json')
+
+
+def _write(run_id, payload):
+    """原子地写入结果文件（先写临时文件再替换）"""
+    path = _path(run_id)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _cleanup():
+    """删除过期的结果文件"""
+    cutoff = time.time() - RESULT_TTL
+    try:
+        with os.scandir(RUNS_DIR) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+    except OSError:
+        pass
+
+
+def start_run(user_id, make_coro):
+    """
+    登记一次代码运行并在共享沙箱事件循环中启动，不等待执行完成
+
+    运行先处于queued状态；协程调用on_start(R真正开始执行)后变为running并记录开始时间。
+
+    Args:
+        user_id: 发起运行的用户ID，只有该用户可以读取结果
+        make_coro: 函数，参数为on_start回调，返回执行代码的协程，协程的结果为dict
+
+    Returns:
+        str: 运行ID
+    """
+    os.makedirs(RUNS_DIR, exist_ok=True)
+    _cleanup()
+
+    run_id = uuid.uuid4().hex
+    pid = os.getpid()
+    _write(run_id, {'status': STATUS_QUEUED, 'user_id': user_id, 'pid': pid, 'queued_at': time.time()})
+
+    def on_start():
+        try:
+            _write(run_id, {'status': STATUS_RUNNING, 'user_id': user_id, 'pid': pid, 'started_at': time.time()})
+        except OSError as e:
+            logger.error(f"保存运行状态失败: run={run_id}, {e}")
+
+    def finish(future):
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error(f"运行代码失败: run={run_id}, {e}")
+            result = {'status': 'error', 'output': f"执行错误: {str(e)}"}
+        try:
+            _write(run_id, {'status': STATUS_DONE, 'user_id': user_id, 'result': result})
+        except OSError as e:
+            logger.error(f"保存运行结果失败: run={run_id}, {e}")
+
+    future = asyncio.run_coroutine_threadsafe(make_coro(on_start), get_event_loop())
+    future.add_done_callback(finish)
+    return run_id
+
+
+def get_run(run_id, user_id):
+    """
+    读取一次代码运行的状态
+
+    Args:
+        run_id: 运行ID
+        user_id: 当前用户ID
+
+    Returns:
+        dict: {'status', 'started_at'(running时), 'result'(done时)}，运行不存在或不属于该用户时返回None
+    """
+    if not _RUN_ID.match(run_id or ''):
+        return None
+    try:
+        with open(_path(run_id), encoding='utf-8') as f:
+            payload = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if payload.get('user_id') != user_id:
+        return None
+    return payload
+
+
+def _process_alive(pid):
+    """登记运行的Web进程是否还在（只在POSIX系统上检查，Windows上的os.kill会终止进程）"""
+    if not pid or os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def is_interrupted(run, max_run_seconds):
+    """
+    未完成的运行是否已经中断
+
+    排队中的运行不按时间判断（排队时间取决于并发名额，不代表运行失败）；
+    已开始执行超过max_run_seconds仍未完成，或登记运行的进程已经退出(例如Web进程重启)时视为中断。
+
+    Args:
+        run: get_run返回的运行状态
+        max_run_seconds: 开始执行后最长的运行时间(秒)
+
+    Returns:
+        bool: 是否中断
+    """
+    if run['status'] == STATUS_DONE:
+        return False
+    if not _process_alive(run.get('pid')):
+        return True
+    return run['status'] == STATUS_RUNNING and time.time() - run.get('started_at', 0) > max_run_seconds
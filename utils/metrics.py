@@ -0,0 +1,189 @@
+# metrics.py - 评分与R执行的进程内指标，以Prometheus文本格式导出
+import re
+import time
+import threading
+from contextlib import contextmanager
+
+# 耗时直方图的桶(秒)
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 内存直方图的桶(MB)
+MEMORY_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048)
+
+# R脚本向标准错误输出的阶段计时行: "[PHASE] <阶段名> <秒数>"
+PHASE_LINE = re.compile(r'^\[PHASE\] (\w+) ([0-9.]+)\s*$', re.MULTILINE)
+
+
+class Histogram:
+    """按标签分组的累积直方图"""
+
+    def __init__(self, name, help_text, label_names, buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}  # 标签值 -> [各桶计数, 总和, 总数]
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for label_values, (bucket_counts, total, count) in sorted(self._series.items()):
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, label_values)]
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                lines.append(f'{self.name}_bucket{_labels(labels, bound)} {bucket_count}')
+            lines.append(f'{self.name}_bucket{_labels(labels, "+Inf")} {count}')
+            suffix = _labels(labels)
+            lines.append(f'{self.name}_sum{suffix} {round(total, 6)}')
+            lines.append(f'{self.name}_count{suffix} {count}')
+        return lines
+
+
+class Counter:
+    """按标签分组的计数器"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self._values.items()):
+            labels = [f'{name}="{_escape(v)}"' for name, v in zip(self.label_names, label_values)]
+            lines.append(f'{self.name}{_labels(labels)} {value}')
+        return lines
+
+
+def _labels(labels, le=None):
+    """拼接标签字符串，le为直方图桶的上界"""
+    if le is not None:
+        labels = labels + [f'le="{le}"']
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """评分相关指标的集合，所有更新在同一把锁内完成"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.executions = Counter(
+            'r_executions_total', 'R代码执行次数', ['source', 'status'])
+        self.execution_seconds = Histogram(
+            'r_execution_wall_seconds', '单次R执行的总耗时', ['source'])
+        self.execution_cpu_seconds = Histogram(
+            'r_execution_cpu_seconds', '单次R执行消耗的CPU时间', ['source'])
+        self.execution_memory = Histogram(
+            'r_execution_peak_memory_mb', '单次R执行的峰值内存(MB)', ['source'], MEMORY_BUCKETS)
+        self.phase_seconds = Histogram(
+            'r_execution_phase_seconds', 'R执行各阶段耗时', ['source', 'phase'])
+        self.question_seconds = Histogram(
+            'grading_question_seconds', '单个答案的评分耗时（按题目）', ['question_id', 'question_type'])
+        self.question_type_seconds = Histogram(
+            'grading_question_type_seconds', '单个答案的评分耗时（按题型）', ['question_type'])
+
+    def observe_execution(self, source, status, timings, resource_usage=None):
+        """
+        记录一次R执行
+
+        Args:
+            source: 执行来源(sandbox/grader_process/grader_worker)
+            status: 结果状态
+            timings: 各阶段耗时dict，total为总耗时
+            resource_usage: ResourceLimiter或工作进程返回的资源用量
+        """
+        with self._lock:
+            self.executions.inc(source, status)
+            for phase, seconds in timings.items():
+                if phase == 'total':
+                    self.execution_seconds.observe(seconds, source)
+                else:
+                    self.phase_seconds.observe(seconds, source, phase)
+            if resource_usage:
+                if resource_usage.get('cpu_seconds') is not None:
+                    self.execution_cpu_seconds.observe(resource_usage['cpu_seconds'], source)
+                if resource_usage.get('peak_rss_mb'):
+                    self.execution_memory.observe(resource_usage['peak_rss_mb'], source)
+
+    def observe_question(self, question_id, question_type, seconds):
+        """记录一个答案的评分耗时"""
+        with self._lock:
+            self.question_seconds.observe(seconds, str(question_id), question_type)
+            self.question_type_seconds.observe(seconds, question_type)
+
+    def render(self):
+        """生成Prometheus文本格式的指标"""
+        with self._lock:
+            lines = []
+            for metric in (self.executions, self.execution_seconds, self.execution_cpu_seconds,
+                           self.execution_memory, self.phase_seconds, self.question_seconds,
+                           self.question_type_seconds):
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# 进程级共享的指标
+registry = MetricsRegistry()
+
+
+@contextmanager
+def timed_question(question_id, question_type):
+    """统计一个答案的评分耗时"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe_question(question_id, question_type, time.perf_counter() - started)
+
+
+class PhaseTimer:
+    """记录一次执行中各阶段的耗时"""
+
+    def __init__(self):
+        self.timings = {}
+        self._started = time.perf_counter()
+        self._mark = self._started
+
+    def mark(self, phase):
+        """结束当前阶段并以phase命名"""
+        now = time.perf_counter()
+        self.timings[phase] = self.timings.get(phase, 0.0) + now - self._mark
+        self._mark = now
+
+    def add_r_phases(self, output):
+        """
+        从R输出中提取阶段计时行
+
+        Args:
+            output: R进程的标准错误/输出文本
+
+        Returns:
+            str: 去掉计时行之后的文本
+        """
+        if not output:
+            return output
+        for phase, seconds in PHASE_LINE.findall(output):
+            key = f'r_{phase}'
+            self.timings[key] = self.timings.get(key, 0.0) + float(seconds)
+        return PHASE_LINE.sub('', output).strip('\n') if '[PHASE]' in output else output
+
+    def finish(self):
+        """返回各阶段耗时(秒)，total为总耗时"""
+        result = {phase: round(seconds, 4) for phase, seconds in self.timings.items()}
+        result['total'] = round(time.perf_counter() - self._started, 4)
+        return result
@@ -0,0 +1,168 @@
+# pagination.py - 键集(keyset)分页：按排序列的值定位下一页，深翻页和第一页一样快
+import os
+import json
+import time
+import base64
+import threading
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+# 列表总数缓存的有效期(秒)。总数只用于显示，允许短时间内不准确
+COUNT_CACHE_TTL = float(os.environ.get('LISTING_COUNT_TTL', 30))
+# 缓存的总数条目上限，超过时清空
+COUNT_CACHE_MAX_ENTRIES = 1024
+
+_count_cache = {}  # key -> (过期时间, 总数)
+_count_lock = threading.Lock()
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(values, backwards=False):
+    """把排序列的值编码为URL安全的游标字符串"""
+    payload = {'v': [_encode_value(value) for value in values]}
+    if backwards:
+        payload['b'] = 1
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """
+    解析游标字符串
+
+    Args:
+        cursor: 游标字符串
+        size: 排序列的数量
+
+    Returns:
+        tuple: (排序列的值, 是否向前翻页)，游标为空或无效时返回(None, False)
+    """
+    if not cursor:
+        return None, False
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw.decode('utf-8'))
+        values = [_decode_value(value) for value in payload['v']]
+    except (ValueError, KeyError, TypeError):
+        return None, False
+    if len(values) != size or any(value is None for value in values):
+        return None, False
+    return values, bool(payload.get('b'))
+
+
+def _after(order, values):
+    """排在values之后的行的条件，order中每一项为(列, 是否降序)"""
+    clauses = []
+    for i, (column, descending) in enumerate(order):
+        equal = [order[j][0] == values[j] for j in range(i)]
+        beyond = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal, beyond))
+    # 第一列的范围条件让数据库可以直接用索引定位
+    first_column, first_descending = order[0]
+    bound = first_column <= values[0] if first_descending else first_column >= values[0]
+    return and_(bound, or_(*clauses))
+
+
+class KeysetPage:
+    """键集分页的一页结果"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor  # 下一页的游标，没有下一页时为None
+        self.prev_cursor = prev_cursor  # 上一页的游标，第一页时为None
+        self.total = total  # 符合条件的总数（可能是缓存的值）
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def pages(self):
+        if not self.total or not self.per_page:
+            return 0
+        return (self.total + self.per_page - 1) // self.per_page
+
+
+def keyset_paginate(query, order, cursor=None, per_page=20):
+    """
+    按键集分页执行查询
+
+    排序列的最后一列必须唯一（通常是主键），保证翻页时不重复、不遗漏。
+
+    Args:
+        query: 查询，不需要设置排序
+        order: 排序列表，每一项为(列, 是否降序)，例如[(Question.created_at, True), (Question.id, True)]
+        cursor: 上一次返回的next_cursor或prev_cursor，为空时返回第一页
+        per_page: 每页数量
+
+    Returns:
+        KeysetPage: 本页结果（total为None，需要总数时调用cached_count）
+    """
+    values, backwards = decode_cursor(cursor, len(order))
+    # 向前翻页时反转排序方向，取出后再倒序
+    fetch_order = [(column, descending != backwards) for column, descending in order]
+
+    columns = [column for column, _ in order]
+    fetch = query.order_by(None).add_columns(*columns)
+    if values is not None:
+        fetch = fetch.filter(_after(fetch_order, values))
+    fetch = fetch.order_by(*[column.desc() if descending else column.asc() for column, descending in fetch_order])
+    rows = fetch.limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    first_values = list(rows[0][1:]) if rows else None
+    last_values = list(rows[-1][1:]) if rows else None
+
+    if backwards:
+        next_cursor = encode_cursor(last_values) if rows else None
+        prev_cursor = encode_cursor(first_values, backwards=True) if has_more else None
+    else:
+        next_cursor = encode_cursor(last_values) if has_more else None
+        prev_cursor = encode_cursor(first_values, backwards=True) if rows and values is not None else None
+    return KeysetPage(items, per_page, next_cursor, prev_cursor)
+
+
+def cached_count(query, key):
+    """
+    列表总数，结果在进程内缓存COUNT_CACHE_TTL秒
+
+    Args:
+        query: 查询
+        key: 缓存键，应包含所有筛选条件和当前用户
+
+    Returns:
+        int: 总数
+    """
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+    total = query.order_by(None).count()
+    with _count_lock:
+        if len(_count_cache) >= COUNT_CACHE_MAX_ENTRIES:
+            _count_cache.clear()
+        _count_cache[key] = (now + COUNT_CACHE_TTL, total)
+    return total
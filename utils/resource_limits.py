@@ -0,0 +1,203 @@
+# resource_limits.py - R进程的资源限制与资源用量统计（Linux）
+import os
+import math
+import uuid
+import logging
+import platform
+
+# 配置日志记录
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('r_resource_limits')
+
+IS_LINUX = platform.system() == 'Linux'
+
+if IS_LINUX:
+    import resource
+else:
+    resource = None
+
+# R本身和已加载的共享库占用的虚拟地址空间(MB)，RLIMIT_AS在内存限制之上额外预留
+ADDRESS_SPACE_OVERHEAD_MB = 512
+# RLIMIT_NPROC按用户统计，计入该用户的全部进程和线程（Web服务器、评分线程池、R工作进程池的线程都算在内），
+# 设得太低会让R的fork/system在正常评分时失败，所以默认不设置；拦截fork炸弹依靠cgroup的pids.max。
+# 需要时用环境变量R_SANDBOX_MAX_PROCS设置，取值应远高于服务自身的线程数(ps -L -u <用户> | wc -l)
+DEFAULT_MAX_USER_PROCESSES = None
+# cgroup中单次执行最多允许的进程数
+DEFAULT_CGROUP_MAX_PIDS = 32
+# cgroup v2 cpu.max的周期(微秒)
+CGROUP_CPU_PERIOD = 100000
+
+
+def get_cgroup_root():
+    """
+    读取用于R沙箱的cgroup v2父目录(环境变量R_SANDBOX_CGROUP)
+
+    该目录需要已委派给当前用户，并在cgroup.subtree_control中启用memory、cpu和pids控制器。
+    """
+    path = os.environ.get('R_SANDBOX_CGROUP')
+    if not path or not IS_LINUX:
+        return None
+    if not os.path.isdir(path) or not os.access(path, os.W_OK):
+        logger.warning(f"cgroup目录不可用，只使用rlimit限制: {path}")
+        return None
+    return path
+
+
+def read_process_usage(pid):
+    """从/proc读取进程的峰值常驻内存(MB)和CPU时间(秒)，进程已退出时返回None"""
+    try:
+        peak_kb = 0
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    peak_kb = int(line.split()[1])
+                    break
+        with open(f'/proc/{pid}/stat') as f:
+            # 进程名可能包含空格，从最后一个')'之后开始解析
+            fields = f.read().rsplit(')', 1)[1].split()
+        ticks = os.sysconf('SC_CLK_TCK')
+        # utime, stime, cutime, cstime
+        cpu_seconds = sum(int(value) for value in fields[11:15]) / ticks
+        return peak_kb / 1024, cpu_seconds
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ResourceLimiter:
+    """
+    单次R执行的资源限制
+
+    在子进程exec之前(preexec_fn)设置RLIMIT_AS、RLIMIT_CPU（以及配置了R_SANDBOX_MAX_PROCS时的RLIMIT_NPROC），
+    配置了R_SANDBOX_CGROUP时还会把子进程放入独立的cgroup，由内核统计内存峰值和CPU时间。
+    未使用cgroup时，运行期间从/proc采样得到近似的资源用量。
+    """
+
+    def __init__(self, memory_limit=500, cpu_limit=1.0, timeout=None, limit_cpu_time=True):
+        """
+        Args:
+            memory_limit: 内存限制(MB)，为空时不限制
+            cpu_limit: CPU使用限制(核心数)
+            timeout: 执行超时时间(秒)，用来计算CPU时间上限
+            limit_cpu_time: 是否设置RLIMIT_CPU，常驻进程的CPU时间会累计，应关闭
+        """
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit or 1.0
+        self.cpu_seconds = None
+        if limit_cpu_time and timeout:
+            self.cpu_seconds = int(math.ceil(timeout * max(1.0, self.cpu_limit))) + 1
+        max_procs = os.environ.get('R_SANDBOX_MAX_PROCS')
+        self.max_user_processes = int(max_procs) if max_procs else DEFAULT_MAX_USER_PROCESSES
+
+        self.cgroup_path = None
+        self.peak_rss_mb = 0.0
+        self.cpu_time = 0.0
+
+    def start(self):
+        """启动进程前调用，配置了cgroup时创建本次执行的子cgroup"""
+        cgroup_root = get_cgroup_root()
+        if not cgroup_root:
+            return
+        path = os.path.join(cgroup_root, f'r-{uuid.uuid4().hex[:12]}')
+        try:
+            os.mkdir(path)
+            if self.memory_limit:
+                self._write_cgroup_file(path, 'memory.max', str(int(self.memory_limit * 1024 * 1024)))
+                self._write_cgroup_file(path, 'memory.swap.max', '0')
+            quota = int(self.cpu_limit * CGROUP_CPU_PERIOD)
+            self._write_cgroup_file(path, 'cpu.max', f'{quota} {CGROUP_CPU_PERIOD}')
+            self._write_cgroup_file(path, 'pids.max', str(DEFAULT_CGROUP_MAX_PIDS))
+            self.cgroup_path = path
+        except OSError as e:
+            logger.warning(f"创建cgroup失败，只使用rlimit限制: {e}")
+            self._remove_cgroup(path)
+
+    @staticmethod
+    def _write_cgroup_file(path, name, value):
+        try:
+            with open(os.path.join(path, name), 'w') as f:
+                f.write(value)
+        except FileNotFoundError:
+            # 对应控制器未启用
+            logger.debug(f"cgroup文件不存在: {name}")
+
+    @property
+    def preexec_fn(self):
+        """传给subprocess的preexec_fn，非Linux系统返回None"""
+        if not IS_LINUX:
+            return None
+
+        memory_bytes = None
+        if self.memory_limit:
+            memory_bytes = int((self.memory_limit + ADDRESS_SPACE_OVERHEAD_MB) * 1024 * 1024)
+        cpu_seconds = self.cpu_seconds
+        max_user_processes = self.max_user_processes
+        cgroup_procs = os.path.join(self.cgroup_path, 'cgroup.procs') if self.cgroup_path else None
+
+        def apply_limits():
+            # 在fork之后、exec之前执行，只做系统调用，不获取锁也不写日志
+            if cgroup_procs:
+                fd = os.open(cgroup_procs, os.O_WRONLY)
+                try:
+                    os.write(fd, b'0')
+                finally:
+                    os.close(fd)
+            if memory_bytes:
+                resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+            if cpu_seconds:
+                # 软限制到达时收到SIGXCPU，硬限制再多留1秒后SIGKILL
+                resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+            if max_user_processes:
+                resource.setrlimit(resource.RLIMIT_NPROC, (max_user_processes, max_user_processes))
+
+        return apply_limits
+
+    def sample(self, pid):
+        """运行期间采样进程的资源用量（cgroup统计可用时不需要）"""
+        if self.cgroup_path or not IS_LINUX:
+            return
+        usage = read_process_usage(pid)
+        if usage:
+            self.peak_rss_mb = max(self.peak_rss_mb, usage[0])
+            self.cpu_time = max(self.cpu_time, usage[1])
+
+    def finish(self):
+        """
+        进程结束后调用，返回资源用量并清理cgroup
+
+        Returns:
+            dict: peak_rss_mb、cpu_seconds以及统计来源accounting(cgroup/procfs/none)
+        """
+        accounting = 'procfs' if IS_LINUX else 'none'
+        if self.cgroup_path:
+            accounting = 'cgroup'
+            try:
+                with open(os.path.join(self.cgroup_path, 'memory.peak')) as f:
+                    self.peak_rss_mb = int(f.read().strip()) / (1024 * 1024)
+            except (OSError, ValueError):
+                pass
+            try:
+                with open(os.path.join(self.cgroup_path, 'cpu.stat')) as f:
+                    for line in f:
+                        if line.startswith('usage_usec'):
+                            self.cpu_time = int(line.split()[1]) / 1e6
+                            break
+            except (OSError, ValueError):
+                pass
+            self._remove_cgroup(self.cgroup_path)
+            self.cgroup_path = None
+
+        return {
+            'peak_rss_mb': round(self.peak_rss_mb, 1),
+            'cpu_seconds': round(self.cpu_time, 3),
+            'memory_limit_mb': self.memory_limit,
+            'accounting': accounting
+        }
+
+    @staticmethod
+    def _remove_cgroup(path):
+        try:
+            # 被kill的进程可能还没完全退出，cgroup非空时rmdir会失败
+            os.rmdir(path)
+        except OSError as e:
+            logger.debug(f"删除cgroup失败: {path}, {e}")
@@ -1,5 +1,6 @@
 # sandbox.py - 集成的R代码安全沙箱
 import os
+import asyncio
 import tempfile
 import subprocess
 import signal
@@ -12,6 +13,9 @@ import datetime
 import re
 from flask import current_app
 import r_setup
+from utils.async_process import run_process, run_sync, run_on_sandbox_loop, get_rpy2_executor
+from utils.resource_limits import ResourceLimiter
+from utils.metrics import registry, PhaseTimer
 
 
 def find_conda_r_path():
@@ -71,20 +75,6 @@ logger = logging.getLogger('r_sandbox')
 # 检测操作系统类型
 is_windows = platform.system() == 'Windows'
 
-# 对Windows系统的特殊处理
-if not is_windows:
-    import resource
-else:
-    # Windows 替代实现
-    class DummyResource:
-        @staticmethod
-        def setrlimit(*args, **kwargs):
-            pass
-
-
-    resource = DummyResource()
-
-
 def decode_unicode_escapes(text):
     """解码所有Unicode转义序列"""
     if not isinstance(text, str):
@@ -145,21 +135,8 @@ class RCodeSandbox:
 
         return clean_text
 
-    def execute(self, student_code, test_code):
-        """
-        在安全沙箱中执行R代码
-
-        Args:
-            student_code: 学生提交的R代码
-            test_code: 评分用的测试代码
-
-        Returns:
-            dict: 执行结果，包含status、score等信息
-        """
-        logger.info("\n" + "=" * 80)
-        logger.info(f"[执行时间]: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        logger.info(f"[R代码评分] - 学生代码长度: {len(student_code)}, 测试代码长度: {len(test_code)}")
-
+    def _prepare_code(self, student_code, test_code):
+        """清理代码并添加所需包的加载代码"""
         student_code = self._clean_code(student_code)
         test_code = self._clean_code(test_code)
 
@@ -175,15 +152,67 @@ class RCodeSandbox:
             student_code = f"{packages_code}\n\n{student_code}"
             logger.info(f"已添加包加载代码: {len(self.required_packages)}个包")
 
-        # 首先尝试使用rpy2直接执行
+        return student_code, test_code
+
+    def execute(self, student_code, test_code):
+        """
+        在安全沙箱中执行R代码（同步接口，阻塞当前线程直到执行完成）
+
+        Args:
+            student_code: 学生提交的R代码
+            test_code: 评分用的测试代码
+
+        Returns:
+            dict: 执行结果，包含status、score等信息
+        """
+        logger.info("\n" + "=" * 80)
+        logger.info(f"[执行时间]: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        logger.info(f"[R代码评分] - 学生代码长度: {len(student_code)}, 测试代码长度: {len(test_code)}")
+
+        student_code, test_code = self._prepare_code(student_code, test_code)
+
+        # 首先尝试使用rpy2直接执行（在rpy2专用线程中，内嵌R不是线程安全的）
         try:
             logger.info("尝试使用rpy2方式执行...")
-            return self._execute_with_rpy2(student_code, test_code)
+            return get_rpy2_executor().submit(self._execute_with_rpy2, student_code, test_code).result()
         except Exception as e:
             logger.warning(f"rpy2执行失败，将使用外部进程执行: {str(e)}")
             # 如果rpy2执行失败，尝试使用外部R进程
             return self._execute_with_process(student_code, test_code)
 
+    async def execute_async(self, student_code, test_code, on_start=None):
+        """
+        在安全沙箱中异步执行R代码
+
+        rpy2调用在专用线程中串行执行；外部R进程在共享事件循环中以asyncio子进程运行，
+        超时由事件循环处理，并发数受R_SANDBOX_MAX_CONCURRENCY限制。
+
+        Args:
+            student_code: 学生提交的R代码
+            test_code: 评分用的测试代码
+            on_start: 无参函数，排队结束、R真正开始执行时调用（rpy2失败改用外部进程时会再调用一次）
+
+        Returns:
+            dict: 执行结果，包含status、score等信息
+        """
+        logger.info(f"[R代码异步执行] - 学生代码长度: {len(student_code)}, 测试代码长度: {len(test_code)}")
+
+        student_code, test_code = self._prepare_code(student_code, test_code)
+
+        # 首先尝试使用rpy2直接执行
+        def run_rpy2():
+            if on_start:
+                on_start()
+            return self._execute_with_rpy2(student_code, test_code)
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(get_rpy2_executor(), run_rpy2)
+        except Exception as e:
+            logger.warning(f"rpy2执行失败，将使用外部进程执行: {str(e)}")
+            return await run_on_sandbox_loop(self._execute_with_process_async(student_code, test_code,
+                                                                              on_start=on_start))
+
     def _execute_with_rpy2(self, student_code, test_code):
         """使用rpy2在Python进程内执行R代码"""
         logger.info("使用rpy2执行R代码...")
@@ -204,11 +233,72 @@ class RCodeSandbox:
 
     def _execute_with_process(self, student_code, test_code):
         """使用单独的R进程执行代码"""
+        return run_sync(self._execute_with_process_async(student_code, test_code))
+
+    async def _execute_with_process_async(self, student_code, test_code, on_start=None):
+        """使用单独的R进程异步执行代码，on_start在取得并发名额、启动进程时调用"""
         logger.info("使用R外部进程执行代码...")
 
         student_code = self._clean_code(student_code)
         test_code = self._clean_code(test_code)
 
+        timer = PhaseTimer()
+        student_path, test_path = self._write_code_files(student_code, test_code)
+
+        try:
+            cmd, env = self._build_command(student_path, test_path)
+            timer.mark('prepare')
+
+            # 执行命令，额外5秒余量
+            limiter = ResourceLimiter(self.memory_limit, self.cpu_limit, self.timeout)
+            returncode, stdout, stderr, timed_out = await run_process(cmd, self.timeout + 5, env=env,
+                                                                      limiter=limiter, on_start=on_start)
+            resource_usage = limiter.finish()
+            timer.mark('process')
+            stderr = timer.add_r_phases(stderr)
+
+            if timed_out:
+                registry.observe_execution('sandbox', 'timeout', timer.finish(), resource_usage)
+                error_msg = f'代码执行超时（超过{self.timeout}秒）'
+                logger.error(error_msg)
+                return {
+                    'status': 'error',
+                    'score': 0,
+                    'max_score': 100,
+                    'message': error_msg,
+                    'output': stdout,
+                    'resource_usage': resource_usage
+                }
+
+            result = self._parse_process_output(returncode, stdout, stderr)
+            timer.mark('parse')
+            result['resource_usage'] = resource_usage
+            result['timings'] = timer.finish()
+            registry.observe_execution('sandbox', result.get('status', 'error'), result['timings'], resource_usage)
+            return result
+
+        except Exception as e:
+            error_trace = traceback.format_exc()
+            error_msg = f'执行异常: {str(e)}'
+            logger.error(f"{error_msg}\n{error_trace}")
+            return {
+                'status': 'error',
+                'score': 0,
+                'max_score': 100,
+                'message': error_msg,
+                'output': error_trace
+            }
+        finally:
+            # 清理临时文件
+            logger.info("清理临时文件...")
+            try:
+                os.unlink(student_path)
+                os.unlink(test_path)
+            except Exception as e:
+                logger.error(f"清理临时文件失败: {str(e)}")
+
+    def _write_code_files(self, student_code, test_code):
+        """将学生代码和测试代码写入临时文件，返回两个文件路径"""
         # 创建临时文件存储代码，确保使用utf-8编码
         with tempfile.NamedTemporaryFile(suffix='.R', mode='w', delete=False, encoding='utf-8') as student_file, \
                 tempfile.NamedTemporaryFile(suffix='.R', mode='w', delete=False, encoding='utf-8') as test_file:
@@ -230,184 +320,150 @@ class RCodeSandbox:
             logger.info(f"学生代码写入到: {student_path}")
             logger.info(f"测试代码写入到: {test_path}")
 
-        try:
-            # 准备执行环境
-            r_script_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'r_scripts')
-            r_script_path = os.path.join(r_script_dir, 'test_runner.R')
-
-            # 确保路径使用正斜杠
-            r_script_path = r_script_path.replace('\\', '/')
-            student_path = student_path.replace('\\', '/')
-            test_path = test_path.replace('\\', '/')
-
-            # 检查脚本是否存在
-            if not os.path.exists(r_script_path):
-                # 尝试搜索项目目录
-                import glob
-                project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                r_scripts = glob.glob(os.path.join(project_dir, "**", "test_runner.R"), recursive=True)
-
-                if r_scripts:
-                    r_script_path = r_scripts[0].replace('\\', '/')
-                    logger.info(f"使用找到的脚本: {r_script_path}")
-                else:
-                    raise FileNotFoundError(f"R脚本不存在，且无法找到: {r_script_path}")
-
-            logger.info(f"R脚本路径: {r_script_path}")
-
-            # 获取Conda环境中的Rscript路径
-            conda_r_script = find_conda_r_path()
-            logger.info(f"使用R路径: {conda_r_script}")
-
-            # 构建命令
-            cmd = [
-                conda_r_script,
-                r_script_path,
-                student_path,
-                test_path,
-                str(self.timeout)
-            ]
-
-            logger.info(f"执行命令: {' '.join(cmd)}")
-
-            # 执行命令时设置环境变量
-            env = os.environ.copy()
-            env['LC_ALL'] = 'C'  # 使用C区域设置，更加稳定
-            env['R_HOME'] = os.environ.get('R_HOME', r'C:\Users\86131\anaconda3\envs\r_exam_env\Lib\R').replace('\\',
-                                                                                                                '/')
-
-            # 执行命令
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                errors='replace',  # 解码错误时替换
-                env=env
-            )
-
-            # 设置超时
-            timer = threading.Timer(self.timeout + 5, process.kill)  # 额外5秒余量
-            timer.start()
-
-            # 获取输出
-            stdout, stderr = process.communicate()
-
-            # 取消超时计时器
-            timer.cancel()
-
-            # 记录输出
-            logger.info(f"进程返回代码: {process.returncode}")
-            if stdout:
-                logger.info(f"标准输出(前200字符): {stdout[:200]}...")
+        return student_path, test_path
+
+    def _build_command(self, student_path, test_path):
+        """构建执行R测试脚本的命令和环境变量"""
+        # 准备执行环境
+        r_script_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'r_scripts')
+        r_script_path = os.path.join(r_script_dir, 'test_runner.R')
+
+        # 确保路径使用正斜杠
+        r_script_path = r_script_path.replace('\\', '/')
+        student_path = student_path.replace('\\', '/')
+        test_path = test_path.replace('\\', '/')
+
+        # 检查脚本是否存在
+        if not os.path.exists(r_script_path):
+            # 尝试搜索项目目录
+            import glob
+            project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            r_scripts = glob.glob(os.path.join(project_dir, "**", "test_runner.R"), recursive=True)
+
+            if r_scripts:
+                r_script_path = r_scripts[0].replace('\\', '/')
+                logger.info(f"使用找到的脚本: {r_script_path}")
             else:
-                logger.info("标准输出为空")
-
-            if stderr:
-                logger.info(f"标准错误(前200字符): {stderr[:200]}...")
-            else:
-                logger.info("标准错误为空")
+                raise FileNotFoundError(f"R脚本不存在，且无法找到: {r_script_path}")
+
+        logger.info(f"R脚本路径: {r_script_path}")
+
+        # 获取Conda环境中的Rscript路径
+        conda_r_script = find_conda_r_path()
+        logger.info(f"使用R路径: {conda_r_script}")
+
+        # 构建命令
+        cmd = [
+            conda_r_script,
+            r_script_path,
+            student_path,
+            test_path,
+            str(self.timeout)
+        ]
+
+        logger.info(f"执行命令: {' '.join(cmd)}")
+
+        # 执行命令时设置环境变量
+        env = os.environ.copy()
+        env['LC_ALL'] = 'C'  # 使用C区域设置，更加稳定
+        env['R_HOME'] = os.environ.get('R_HOME', r'C:\Users\86131\anaconda3\envs\r_exam_env\Lib\R').replace('\\',
+                                                                                                            '/')
+        return cmd, env
+
+    def _parse_process_output(self, returncode, stdout, stderr):
+        """解析R进程的输出，返回评分结果"""
+        # 记录输出
+        logger.info(f"进程返回代码: {returncode}")
+        if stdout:
+            logger.info(f"标准输出(前200字符): {stdout[:200]}...")
+        else:
+            logger.info("标准输出为空")
+
+        if stderr:
+            logger.info(f"标准错误(前200字符): {stderr[:200]}...")
+        else:
+            logger.info("标准错误为空")
+
+        # 解析输出
+        if returncode != 0:
+            # 执行出错
+            error_msg = f'R脚本执行错误(返回代码:{returncode}): {stderr}'
+            logger.error(error_msg)
+            return {
+                'status': 'error',
+                'score': 0,
+                'max_score': 100,
+                'message': error_msg,
+                'output': stdout
+            }
 
-            # 解析输出
-            if process.returncode != 0:
-                # 执行出错
-                error_msg = f'R脚本执行错误(返回代码:{process.returncode}): {stderr}'
-                logger.error(error_msg)
+        try:
+            # 尝试直接解析JSON结果
+            logger.info("尝试解析JSON结果...")
+            if not stdout.strip():
+                logger.warning("标准输出为空")
                 return {
                     'status': 'error',
                     'score': 0,
                     'max_score': 100,
-                    'message': error_msg,
-                    'output': stdout
+                    'message': '外部进程未返回任何结果',
+                    'output': stderr if stderr else "无输出"
                 }
 
-            try:
-                # 尝试直接解析JSON结果
-                logger.info("尝试解析JSON结果...")
-                if not stdout.strip():
-                    logger.warning("标准输出为空")
-                    return {
-                        'status': 'error',
-                        'score': 0,
-                        'max_score': 100,
-                        'message': '外部进程未返回任何结果',
-                        'output': stderr if stderr else "无输出"
-                    }
-
-                # 尝试找到JSON开始的位置
-                json_start = stdout.find('{')
-                if json_start == -1:
-                    logger.warning("输出中没有找到JSON开始标记'{'")
-                    return {
-                        'status': 'error',
-                        'score': 0,
-                        'max_score': 100,
-                        'message': '无法在输出中找到JSON数据',
-                        'output': stdout + "\n" + stderr
-                    }
-
-                # 提取JSON部分
-                json_text = stdout[json_start:].strip()
-                result = json.loads(json_text)
-                logger.info(f"JSON解析成功: {result.get('status', '未知状态')}")
-
-                # 修复中文消息编码
-                try:
-                    # 处理message字段中的Unicode转义序列
-                    if 'message' in result and isinstance(result['message'], str):
-                        result['message'] = decode_unicode_escapes(result['message'])
-
-                    # 同样处理output字段
-                    if 'output' in result and isinstance(result['output'], str):
-                        result['output'] = decode_unicode_escapes(result['output'])
-
-                    logger.info("已修复中文编码显示")
-                except Exception as e:
-                    logger.error(f"修复中文消息失败: {str(e)}")
-
-                # 确保所有必要的字段都存在
-                required_fields = ['status', 'score', 'max_score', 'message']
-                for field in required_fields:
-                    if field not in result:
-                        result[field] = 0 if field in ['score', 'max_score'] else (
-                            'error' if field == 'status' else '字段缺失')
-
-                # 添加输出
-                if 'output' not in result or not result['output']:
-                    result['output'] = stdout
-
-                return result
-
-            except json.JSONDecodeError as e:
-                # JSON解析失败
-                logger.error(f"JSON解析失败: {str(e)}")
+            # 尝试找到JSON开始的位置
+            json_start = stdout.find('{')
+            if json_start == -1:
+                logger.warning("输出中没有找到JSON开始标记'{'")
                 return {
                     'status': 'error',
                     'score': 0,
                     'max_score': 100,
-                    'message': f'无法解析评分结果: {str(e)}',
-                    'output': stdout
+                    'message': '无法在输出中找到JSON数据',
+                    'output': stdout + "\n" + stderr
                 }
 
-        except Exception as e:
-            error_trace = traceback.format_exc()
-            error_msg = f'执行异常: {str(e)}'
-            logger.error(f"{error_msg}\n{error_trace}")
+            # 提取JSON部分
+            json_text = stdout[json_start:].strip()
+            result = json.loads(json_text)
+            logger.info(f"JSON解析成功: {result.get('status', '未知状态')}")
+
+            # 修复中文消息编码
+            try:
+                # 处理message字段中的Unicode转义序列
+                if 'message' in result and isinstance(result['message'], str):
+                    result['message'] = decode_unicode_escapes(result['message'])
+
+                # 同样处理output字段
+                if 'output' in result and isinstance(result['output'], str):
+                    result['output'] = decode_unicode_escapes(result['output'])
+
+                logger.info("已修复中文编码显示")
+            except Exception as e:
+                logger.error(f"修复中文消息失败: {str(e)}")
+
+            # 确保所有必要的字段都存在
+            required_fields = ['status', 'score', 'max_score', 'message']
+            for field in required_fields:
+                if field not in result:
+                    result[field] = 0 if field in ['score', 'max_score'] else (
+                        'error' if field == 'status' else '字段缺失')
+
+            # 添加输出
+            if 'output' not in result or not result['output']:
+                result['output'] = stdout
+
+            return result
+
+        except json.JSONDecodeError as e:
+            # JSON解析失败
+            logger.error(f"JSON解析失败: {str(e)}")
             return {
                 'status': 'error',
                 'score': 0,
                 'max_score': 100,
-                'message': error_msg,
-                'output': error_trace
+                'message': f'无法解析评分结果: {str(e)}',
+                'output': stdout
             }
-        finally:
-            # 清理临时文件
-            logger.info("清理临时文件...")
-            try:
-                os.unlink(student_path)
-                os.unlink(test_path)
-            except Exception as e:
-                logger.error(f"清理临时文件失败: {str(e)}")
 
     def _wrap_dplyr_code(self, code):
         """为dplyr代码添加特殊包装，处理常见的dplyr问题"""
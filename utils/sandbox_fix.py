@@ -8,6 +8,9 @@ import traceback
 import datetime
 import re
 from flask import current_app
+from utils.async_process import run_process, run_sync, run_on_sandbox_loop
+from utils.resource_limits import ResourceLimiter
+from utils.metrics import registry, PhaseTimer
 
 # 检测操作系统类型
 import platform
@@ -36,8 +39,16 @@ def check_r_scripts():
         return False
 
 
-# 初始化时检查R脚本
-R_SCRIPTS_AVAILABLE = check_r_scripts()
+# 第一次执行时检查R脚本（导入时不搜索项目目录）
+_r_scripts_available = None
+
+
+def r_scripts_available():
+    """R脚本是否可用，只检查一次"""
+    global _r_scripts_available
+    if _r_scripts_available is None:
+        _r_scripts_available = check_r_scripts()
+    return _r_scripts_available
 
 
 def decode_unicode_escapes(text):
@@ -84,9 +95,29 @@ class RCodeSandbox:
         if self.required_packages:
             print(f"需要的R包: {', '.join(self.required_packages)}")
 
+    def _prepare_code(self, student_code):
+        """添加所需包的加载代码"""
+        if self.required_packages:
+            # 添加包加载代码到学生代码开头
+            packages_code = "\n".join(
+                [f"if (!require('{pkg}')) install.packages('{pkg}', repos='https://cloud.r-project.org')"
+                 for pkg in self.required_packages])
+            student_code = f"{packages_code}\n\n{student_code}"
+            print(f"已添加包加载代码: {len(self.required_packages)}个包")
+        return student_code
+
+    def _scripts_unavailable_result(self):
+        return {
+            'status': 'error',
+            'score': 0,
+            'max_score': 100,
+            'message': 'R测试脚本不可用，请联系管理员',
+            'output': '系统错误: R脚本未找到'
+        }
+
     def execute(self, student_code, test_code):
         """
-        在安全沙箱中执行R代码
+        在安全沙箱中执行R代码（同步接口，阻塞当前线程直到执行完成）
         Args:
             student_code: 学生提交的R代码
             test_code: 评分用的测试代码
@@ -98,31 +129,39 @@ class RCodeSandbox:
         print(f"[R代码评分] - 学生代码长度: {len(student_code)}, 测试代码长度: {len(test_code)}")
 
         # 检查R脚本是否可用
-        if not R_SCRIPTS_AVAILABLE:
-            return {
-                'status': 'error',
-                'score': 0,
-                'max_score': 100,
-                'message': 'R测试脚本不可用，请联系管理员',
-                'output': '系统错误: R脚本未找到'
-            }
-
-        # 处理所需包
-        if self.required_packages:
-            # 添加包加载代码到学生代码开头
-            packages_code = "\n".join(
-                [f"if (!require('{pkg}')) install.packages('{pkg}', repos='https://cloud.r-project.org')"
-                 for pkg in self.required_packages])
-            student_code = f"{packages_code}\n\n{student_code}"
-            print(f"已添加包加载代码: {len(self.required_packages)}个包")
+        if not r_scripts_available():
+            return self._scripts_unavailable_result()
 
         # 直接使用外部进程执行
-        return self._execute_with_process(student_code, test_code)
+        return self._execute_with_process(self._prepare_code(student_code), test_code)
+
+    async def execute_async(self, student_code, test_code):
+        """
+        在安全沙箱中异步执行R代码，R进程在共享事件循环中运行，并发数受R_SANDBOX_MAX_CONCURRENCY限制
+        Args:
+            student_code: 学生提交的R代码
+            test_code: 评分用的测试代码
+        Returns:
+            dict: 执行结果，包含status、score等信息
+        """
+        print(f"[R代码异步执行] - 学生代码长度: {len(student_code)}, 测试代码长度: {len(test_code)}")
+
+        if not r_scripts_available():
+            return self._scripts_unavailable_result()
+
+        return await run_on_sandbox_loop(
+            self._execute_with_process_async(self._prepare_code(student_code), test_code))
 
     def _execute_with_process(self, student_code, test_code):
         """使用单独的R进程执行代码"""
+        return run_sync(self._execute_with_process_async(student_code, test_code))
+
+    async def _execute_with_process_async(self, student_code, test_code):
+        """使用单独的R进程异步执行代码"""
         print("使用R外部进程执行代码...")
 
+        timer = PhaseTimer()
+
         # 创建临时文件存储代码，确保使用utf-8编码
         with tempfile.NamedTemporaryFile(suffix='.R', mode='w', delete=False, encoding='utf-8') as student_file, \
                 tempfile.NamedTemporaryFile(suffix='.R', mode='w', delete=False, encoding='utf-8') as test_file:
@@ -133,7 +172,209 @@ class RCodeSandbox:
             # 特殊处理dplyr相关代码
             if "dplyr" in student_code and "%>%" in student_code:
                 # 为dplyr代码添加特殊包装
-                wrapped_code = f"""
+                student_file.write(self._wrap_dplyr_code(student_code))
+            else:
+                # 写入普通代码
+                student_file.write(student_code)
+
+            # 写入测试代码
+            test_file.write(test_code)
+
+            print(f"学生代码写入到: {student_path}")
+            print(f"测试代码写入到: {test_path}")
+
+        try:
+            cmd, env = self._build_command(student_path, test_path)
+            timer.mark('prepare')
+
+            # 执行命令，额外5秒余量
+            limiter = ResourceLimiter(self.memory_limit, self.cpu_limit, self.timeout)
+            returncode, stdout, stderr, timed_out = await run_process(cmd, self.timeout + 5, env=env,
+                                                                      limiter=limiter)
+            resource_usage = limiter.finish()
+            timer.mark('process')
+            stderr = timer.add_r_phases(stderr)
+
+            if timed_out:
+                registry.observe_execution('sandbox', 'timeout', timer.finish(), resource_usage)
+                error_msg = f'代码执行超时（超过{self.timeout}秒）'
+                print(error_msg)
+                return {
+                    'status': 'error',
+                    'score': 0,
+                    'max_score': 100,
+                    'message': error_msg,
+                    'output': stdout,
+                    'resource_usage': resource_usage
+                }
+
+            result = self._parse_process_output(returncode, stdout, stderr)
+            timer.mark('parse')
+            result['resource_usage'] = resource_usage
+            result['timings'] = timer.finish()
+            registry.observe_execution('sandbox', result.get('status', 'error'), result['timings'], resource_usage)
+            return result
+
+        except Exception as e:
+            error_trace = traceback.format_exc()
+            error_msg = f'执行异常: {str(e)}'
+            print(f"{error_msg}\n{error_trace}")
+            return {
+                'status': 'error',
+                'score': 0,
+                'max_score': 100,
+                'message': error_msg,
+                'output': error_trace
+            }
+        finally:
+            # 清理临时文件
+            print("清理临时文件...")
+            try:
+                os.unlink(student_path)
+                os.unlink(test_path)
+            except Exception as e:
+                print(f"清理临时文件失败: {str(e)}")
+
+    def _build_command(self, student_path, test_path):
+        """构建执行R测试脚本的命令和环境变量"""
+        # 准备执行环境
+        r_script_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'r_scripts')
+        r_script_path = os.path.join(r_script_dir, 'simple_test_runner.R')  # 使用简化版脚本
+
+        # 确保路径使用正斜杠
+        r_script_path = r_script_path.replace('\\', '/')
+        student_path = student_path.replace('\\', '/')
+        test_path = test_path.replace('\\', '/')
+
+        # 检查脚本是否存在
+        if not os.path.exists(r_script_path):
+            # 尝试搜索项目目录
+            import glob
+            project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            r_scripts = glob.glob(os.path.join(project_dir, "**", "simple_test_runner.R"), recursive=True)
+
+            if r_scripts:
+                r_script_path = r_scripts[0].replace('\\', '/')
+                print(f"使用找到的脚本: {r_script_path}")
+            else:
+                raise FileNotFoundError(f"R脚本不存在，且无法找到: {r_script_path}")
+
+        print(f"R脚本路径: {r_script_path}")
+
+        # 构建命令
+        cmd = [
+            'Rscript',
+            r_script_path,
+            student_path,
+            test_path,
+            str(self.timeout)
+        ]
+
+        print(f"执行命令: {' '.join(cmd)}")
+
+        # 执行命令时设置环境变量
+        env = os.environ.copy()
+        env['LC_ALL'] = 'C'  # 使用C区域设置，更加稳定
+        return cmd, env
+
+    def _parse_process_output(self, returncode, stdout, stderr):
+        """解析R进程的输出，返回评分结果"""
+        # 记录输出
+        print(f"进程返回代码: {returncode}")
+        if stdout:
+            print(f"标准输出(全部): {stdout}")
+        else:
+            print("标准输出为空")
+
+        if stderr:
+            print(f"标准错误(全部): {stderr}")
+        else:
+            print("标准错误为空")
+
+        # 解析输出
+        if returncode != 0:
+            # 执行出错
+            error_msg = f'R脚本执行错误(返回代码:{returncode}): {stderr}'
+            print(error_msg)
+            return {
+                'status': 'error',
+                'score': 0,
+                'max_score': 100,
+                'message': error_msg,
+                'output': stdout
+            }
+
+        try:
+            # 尝试直接解析JSON结果
+            print("尝试解析JSON结果...")
+            if not stdout.strip():
+                print("警告: 标准输出为空")
+                return {
+                    'status': 'error',
+                    'score': 0,
+                    'max_score': 100,
+                    'message': '外部进程未返回任何结果',
+                    'output': stderr if stderr else "无输出"
+                }
+
+            # 尝试找到JSON开始的位置
+            json_start = stdout.find('{')
+            if json_start == -1:
+                print("警告: 输出中没有找到JSON开始标记'{'")
+                return {
+                    'status': 'error',
+                    'score': 0,
+                    'max_score': 100,
+                    'message': '无法在输出中找到JSON数据',
+                    'output': stdout + "\n" + stderr
+                }
+
+            # 提取JSON部分
+            json_text = stdout[json_start:].strip()
+            result = json.loads(json_text)
+            print(f"JSON解析成功: {result.get('status', '未知状态')}")
+
+            # 修复中文消息编码
+            try:
+                # 处理message字段中的Unicode转义序列
+                if 'message' in result and isinstance(result['message'], str):
+                    result['message'] = decode_unicode_escapes(result['message'])
+
+                # 同样处理output字段
+                if 'output' in result and isinstance(result['output'], str):
+                    result['output'] = decode_unicode_escapes(result['output'])
+
+                print("已修复中文编码显示")
+            except Exception as e:
+                print(f"修复中文消息失败: {str(e)}")
+
+            # 确保所有必要的字段都存在
+            required_fields = ['status', 'score', 'max_score', 'message']
+            for field in required_fields:
+                if field not in result:
+                    result[field] = 0 if field in ['score', 'max_score'] else (
+                        'error' if field == 'status' else '字段缺失')
+
+            # 添加输出
+            if 'output' not in result or not result['output']:
+                result['output'] = stdout
+
+            return result
+
+        except json.JSONDecodeError as e:
+            # JSON解析失败
+            print(f"JSON解析失败: {str(e)}")
+            return {
+                'status': 'error',
+                'score': 0,
+                'max_score': 100,
+                'message': f'无法解析评分结果: {str(e)}',
+                'output': stdout
+            }
+
+    def _wrap_dplyr_code(self, code):
+        """为dplyr代码添加特殊包装，处理常见的dplyr问题"""
+        return f"""
 # 确保加载dplyr并正确导入管道操作符
 suppressPackageStartupMessages({{
   if (!require("dplyr", quietly = TRUE)) {{
@@ -150,7 +391,7 @@ print(paste("dplyr版本:", packageVersion("dplyr")))
 
 # 开始执行学生代码
 tryCatch({{
-{student_code}
+{code}
 }}, error = function(e) {{
   print(paste("执行错误:", e$message))
 
@@ -189,186 +430,3 @@ tryCatch({{
   }}
 }})
 """
-                student_file.write(wrapped_code)
-            else:
-                # 写入普通代码
-                student_file.write(student_code)
-
-            # 写入测试代码
-            test_file.write(test_code)
-
-            print(f"学生代码写入到: {student_path}")
-            print(f"测试代码写入到: {test_path}")
-
-        try:
-            # 准备执行环境
-            r_script_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'r_scripts')
-            r_script_path = os.path.join(r_script_dir, 'simple_test_runner.R')  # 使用简化版脚本
-
-            # 确保路径使用正斜杠
-            r_script_path = r_script_path.replace('\\', '/')
-            student_path = student_path.replace('\\', '/')
-            test_path = test_path.replace('\\', '/')
-
-            # 检查脚本是否存在
-            if not os.path.exists(r_script_path):
-                # 尝试搜索项目目录
-                import glob
-                project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                r_scripts = glob.glob(os.path.join(project_dir, "**", "simple_test_runner.R"), recursive=True)
-
-                if r_scripts:
-                    r_script_path = r_scripts[0].replace('\\', '/')
-                    print(f"使用找到的脚本: {r_script_path}")
-                else:
-                    raise FileNotFoundError(f"R脚本不存在，且无法找到: {r_script_path}")
-
-            print(f"R脚本路径: {r_script_path}")
-
-            # 构建命令
-            cmd = [
-                'Rscript',
-                r_script_path,
-                student_path,
-                test_path,
-                str(self.timeout)
-            ]
-
-            print(f"执行命令: {' '.join(cmd)}")
-
-            # 执行命令时设置环境变量
-            env = os.environ.copy()
-            env['LC_ALL'] = 'C'  # 使用C区域设置，更加稳定
-
-            # 执行命令
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                errors='replace',  # 解码错误时替换
-                env=env
-            )
-
-            # 设置超时
-            timer = threading.Timer(self.timeout + 5, process.kill)  # 额外5秒余量
-            timer.start()
-
-            # 获取输出
-            stdout, stderr = process.communicate()
-
-            # 记录输出
-            print(f"进程返回代码: {process.returncode}")
-            if stdout:
-                print(f"标准输出(全部): {stdout}")
-            else:
-                print("标准输出为空")
-
-            if stderr:
-                print(f"标准错误(全部): {stderr}")
-            else:
-                print("标准错误为空")
-
-            # 取消超时计时器
-            timer.cancel()
-
-            # 解析输出
-            if process.returncode != 0:
-                # 执行出错
-                error_msg = f'R脚本执行错误(返回代码:{process.returncode}): {stderr}'
-                print(error_msg)
-                return {
-                    'status': 'error',
-                    'score': 0,
-                    'max_score': 100,
-                    'message': error_msg,
-                    'output': stdout
-                }
-
-            try:
-                # 尝试直接解析JSON结果
-                print("尝试解析JSON结果...")
-                if not stdout.strip():
-                    print("警告: 标准输出为空")
-                    return {
-                        'status': 'error',
-                        'score': 0,
-                        'max_score': 100,
-                        'message': '外部进程未返回任何结果',
-                        'output': stderr if stderr else "无输出"
-                    }
-
-                # 尝试找到JSON开始的位置
-                json_start = stdout.find('{')
-                if json_start == -1:
-                    print("警告: 输出中没有找到JSON开始标记'{'")
-                    return {
-                        'status': 'error',
-                        'score': 0,
-                        'max_score': 100,
-                        'message': '无法在输出中找到JSON数据',
-                        'output': stdout + "\n" + stderr
-                    }
-
-                # 提取JSON部分
-                json_text = stdout[json_start:].strip()
-                result = json.loads(json_text)
-                print(f"JSON解析成功: {result.get('status', '未知状态')}")
-
-                # 修复中文消息编码
-                try:
-                    # 处理message字段中的Unicode转义序列
-                    if 'message' in result and isinstance(result['message'], str):
-                        result['message'] = decode_unicode_escapes(result['message'])
-
-                    # 同样处理output字段
-                    if 'output' in result and isinstance(result['output'], str):
-                        result['output'] = decode_unicode_escapes(result['output'])
-
-                    print("已修复中文编码显示")
-                except Exception as e:
-                    print(f"修复中文消息失败: {str(e)}")
-
-                # 确保所有必要的字段都存在
-                required_fields = ['status', 'score', 'max_score', 'message']
-                for field in required_fields:
-                    if field not in result:
-                        result[field] = 0 if field in ['score', 'max_score'] else (
-                            'error' if field == 'status' else '字段缺失')
-
-                # 添加输出
-                if 'output' not in result or not result['output']:
-                    result['output'] = stdout
-
-                return result
-
-            except json.JSONDecodeError as e:
-                # JSON解析失败
-                print(f"JSON解析失败: {str(e)}")
-                return {
-                    'status': 'error',
-                    'score': 0,
-                    'max_score': 100,
-                    'message': f'无法解析评分结果: {str(e)}',
-                    'output': stdout
-                }
-
-        except Exception as e:
-            error_trace = traceback.format_exc()
-            error_msg = f'执行异常: {str(e)}'
-            print(f"{error_msg}\n{error_trace}")
-            return {
-                'status': 'error',
-                'score': 0,
-                'max_score': 100,
-                'message': error_msg,
-                'output': error_trace
-            }
-        finally:
-            # 清理临时文件
-            print("清理临时文件...")
-            try:
-                os.unlink(student_path)
-                os.unlink(test_path)
-            except Exception as e:
-                print(f"清理临时文件失败: {str(e)}")
\ No newline at end of file